@@ -0,0 +1,10 @@
+--
+-- Replace the index on `access_log`.`link_id` of an existing yaturl
+-- database by one on (`link_id`, `access_time`), so the per link
+-- redirect statistics are read from the index only.
+--
+-- The new index is added first as the foreign key on `link_id` needs one.
+--
+
+ALTER TABLE `access_log` ADD KEY `link_id_access_time` (`link_id`, `access_time`);
+ALTER TABLE `access_log` DROP KEY `link_id`;
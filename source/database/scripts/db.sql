@@ -13,7 +13,7 @@ CREATE TABLE IF NOT EXISTS `access_log` (
   `link_id` bigint(20) unsigned NOT NULL,
   `access_time` timestamp NOT NULL default CURRENT_TIMESTAMP,
   PRIMARY KEY  (`access_log_id`),
-  KEY `link_id` (`link_id`),
+  KEY `link_id_access_time` (`link_id`, `access_time`),
   KEY `access_time` (`access_time`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 AUTO_INCREMENT=1 ;
 
@@ -32,7 +32,8 @@ CREATE TABLE IF NOT EXISTS `link` (
   `del_time` timestamp NULL DEFAULT NULL,
   PRIMARY KEY  (`link_id`),
   UNIQUE KEY `link_hash` (`link_hash`),
-  UNIQUE KEY `link_shorthash` (`link_shorthash`)
+  UNIQUE KEY `link_shorthash` (`link_shorthash`),
+  KEY `entry_date` (`entry_date`)
 ) ENGINE=InnoDB  DEFAULT CHARSET=utf8 AUTO_INCREMENT=1;
 
 
@@ -45,8 +46,65 @@ CREATE TABLE IF NOT EXISTS `block` (
   UNIQUE KEY `link_id` (`link_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 AUTO_INCREMENT=1 ;
 
+--
+-- Table structure for table `link_counter`
+--
+-- Number of redirects and time of first and last redirect per link, kept
+-- up to date when redirects are logged to `access_log`
+--
+
+CREATE TABLE IF NOT EXISTS `link_counter` (
+  `link_id` bigint(20) unsigned NOT NULL,
+  `clicks` bigint(20) unsigned NOT NULL default '0',
+  `first_access` timestamp NULL default NULL,
+  `last_access` timestamp NULL default NULL,
+  PRIMARY KEY  (`link_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for tables `stats_hourly` and `stats_daily`
+--
+-- Number of redirects and added links per hour and day, filled
+-- incrementally from `access_log` and `link` by the statistics rollup job
+--
+
+CREATE TABLE IF NOT EXISTS `stats_hourly` (
+  `stats_hour` datetime NOT NULL,
+  `redirects` int(10) unsigned NOT NULL default '0',
+  `links` int(10) unsigned NOT NULL default '0',
+  PRIMARY KEY  (`stats_hour`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS `stats_daily` (
+  `stats_day` date NOT NULL,
+  `redirects` int(10) unsigned NOT NULL default '0',
+  `links` int(10) unsigned NOT NULL default '0',
+  PRIMARY KEY  (`stats_day`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for table `stats_watermark`
+--
+-- Highest ID of `access_log` and `link` already added to the rollups,
+-- the highest ID which may be added as its transaction is committed
+-- (`safe_id`) and the highest ID noted at `pending_time` to become the
+-- next `safe_id`
+--
+
+CREATE TABLE IF NOT EXISTS `stats_watermark` (
+  `source` varchar(25) NOT NULL,
+  `last_id` bigint(20) unsigned NOT NULL default '0',
+  `safe_id` bigint(20) unsigned NOT NULL default '0',
+  `pending_id` bigint(20) unsigned NOT NULL default '0',
+  `pending_time` timestamp NULL default NULL,
+  PRIMARY KEY  (`source`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 ALTER TABLE `access_log`
   ADD CONSTRAINT `access_log_ibfk_1` FOREIGN KEY (`link_id`) REFERENCES `link` (`link_id`) ON DELETE CASCADE;
 
 ALTER TABLE `block`
   ADD CONSTRAINT `block_ibfk_1` FOREIGN KEY (`link_id`) REFERENCES `link` (`link_id`) ON DELETE CASCADE ON UPDATE NO ACTION;
+
+ALTER TABLE `link_counter`
+  ADD CONSTRAINT `link_counter_ibfk_1` FOREIGN KEY (`link_id`) REFERENCES `link` (`link_id`) ON DELETE CASCADE;
@@ -0,0 +1,25 @@
+--
+-- Create the `link_counter` table on an existing yaturl database and
+-- fill it from the rows already stored in `access_log`.
+--
+-- Run this once while the service is stopped, redirects logged while the
+-- backfill is running would be counted twice.
+--
+
+CREATE TABLE IF NOT EXISTS `link_counter` (
+  `link_id` bigint(20) unsigned NOT NULL,
+  `clicks` bigint(20) unsigned NOT NULL default '0',
+  `first_access` timestamp NULL default NULL,
+  `last_access` timestamp NULL default NULL,
+  PRIMARY KEY  (`link_id`),
+  CONSTRAINT `link_counter_ibfk_1` FOREIGN KEY (`link_id`) REFERENCES `link` (`link_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+INSERT INTO `link_counter` (`link_id`, `clicks`, `first_access`, `last_access`)
+  SELECT `link_id`, COUNT(`access_log_id`), MIN(`access_time`), MAX(`access_time`)
+  FROM `access_log`
+  GROUP BY `link_id`
+ON DUPLICATE KEY UPDATE
+  `clicks` = VALUES(`clicks`),
+  `first_access` = VALUES(`first_access`),
+  `last_access` = VALUES(`last_access`);
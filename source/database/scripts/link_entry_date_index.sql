@@ -0,0 +1,6 @@
+--
+-- Add the index on `link`.`entry_date` to an existing yaturl database,
+-- used by statistics on added links over arbitrary time ranges.
+--
+
+ALTER TABLE `link` ADD KEY `entry_date` (`entry_date`);
@@ -0,0 +1,39 @@
+--
+-- Create the statistics rollup tables on an existing yaturl database.
+--
+-- The rollup job of the service starts with an empty watermark and
+-- fills the tables from the existing `access_log` and `link` rows in
+-- batches, so no backfill is needed.
+--
+
+CREATE TABLE IF NOT EXISTS `stats_hourly` (
+  `stats_hour` datetime NOT NULL,
+  `redirects` int(10) unsigned NOT NULL default '0',
+  `links` int(10) unsigned NOT NULL default '0',
+  PRIMARY KEY  (`stats_hour`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS `stats_daily` (
+  `stats_day` date NOT NULL,
+  `redirects` int(10) unsigned NOT NULL default '0',
+  `links` int(10) unsigned NOT NULL default '0',
+  PRIMARY KEY  (`stats_day`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for table `stats_watermark`
+--
+-- Highest ID of `access_log` and `link` already added to the rollups,
+-- the highest ID which may be added as its transaction is committed
+-- (`safe_id`) and the highest ID noted at `pending_time` to become the
+-- next `safe_id`
+--
+
+CREATE TABLE IF NOT EXISTS `stats_watermark` (
+  `source` varchar(25) NOT NULL,
+  `last_id` bigint(20) unsigned NOT NULL default '0',
+  `safe_id` bigint(20) unsigned NOT NULL default '0',
+  `pending_id` bigint(20) unsigned NOT NULL default '0',
+  `pending_time` timestamp NULL default NULL,
+  PRIMARY KEY  (`source`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
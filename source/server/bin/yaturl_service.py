@@ -23,9 +23,19 @@
 
 from yaturl import config
 from yaturl.console.manager import ConsoleManager
+from yaturl.database.clickwriter import YuClickWriter
 from yaturl.database.database import YuDatabase
+from yaturl.database.rollup import YuStatsRollup
+from yaturl.eventserver import YuEventServer
+from yaturl.helpers.accesslog import YuAccessLogWriter
+from yaturl.helpers.compression import YuCompressor
 from yaturl.helpers.logger import get_access_logger, get_logger
+from yaturl.helpers.resolver import YuHostnameResolver
+from yaturl.helpers.template import YuTemplateCache
+from yaturl.metrics import YuMetricsServer, YuRequestMetrics
+from yaturl.router import YuRouter
 from yaturl.server import YuServer
+from yaturl.staticfiles import YuStaticFileCache
 from yaturl.thread import YuServerThread
 from yaturl.constants import TEMPLATENAMES
 from optparse import OptionParser
@@ -38,6 +48,7 @@ import os
 import pwd
 import sys
 from threading import Event
+from time import time
 
 
 shutdown_event = Event()
@@ -60,6 +71,10 @@ class YuBaseApp(object):
         self._server_threads = list()
         self._telnet_server_thread = None
         self._thread_watchdog_timeout = None
+        self._num_workers = None
+        self._worker_index = 0
+        # pid => (worker index, start time)
+        self._worker_processes = dict()
 
     #----------------------------------------------------------------------
     def setup(self):
@@ -67,13 +82,20 @@ class YuBaseApp(object):
         self._setup_options()
         self._setup_config()
         self._check_templates()
+        self._setup_compression()
+        self._setup_templates()
         self._set_uid()
         self._setup_pidfile_path()
         self._daemonize()
         self._check_already_running()
         self._write_pidfile()
         self._setup_logging()
-        self._setup_database()
+        self._setup_static_files()
+        self._setup_router()
+        self._setup_metrics()
+        self._setup_workers()
+        if not self._is_master():
+            self._setup_database()
         self._setup_thread_watchdog()
         self._setup_signal_handler()
 
@@ -122,6 +144,16 @@ class YuBaseApp(object):
                 if not os.path.exists(tmp_path):
                     raise RuntimeError(u'Template "%s" not found' % template)
 
+    #----------------------------------------------------------------------
+    def _setup_compression(self):
+        # before loading templates and static files which are precompressed
+        YuCompressor.init_compressor()
+
+    #----------------------------------------------------------------------
+    def _setup_templates(self):
+        # loaded before forking so worker processes share the memory
+        YuTemplateCache.init_template_cache()
+
     #----------------------------------------------------------------------
     def _set_uid(self):
         if config.has_option('main', 'user'):
@@ -184,6 +216,31 @@ class YuBaseApp(object):
         pid_file.write(str(pid))
         pid_file.close()
 
+    #----------------------------------------------------------------------
+    def _setup_static_files(self):
+        # loaded before forking so worker processes share the memory
+        YuStaticFileCache.init_static_file_cache()
+
+    #----------------------------------------------------------------------
+    def _setup_router(self):
+        YuRouter.init_router()
+
+    #----------------------------------------------------------------------
+    def _setup_metrics(self):
+        YuRequestMetrics.init_request_metrics()
+
+    #----------------------------------------------------------------------
+    def _setup_workers(self):
+        self._num_workers = max(1, config.getint('main', 'workers'))
+        if self._num_workers > 1:
+            # set when forking the worker processes
+            self._worker_index = None
+
+    #----------------------------------------------------------------------
+    def _is_master(self):
+        """Returns whether this process forks and supervises worker processes"""
+        return self._worker_index is None
+
     #----------------------------------------------------------------------
     def _setup_thread_watchdog(self):
         self._thread_watchdog_timeout = config.getint('main', 'thread_watch_timeout')
@@ -199,6 +256,8 @@ class YuBaseApp(object):
         self._logger.info(u'Received signal %s' % signum)
         if signum in (SIGINT, SIGTERM):
             self.shutdown()
+        elif signum == SIGUSR1 and self._is_master():
+            self._signal_worker_processes(SIGUSR1)
         elif signum == SIGUSR1:
             self._start_telnet_server_manually()
         else:
@@ -214,7 +273,13 @@ class YuBaseApp(object):
 
     #----------------------------------------------------------------------
     def _setup_database(self):
+        YuDatabase.init_query_statistics()
+        YuRequestMetrics.add_collector(YuDatabase.get_query_statistics().format_prometheus)
         YuDatabase.init_connection_pool()
+        YuRequestMetrics.add_collector(YuDatabase.get_connection_pool().format_prometheus)
+        YuDatabase.init_link_cache()
+        YuDatabase.init_link_filter()
+        YuDatabase.init_link_snapshot()
 
     #----------------------------------------------------------------------
     def shutdown(self):
@@ -238,23 +303,174 @@ class YuBaseApp(object):
 
     #----------------------------------------------------------------------
     def _try_to_start(self):
+        if self._is_master():
+            self._start_worker_processes()
+        else:
+            self._serve()
+        # bye bye
+        self._shutdown_logging()
+
+    #----------------------------------------------------------------------
+    def _serve(self):
         # prepare
         self._create_http_server()
+        self._create_click_writer()
+        self._create_access_log_writer()
+        self._create_hostname_resolver_if_necessary()
+        if self._worker_index == 0:
+            # one rollup job is enough, the others would only wait for its locks
+            self._create_stats_rollup()
         self._create_telnet_server_if_necessary()
+        self._create_metrics_server_if_necessary()
         # here we go
         self._start_server_threads()
         # wait for shutdown
         self._start_thread_watchdog()
-        # bye bye
-        self._shutdown_logging()
+
+    #----------------------------------------------------------------------
+    def _start_worker_processes(self):
+        """
+        Bind the HTTP server socket and fork the worker processes which all
+        accept connections on it. The master process must not start any
+        threads before forking, so it only supervises the workers.
+        """
+        self._http_server = self._factor_http_server()
+        for worker_index in xrange(self._num_workers):
+            self._fork_worker_process(worker_index)
+        self._start_process_watchdog()
+
+    #----------------------------------------------------------------------
+    def _fork_worker_process(self, worker_index):
+        pid = os.fork()
+        if pid:
+            self._logger.info(u'Started worker process %d with pid %d' % (worker_index, pid))
+            self._worker_processes[pid] = (worker_index, time())
+            return
+
+        # worker process, never return into the master's code
+        exit_code = 1
+        try:
+            self._worker_index = worker_index
+            self._worker_processes = dict()
+            # connections and caches must not be shared with other processes
+            self._setup_database()
+            self._serve()
+            exit_code = 0
+        except Exception, e:
+            self._logger.error(u'An error occurred: %s' % e, exc_info=True)
+        finally:
+            # also if _serve() failed, stop the click and access log writers
+            # after they have written their queues, threads don't survive
+            # os._exit()
+            self._stop_server_threads()
+            # like the single process mode, write the queued access log lines
+            self._shutdown_logging()
+            os._exit(exit_code)
+
+    #----------------------------------------------------------------------
+    def _start_process_watchdog(self):
+        """watch worker processes, restart the ones which died"""
+        while not shutdown_event.isSet():
+            for pid, status in self._reap_worker_processes():
+                worker_index, start_time = self._worker_processes.pop(pid)
+                self._logger.error(
+                    u'Worker process %d (pid %d) died with status %d after %0.1fs, restarting it' \
+                        % (worker_index, pid, status, time() - start_time))
+                if not shutdown_event.isSet():
+                    self._fork_worker_process(worker_index)
+            # a worker failing right on start is restarted at most once per second
+            shutdown_event.wait(1)
+
+        # stop the workers, they finish their current requests first
+        self._signal_worker_processes(SIGTERM)
+        for pid in self._worker_processes.keys():
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._worker_processes = dict()
+
+    #----------------------------------------------------------------------
+    def _reap_worker_processes(self):
+        """
+        Collect the worker processes which exited without blocking
+
+        | **return** exited (list of tuple(int pid, int status))
+        """
+        exited = list()
+        while self._worker_processes:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                break
+            if not pid:
+                break
+            if pid in self._worker_processes:
+                exited.append((pid, status))
+        return exited
+
+    #----------------------------------------------------------------------
+    def _signal_worker_processes(self, signum):
+        for pid in self._worker_processes:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
 
     #----------------------------------------------------------------------
     def _create_http_server(self):
-        self._http_server = YuServer(shutdown_event)
+        if self._http_server is None:
+            self._http_server = self._factor_http_server()
+        # else: worker process using the socket bound by the master
         target = self._http_server.serve_forever
         thread = self._create_server_thread(u'HTTP Server', target, self._http_server)
         return thread
 
+    #----------------------------------------------------------------------
+    def _factor_http_server(self):
+        frontend = config.get('http', 'frontend')
+        if frontend == 'events':
+            return YuEventServer(shutdown_event)
+        elif frontend == 'threads':
+            return YuServer(shutdown_event)
+        else:
+            raise RuntimeError(u'Unknown HTTP frontend "%s"' % frontend)
+
+    #----------------------------------------------------------------------
+    def _create_click_writer(self):
+        # register after the HTTP server so it is stopped after it and can
+        # write all clicks queued until then
+        click_writer = YuClickWriter.init_click_writer()
+        target = click_writer.serve_forever
+        thread = self._create_server_thread(u'Click Writer', target, click_writer)
+        return thread
+
+    #----------------------------------------------------------------------
+    def _create_access_log_writer(self):
+        # like the click writer, stopped after the HTTP server
+        access_log_writer = YuAccessLogWriter.init_access_log_writer()
+        target = access_log_writer.serve_forever
+        thread = self._create_server_thread(u'Access Log Writer', target, access_log_writer)
+        return thread
+
+    #----------------------------------------------------------------------
+    def _create_hostname_resolver_if_necessary(self):
+        if config.getboolean('http', 'resolve_clients'):
+            resolver = YuHostnameResolver.init_resolver()
+            # without it, clients are logged with their IP address
+            self._create_server_thread(
+                u'Hostname Resolver', resolver.serve_forever, resolver, mandatory=False)
+
+    #----------------------------------------------------------------------
+    def _create_stats_rollup(self):
+        stats_rollup = YuStatsRollup()
+        target = stats_rollup.serve_forever
+        thread = self._create_server_thread(
+            u'Statistics Rollup', target, stats_rollup, mandatory=False)
+        return thread
+
     #----------------------------------------------------------------------
     def _create_server_thread(self, name, target, instance, mandatory=True):
         thread = YuServerThread(target=target, name=name, instance=instance, mandatory=mandatory)
@@ -268,9 +484,17 @@ class YuBaseApp(object):
             thread = self._create_telnet_server()
             self._telnet_server_thread = thread
 
+    #----------------------------------------------------------------------
+    def _create_metrics_server_if_necessary(self):
+        if config.getboolean('metrics', 'enable'):
+            metrics_server = YuMetricsServer(self._worker_index)
+            target = metrics_server.serve_forever
+            self._create_server_thread(
+                u'Metrics Server', target, metrics_server, mandatory=False)
+
     #----------------------------------------------------------------------
     def _create_telnet_server(self, mandatory=True):
-        self._console_manager = ConsoleManager()
+        self._console_manager = ConsoleManager(self._worker_index)
         target = self._console_manager.serve_forever
         thread = self._create_server_thread(
             'Telnet Console Server', target, self._console_manager, mandatory)
@@ -315,7 +539,11 @@ class YuBaseApp(object):
             # wait for next check
             shutdown_event.wait(self._thread_watchdog_timeout)
 
-        # stop remaining threads
+        self._stop_server_threads()
+
+    #----------------------------------------------------------------------
+    def _stop_server_threads(self):
+        """stop remaining threads in the order they have been created"""
         for server_thread in self._server_threads:
             if server_thread.isAlive():
                 server_thread.shutdown()
@@ -324,6 +552,10 @@ class YuBaseApp(object):
     #----------------------------------------------------------------------
     def _shutdown_logging(self):
         self._logger.info(u'Shutdown')
+        access_log_writer = YuAccessLogWriter.get_access_log_writer()
+        if access_log_writer:
+            # lines queued after the writer thread has been stopped
+            access_log_writer.flush()
         logging.shutdown()
 
 
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from yaturl import config
+from yaturl.database.database import YuDatabase
+from yaturl.database.snapshot import build_snapshot
+from optparse import OptionParser
+from time import time
+import os
+import sys
+
+
+#----------------------------------------------------------------------
+def _parse_options():
+    base_dir = os.path.abspath('%s/..' % (os.path.dirname(__file__)))
+    option_parser = OptionParser()
+    option_parser.add_option(
+        '-c', dest='config',
+        default='%s/etc/yaturl.conf' % base_dir,
+        help=u'configuration file')
+    option_parser.add_option(
+        '-o', dest='output',
+        default=None,
+        help=u'snapshot file to write, defaults to the configured path')
+
+    return option_parser.parse_args()[0]
+
+
+#----------------------------------------------------------------------
+def _read_config(config_file):
+    if not os.path.exists(config_file):
+        raise RuntimeError(u'Configuration file does not exist')
+    config_path, config_filename = os.path.split(config_file)
+    local_config_filename = u'%s-local%s' % os.path.splitext(config_filename)
+    local_config_path = os.path.join(config_path, local_config_filename)
+    config.read([config_file, local_config_path])
+
+
+#----------------------------------------------------------------------
+def main():
+    """
+    Dump all links into a snapshot file for the memory-mapped link lookup
+
+    | **return** exit_code (int)
+    """
+    options = _parse_options()
+    try:
+        _read_config(options.config)
+        path = options.output or config.get('snapshot', 'path')
+        YuDatabase.init_connection_pool()
+        database = YuDatabase()
+        start = time()
+        count = build_snapshot(database, path)
+        database.close()
+    except Exception, e:
+        print >> sys.stderr, u'Snapshot Error: %s' % unicode(e)
+        exit(1)
+
+    print u'Wrote %d links to "%s" in %0.2fs' % (count, path, time() - start)
+    exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@
 from yaturl import config
 from yaturl.console.monitor import SystemMonitor
 from yaturl.console.server import TelnetInteractiveConsoleServer
+from yaturl.helpers.histogram import LATENCY_BUCKETS
 from yaturl.helpers.logger import get_logger
 
 
@@ -33,9 +34,10 @@ class ConsoleManager(object):
     """
 
     #----------------------------------------------------------------------
-    def __init__(self):
+    def __init__(self, port_offset=0):
         self._host = config.get('telnet', 'host')
-        self._port = config.getint('telnet', 'port')
+        # each worker process listens on its own port
+        self._port = config.getint('telnet', 'port') + port_offset
         self._locals = None
         self._logger = get_logger()
         self._telnet_server = TelnetInteractiveConsoleServer(
@@ -56,9 +58,26 @@ class ConsoleManager(object):
         threads = monitor.get_running_threads()
         uptime = monitor.get_uptime()
         pool = monitor.get_connection_pool()
+        pool_statistics = monitor.get_connection_pool_statistics()
         load = monitor.get_load_avg()
         time_usr, time_sys = monitor.get_resource_usage()
         rss = monitor.get_memory_usage()
+        link_cache = monitor.get_link_cache()
+        negative_cache = monitor.get_negative_cache()
+        link_filter = monitor.get_link_filter()
+        link_snapshot = monitor.get_link_snapshot()
+        click_writer = monitor.get_click_writer()
+        access_log_writer = monitor.get_access_log_writer()
+        hostname_resolver = monitor.get_hostname_resolver()
+        static_file_cache = monitor.get_static_file_cache()
+        file_sender = monitor.get_file_sender()
+        template_cache = monitor.get_template_cache()
+        compressor = monitor.get_compressor()
+        routes = monitor.get_routes()
+        request_metrics = monitor.get_request_metrics()
+        query_statistics = monitor.get_query_statistics()
+        worker_pools = monitor.get_worker_pools()
+        listen_queue = monitor.get_listen_queue()
 
         print 'Uptime: %s days, %s' % (uptime['uptime_days'], uptime['uptime_rest'])
         print 'Time USR: %0.2f' % time_usr
@@ -66,10 +85,81 @@ class ConsoleManager(object):
         print 'Memory (RSS): %0.2f MB' % (rss)
         print 'Load: %0.2f %0.2f %0.2f' % load
         print 'DB Pool: %s' % pool
+        if pool_statistics:
+            print 'DB Pool checkouts: %(checkouts)d, %(timeouts)d timeouts, %(connections)d ' \
+                'connections created, %(overflow_connections)d overflow, %(reconnects)d ' \
+                'reconnects' % pool_statistics
+            print 'DB Pool wait: mean %0.2fms, p99 %s, ping: mean %0.2fms, p99 %s' % (
+                pool_statistics['wait_mean'] * 1000, cls._format_latency(pool_statistics['wait_p99']),
+                pool_statistics['ping_mean'] * 1000, cls._format_latency(pool_statistics['ping_p99']))
+        if link_cache:
+            print 'Link cache: %(size)d/%(max_size)d entries, %(hits)d hits, ' \
+                '%(misses)d misses, %(evictions)d evictions' % link_cache
+        if negative_cache:
+            print 'Negative cache: %(size)d/%(max_size)d entries, %(hits)d hits, ' \
+                '%(misses)d misses, %(evictions)d evictions' % negative_cache
+        if link_filter:
+            print 'Link filter: %(entries)d entries, %(hashes)d hashes, %(memory)d bytes, ' \
+                'built in %(build_time)0.2fs, estimated false positive rate ' \
+                '%(false_positive_rate)0.6f, %(rejected)d rejected, ' \
+                '%(false_positives)d false positives' % link_filter
+        if link_snapshot:
+            print 'Link snapshot: %(entries)d links, %(age)0.0fs old, %(hits)d hits, ' \
+                '%(misses)d misses, hit ratio %(hit_ratio)0.2f' % link_snapshot
+        if click_writer:
+            print 'Click writer: queue %(queue_depth)d/%(queue_size)d, %(flushes)d flushes, ' \
+                'last flush %(last_flush_size)d, %(written)d written, %(dropped)d dropped, ' \
+                '%(failed)d failed' % click_writer
+        if access_log_writer:
+            print 'Access log writer: queue %(queue_depth)d/%(queue_size)d, %(flushes)d flushes, ' \
+                '%(written)d written, overflow policy %(overflow)s, %(dropped)d dropped, ' \
+                '%(blocked)d blocked' % access_log_writer
+        if hostname_resolver:
+            print 'Hostname resolver: %(size)d/%(max_size)d entries, %(hits)d hits, ' \
+                '%(misses)d misses, queue %(queue_depth)d, %(resolved)d resolved in ' \
+                '%(resolve_time)0.2fs, %(dropped)d dropped' % hostname_resolver
+        if static_file_cache:
+            print 'Static files: %(files)d files, %(size)d bytes, %(open_files)d kept open, ' \
+                '%(loads)d loads, %(not_modified)d not modified' % static_file_cache
+        print 'Sendfile: %(files)d files, %(bytes)d bytes sent, %(fallbacks)d fallbacks, ' \
+            'available %(available)s' % file_sender
+        if template_cache:
+            print 'Templates: %(templates)d templates, %(rendered)d pre-rendered pages, ' \
+                '%(loads)d loads' % template_cache
+        if compressor:
+            print 'Compression: %(responses)d responses, %(bytes_in)d bytes compressed to ' \
+                '%(bytes_out)d (ratio %(ratio)0.2f), %(compress_time)0.2fs compressing on the ' \
+                'fly, %(precompress_time)0.2fs precompressing' % compressor
+        if routes:
+            print 'Routes: %s' % ', '.join('%s %d' % route for route in routes)
+        for metrics in request_metrics or ():
+            print 'Requests %s %d: %d, mean %0.1fms, p50 %s, p99 %s' % (
+                metrics['route'], metrics['code'], metrics['requests'], metrics['mean'] * 1000,
+                cls._format_latency(metrics['p50']), cls._format_latency(metrics['p99']))
+        for query in query_statistics or ():
+            print 'Query %s: %d, %d errors, %d rows, %d slow, mean %0.1fms, p99 %s, max %0.1fms' % (
+                query['name'], query['queries'], query['errors'], query['rows'], query['slow'],
+                query['mean'] * 1000, cls._format_latency(query['p99']), query['max_time'] * 1000)
+        for worker_pool in worker_pools:
+            print '%(name)s pool: %(active)d active, %(idle)d idle, %(queued)d/%(queue_size)d ' \
+                'queued, %(completed)d completed, %(rejected)d rejected' % worker_pool
+        if listen_queue:
+            if listen_queue['queued'] is not None:
+                print 'Listen queue: %(queued)d/%(backlog)d queued' % listen_queue
+            if listen_queue['overflows'] is not None:
+                print 'Listen queue (system-wide since start): %(overflows)d overflows, ' \
+                    '%(drops)d drops' % listen_queue
         print 'Running threads:'
         for running_thread in threads:
             print '   %s' % running_thread
 
+    #----------------------------------------------------------------------
+    @classmethod
+    def _format_latency(cls, latency):
+        if latency is None:
+            return '> %gs' % LATENCY_BUCKETS[-1]
+        return '<= %gms' % (latency * 1000)
+
     #----------------------------------------------------------------------
     def _start_telnet_server(self):
         self._logger.debug(u'Telnet Console Server started')
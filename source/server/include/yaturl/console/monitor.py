@@ -21,7 +21,19 @@
 
 
 from yaturl import start_time
+from yaturl.database.clickwriter import YuClickWriter
 from yaturl.database.database import YuDatabase
+from yaturl.helpers.accesslog import YuAccessLogWriter
+from yaturl.helpers.compression import YuCompressor
+from yaturl.helpers.histogram import get_percentile
+from yaturl.helpers.resolver import YuHostnameResolver
+from yaturl.metrics import YuRequestMetrics
+from yaturl.helpers.sendfile import YuFileSender
+from yaturl.helpers.template import YuTemplateCache
+from yaturl.router import YuRouter
+from yaturl.server import YuServer
+from yaturl.staticfiles import YuStaticFileCache
+from yaturl.workerpool import YuWorkerPool
 from threading import enumerate as thread_enumerate
 from math import floor
 from os import getloadavg, getpid
@@ -99,6 +111,205 @@ class SystemMonitor(object):
         connection_pool = YuDatabase.get_connection_pool()
         return connection_pool.status() if connection_pool else None
 
+    #----------------------------------------------------------------------
+    def get_connection_pool_statistics(self):
+        """
+        Return the checkout, connection and reconnect counters of the
+        connection pool and the latency of checkouts and of ping()
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        connection_pool = YuDatabase.get_connection_pool()
+        if not connection_pool:
+            return None
+        statistics = connection_pool.get_statistics()
+        for name, snapshot in (('wait', connection_pool.get_wait_snapshot()),
+                               ('ping', connection_pool.get_ping_snapshot())):
+            statistics['%s_mean' % name] = snapshot.sum / snapshot.count if snapshot.count else 0.0
+            statistics['%s_p99' % name] = get_percentile(snapshot, 0.99)
+        return statistics
+
+    #----------------------------------------------------------------------
+    def get_link_cache(self):
+        """
+        Return the usage counters of the shorthash link cache
+
+        | **return** statistics (dict{str name: int value})
+        """
+        link_cache = YuDatabase.get_link_cache()
+        return link_cache.get_statistics() if link_cache else None
+
+    #----------------------------------------------------------------------
+    def get_negative_cache(self):
+        """
+        Return the usage counters of the cache for unknown shorthashes
+
+        | **return** statistics (dict{str name: int value})
+        """
+        negative_cache = YuDatabase.get_negative_cache()
+        return negative_cache.get_statistics() if negative_cache else None
+
+    #----------------------------------------------------------------------
+    def get_link_filter(self):
+        """
+        Return size, build time and usage counters of the shorthash Bloom filter
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        link_filter = YuDatabase.get_link_filter()
+        return link_filter.get_statistics() if link_filter else None
+
+    #----------------------------------------------------------------------
+    def get_link_snapshot(self):
+        """
+        Return age, size and hit ratio of the memory-mapped link snapshot
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        link_snapshot = YuDatabase.get_link_snapshot()
+        return link_snapshot.get_statistics() if link_snapshot else None
+
+    #----------------------------------------------------------------------
+    def get_click_writer(self):
+        """
+        Return the counters of the background click writer
+
+        | **return** statistics (dict{str name: int value})
+        """
+        click_writer = YuClickWriter.get_click_writer()
+        return click_writer.get_statistics() if click_writer else None
+
+    #----------------------------------------------------------------------
+    def get_access_log_writer(self):
+        """
+        Return the counters of the background access log writer
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        access_log_writer = YuAccessLogWriter.get_access_log_writer()
+        return access_log_writer.get_statistics() if access_log_writer else None
+
+    #----------------------------------------------------------------------
+    def get_hostname_resolver(self):
+        """
+        Return the counters of the hostname resolver and its cache
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        resolver = YuHostnameResolver.get_resolver()
+        return resolver.get_statistics() if resolver else None
+
+    #----------------------------------------------------------------------
+    def get_static_file_cache(self):
+        """
+        Return the number and size of the static files held in memory
+
+        | **return** statistics (dict{str name: int value})
+        """
+        static_file_cache = YuStaticFileCache.get_static_file_cache()
+        return static_file_cache.get_statistics() if static_file_cache else None
+
+    #----------------------------------------------------------------------
+    def get_file_sender(self):
+        """
+        Return the number of large static files sent with sendfile()
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        return YuFileSender.get_statistics()
+
+    #----------------------------------------------------------------------
+    def get_template_cache(self):
+        """
+        Return the number of cached templates and pre-rendered pages
+
+        | **return** statistics (dict{str name: int value})
+        """
+        template_cache = YuTemplateCache.get_template_cache()
+        return template_cache.get_statistics() if template_cache else None
+
+    #----------------------------------------------------------------------
+    def get_compressor(self):
+        """
+        Return the number of compressed responses, the compression ratio
+        and the time spent compressing
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        compressor = YuCompressor.get_compressor()
+        return compressor.get_statistics() if compressor else None
+
+    #----------------------------------------------------------------------
+    def get_routes(self):
+        """
+        Return the number of requests of each route of the request handler
+
+        | **return** statistics (seq of tuple(str name, int requests))
+        """
+        router = YuRouter.get_router()
+        return router.get_statistics() if router else None
+
+    #----------------------------------------------------------------------
+    def get_request_metrics(self):
+        """
+        Return the number of requests and latency percentiles for each
+        route and status code
+
+        | **return** statistics (seq of dict{str name: mixed value})
+        """
+        request_metrics = YuRequestMetrics.get_request_metrics()
+        if not request_metrics:
+            return None
+        return [
+            dict(route=route,
+                 code=code,
+                 requests=snapshot.count,
+                 mean=snapshot.sum / snapshot.count if snapshot.count else 0.0,
+                 p50=get_percentile(snapshot, 0.5),
+                 p99=get_percentile(snapshot, 0.99))
+            for route, code, snapshot in request_metrics.get_snapshots()]
+
+    #----------------------------------------------------------------------
+    def get_query_statistics(self):
+        """
+        Return the number of executions, errors, rows and slow executions
+        and the latency of each database query
+
+        | **return** statistics (seq of dict{str name: mixed value})
+        """
+        query_statistics = YuDatabase.get_query_statistics()
+        if not query_statistics:
+            return None
+        statistics = list()
+        for name, values, snapshot in query_statistics.get_statistics():
+            values = dict(values)
+            values.update(
+                name=name,
+                mean=snapshot.sum / snapshot.count if snapshot.count else 0.0,
+                p99=get_percentile(snapshot, 0.99))
+            statistics.append(values)
+        return statistics
+
+    #----------------------------------------------------------------------
+    def get_worker_pools(self):
+        """
+        Return the number of active, idle and queued workers of all worker pools
+
+        | **return** statistics (seq of dict{str name: mixed value})
+        """
+        return [worker_pool.get_statistics() for worker_pool in YuWorkerPool.get_worker_pools()]
+
+    #----------------------------------------------------------------------
+    def get_listen_queue(self):
+        """
+        Return the accept queue of the HTTP server's listening socket and
+        the system-wide listen overflows and drops since the server start
+
+        | **return** statistics (dict{str name: int value})
+        """
+        http_server = YuServer.get_http_server()
+        return http_server.get_listen_queue() if http_server else None
+
     #----------------------------------------------------------------------
     def get_uptime(self):
         """
@@ -29,7 +29,8 @@ TEMPLATENAMES = ['404', '500', 'contactUsResult', 'databaseerror',
 CONTENT_TYPES = ({
     '.css': 'text/css',
     '.ico': 'image/vnd.microsoft.icon',
-    '.png': 'image/png'
+    '.png': 'image/png',
+    '.txt': 'text/plain'
 })
 
 # we need to hard-code this one at least in case of the file cannot be found on disk
@@ -68,7 +69,7 @@ HEADER = '''<!DOCTYPE html>
 <html lang="en">
 
 <head>
-    <title>%s</title>
+    <title>%(title)s</title>
     <meta charset="utf-8" />
     <meta name="generator" content="Geany 0.19.1" />
     <link rel="stylesheet" href="/default.css" />
@@ -77,5 +78,5 @@ HEADER = '''<!DOCTYPE html>
 
 <body>
     <div id="container">
-        <div id="header"><span>%s</span></div>
+        <div id="header"><span>%(header)s</span></div>
 '''
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from hashlib import md5
+from math import ceil, exp, log
+from struct import unpack
+from threading import Lock
+
+
+########################################################################
+class YuBloomFilter(object):
+    """
+    Bloom filter over all known shorthashes. If a shorthash is not
+    contained in the filter, it is definitely not stored in the database.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self._num_bits = int(ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+        self._num_hashes = max(1, int(round(self._num_bits * log(2) / capacity)))
+        self._bits = bytearray((self._num_bits + 7) // 8)
+        self._lock = Lock()
+        self._entries = 0
+        self._rejected = 0
+        self._false_positives = 0
+        self.last_link_id = 0
+        self.last_update = 0
+        self.build_time = None
+
+    #----------------------------------------------------------------------
+    def _get_bit_positions(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        # derive all positions from two hash values (Kirsch/Mitzenmacher)
+        hash_a, hash_b = unpack('<QQ', md5(key).digest())
+        return [(hash_a + i * hash_b) % self._num_bits for i in xrange(self._num_hashes)]
+
+    #----------------------------------------------------------------------
+    def add(self, key):
+        """
+        Add the given key to the filter
+
+        | **param** key (str)
+        """
+        positions = self._get_bit_positions(key)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self._entries += 1
+
+    #----------------------------------------------------------------------
+    def __contains__(self, key):
+        for position in self._get_bit_positions(key):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                with self._lock:
+                    self._rejected += 1
+                return False
+        return True
+
+    #----------------------------------------------------------------------
+    def count_false_positive(self):
+        """
+        Record a key which passed the filter but is not in the database
+        """
+        with self._lock:
+            self._false_positives += 1
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the size and usage counters of the filter
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        with self._lock:
+            fill_ratio = 1.0 - exp(-float(self._num_hashes * self._entries) / self._num_bits)
+            return dict(
+                entries=self._entries,
+                memory=len(self._bits),
+                hashes=self._num_hashes,
+                build_time=self.build_time or 0.0,
+                false_positive_rate=fill_ratio ** self._num_hashes,
+                rejected=self._rejected,
+                false_positives=self._false_positives)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from yaturl import config
+
+
+########################################################################
+class YuLinkCache(object):
+    """
+    Bounded, thread-safe LRU cache with a time to live for each entry.
+    Used to keep the result of shorthash lookups in memory so hot links
+    don't need a database round trip on every redirect.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, max_size, ttl):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    #----------------------------------------------------------------------
+    def get(self, key, count_miss=True):
+        """
+        Return the cached value for the given key or None if the key is
+        not cached or its entry has been expired.
+
+        | **param** key (str)
+        | **param** count_miss (bool) - False if a miss is looked up again
+        | **return** value (mixed)
+        """
+        now = time()
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                if count_miss:
+                    self._misses += 1
+                return None
+            if expires < now:
+                if count_miss:
+                    self._misses += 1
+                return None
+            # re-insert to mark the entry as most recently used
+            self._entries[key] = (expires, value)
+            self._hits += 1
+            return value
+
+    #----------------------------------------------------------------------
+    def set(self, key, value):
+        """
+        Store the value for the given key, evicting the least recently
+        used entry if the cache is full.
+
+        | **param** key (str)
+        | **param** value (mixed)
+        """
+        if self._max_size < 1:
+            return
+        expires = time() + self._ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+            self._entries[key] = (expires, value)
+
+    #----------------------------------------------------------------------
+    def invalidate(self, key):
+        """
+        Remove the given key from the cache, if present
+
+        | **param** key (str)
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the usage counters of the cache
+
+        | **return** statistics (dict{str name: int value})
+        """
+        with self._lock:
+            return dict(
+                size=len(self._entries),
+                max_size=self._max_size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions)
+
+
+#----------------------------------------------------------------------
+def factor_link_cache():
+    max_size = config.getint('cache', 'link_cache_size')
+    ttl = config.getint('cache', 'link_cache_ttl')
+
+    return YuLinkCache(max_size, ttl)
+
+
+#----------------------------------------------------------------------
+def factor_negative_cache():
+    max_size = config.getint('cache', 'negative_cache_size')
+    ttl = config.getint('cache', 'negative_cache_ttl')
+
+    return YuLinkCache(max_size, ttl)
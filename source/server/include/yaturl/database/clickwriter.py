@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from datetime import datetime
+from Queue import Queue, Empty, Full
+from threading import Event, Lock
+from time import time
+from yaturl import config
+from yaturl.database.database import YuDatabase
+from yaturl.database.error import YuDatabaseError
+from yaturl.helpers.logger import get_logger
+
+
+########################################################################
+class YuClickWriter(object):
+    """
+    Collect redirects in a bounded queue and write them in batches to the
+    access_log table from a background thread, so the client doesn't have
+    to wait for the insert before getting redirected.
+    """
+
+    click_writer = None
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self._queue_size = config.getint('clicklog', 'queue_size')
+        self._flush_size = config.getint('clicklog', 'flush_size')
+        # configured in milliseconds
+        self._flush_interval = config.getint('clicklog', 'flush_interval') / 1000.0
+        self._queue = Queue(self._queue_size)
+        self._stopped = Event()
+        self._lock = Lock()
+        self._db = YuDatabase()
+        self._logger = get_logger()
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_size = 0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_click_writer(cls):
+        cls.click_writer = cls()
+        return cls.click_writer
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_click_writer(cls):
+        return cls.click_writer
+
+    #----------------------------------------------------------------------
+    def log_click(self, link_id):
+        """
+        Queue a redirect of the given link for writing to the database.
+        If the queue is full, the click is dropped.
+
+        | **param** link_id (int)
+        | **return** queued (bool)
+        """
+        access_time = datetime.utcnow().replace(microsecond=0)
+        try:
+            self._queue.put_nowait((link_id, access_time))
+            return True
+        except Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+    #----------------------------------------------------------------------
+    def _collect_clicks(self):
+        """
+        Wait for queued clicks and return them once either flush_size clicks
+        have been collected or flush_interval passed since the first one.
+
+        | **return** clicks (list of tuple(int link_id, datetime access_time))
+        """
+        clicks = list()
+        # wake up regularly while idle to notice a shutdown request
+        timeout = 0.5
+        deadline = None
+        while len(clicks) < self._flush_size:
+            try:
+                clicks.append(self._queue.get(timeout=timeout))
+            except Empty:
+                if clicks or self._stopped.isSet():
+                    break
+                continue
+            if deadline is None:
+                deadline = time() + self._flush_interval
+            timeout = deadline - time()
+            if timeout <= 0:
+                break
+        return clicks
+
+    #----------------------------------------------------------------------
+    def _flush(self, clicks):
+        try:
+            self._db.add_logentries_to_database(clicks)
+        except YuDatabaseError:
+            with self._lock:
+                self._failed += len(clicks)
+        else:
+            with self._lock:
+                self._written += len(clicks)
+        finally:
+            # give the connection back to the pool while we are idle
+            self._db.close()
+        with self._lock:
+            self._flushes += 1
+            self._last_flush_size = len(clicks)
+
+    #----------------------------------------------------------------------
+    def _flush_remaining(self):
+        clicks = list()
+        while True:
+            try:
+                clicks.append(self._queue.get_nowait())
+            except Empty:
+                break
+        for start in xrange(0, len(clicks), self._flush_size):
+            self._flush(clicks[start:start + self._flush_size])
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'Click Writer started')
+        while not self._stopped.isSet():
+            clicks = self._collect_clicks()
+            if clicks:
+                self._flush(clicks)
+        self._flush_remaining()
+        self._logger.debug(u'Click Writer stopped')
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        """Stop the writer after all queued clicks have been written"""
+        self._logger.debug(u'Click Writer stopping')
+        self._stopped.set()
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the counters of the click writer
+
+        | **return** statistics (dict{str name: int value})
+        """
+        with self._lock:
+            return dict(
+                queue_depth=self._queue.qsize(),
+                queue_size=self._queue_size,
+                flushes=self._flushes,
+                last_flush_size=self._last_flush_size,
+                written=self._written,
+                dropped=self._dropped,
+                failed=self._failed)
@@ -19,14 +19,45 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301, USA.
 
+from collections import namedtuple
+from threading import Lock
+from time import time
 from yaturl import config
+from yaturl.database.bloom import YuBloomFilter
+from yaturl.database.cache import factor_link_cache, factor_negative_cache
 from yaturl.database.error import YuDatabaseError
+from yaturl.database.snapshot import YuLinkSnapshot
 from yaturl.database.pool import factor_database_connection_pool
+from yaturl.database.querystats import factor_query_statistics
 from yaturl.helpers.logger import get_logger
+from yaturl.helpers.shorthash import normalize_shorthash
+from yaturl.helpers.timerange import is_whole_day, is_whole_hour
 from MySQLdb.constants.ER import DUP_ENTRY
 from MySQLdb import DatabaseError
 
 
+# result of YuDatabase.resolve_shorthash()
+ResolvedLink = namedtuple('ResolvedLink', 'link_id link blocked block_reason deleted')
+
+# source tables of the statistics rollups: ID column, time column and the
+# counter column in the rollup tables
+ROLLUP_SOURCES = ({
+    'access_log':   ('access_log_id', 'access_time', 'redirects'),
+    'link':         ('link_id', 'entry_date', 'links')})
+
+# source table and its time column of the statistics counters
+STATISTICS_SOURCES = ({
+    'redirects':    ('access_log', 'access_time'),
+    'links':        ('link', 'entry_date')})
+
+# rollup table, its time column and the grouping for the statistics per period
+STATISTICS_PERIODS = ({
+    'per_week':     ('stats_daily', 'stats_day', 'YEAR(`stats_day`), WEEK(`stats_day`)'),
+    'per_hour':     ('stats_hourly', 'stats_hour', 'HOUR(`stats_hour`)'),
+    'per_dow':      ('stats_daily', 'stats_day', 'DAYOFWEEK(`stats_day`)'),
+    'per_dom':      ('stats_daily', 'stats_day', 'DAYOFMONTH(`stats_day`)')})
+
+
 ########################################################################
 class YuDatabase(object):
     """
@@ -34,6 +65,13 @@ class YuDatabase(object):
     """
 
     connection_pool = None
+    link_cache = None
+    negative_cache = None
+    link_filter = None
+    link_filter_lock = Lock()
+    link_filter_refresh = None
+    link_snapshot = None
+    query_statistics = None
 
     #----------------------------------------------------------------------
     def __init__(self):
@@ -78,6 +116,71 @@ class YuDatabase(object):
         cursor = self._conn.cursor()
         return cursor
 
+    #----------------------------------------------------------------------
+    def _execute(self, cursor, name, query, params=None, many=False):
+        """
+        Execute the query on the given cursor. All queries are executed
+        here to record their duration and number of rows in the query
+        statistics.
+
+        | **param** cursor (MySQLdb.Cursor)
+        | **param** name (str) - name of the query in the statistics
+        | **param** query (str)
+        | **param** params (seq of mixed)
+        | **param** many (bool) - execute the query for each item of params
+        """
+        start = time()
+        failed = True
+        try:
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
+            failed = False
+        finally:
+            if self.query_statistics:
+                self.query_statistics.record(
+                    name, query, params, time() - start, cursor.rowcount, failed)
+
+    #----------------------------------------------------------------------
+    def _select(self, name, query, params=None, fetch_all=False):
+        """
+        Execute a single query and return its result
+
+        | **param** name (str) - name of the query in the statistics
+        | **param** query (str)
+        | **param** params (seq of mixed)
+        | **param** fetch_all (bool)
+        | **return** result (tuple) - the first row or None, or all rows if fetch_all is set
+        """
+        try:
+            cursor = self._get_cursor()
+            self._execute(cursor, name, query, params)
+            result = cursor.fetchall() if fetch_all else cursor.fetchone()
+            cursor.close()
+            return result
+        except DatabaseError, e:
+            self.logger.error('Database error: %s' % e, exc_info=True)
+            raise YuDatabaseError(str(e))
+
+    #----------------------------------------------------------------------
+    def _modify(self, name, query, params=None):
+        """
+        Execute a single statement changing data and commit it
+
+        | **param** name (str) - name of the query in the statistics
+        | **param** query (str)
+        | **param** params (seq of mixed)
+        """
+        try:
+            cursor = self._get_cursor()
+            self._execute(cursor, name, query, params)
+            self.commit()
+            cursor.close()
+        except DatabaseError, e:
+            self.logger.error('Database error: %s' % e, exc_info=True)
+            raise YuDatabaseError(str(e))
+
     #----------------------------------------------------------------------
     @classmethod
     def init_connection_pool(cls):
@@ -88,6 +191,136 @@ class YuDatabase(object):
     def get_connection_pool(cls):
         return cls.connection_pool
 
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_query_statistics(cls):
+        cls.query_statistics = factor_query_statistics()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_query_statistics(cls):
+        return cls.query_statistics
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_link_cache(cls):
+        cls.link_cache = factor_link_cache()
+        cls.negative_cache = factor_negative_cache()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_link_cache(cls):
+        return cls.link_cache
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_negative_cache(cls):
+        return cls.negative_cache
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_link_filter(cls):
+        """
+        Build the Bloom filter over all shorthashes stored in the database.
+        If this fails, the service keeps working without the filter.
+        """
+        capacity = config.getint('cache', 'link_filter_capacity')
+        error_rate = config.getfloat('cache', 'link_filter_error_rate')
+        cls.link_filter_refresh = config.getint('cache', 'link_filter_refresh') / 1000.0
+        link_filter = YuBloomFilter(capacity, error_rate)
+        database = cls()
+        start = time()
+        try:
+            database.update_link_filter(link_filter)
+            cls.link_filter = link_filter
+            # catch up with links added while the filter was being built
+            database.update_link_filter(link_filter)
+        except YuDatabaseError:
+            database.logger.warn(u'Link filter could not be built, continuing without it')
+            return
+        finally:
+            database.close()
+        link_filter.build_time = time() - start
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_link_filter(cls):
+        return cls.link_filter
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_link_snapshot(cls):
+        """
+        Map the link snapshot file, if enabled. If the file does not exist
+        or is invalid, the service keeps working without it.
+        """
+        if not config.getboolean('snapshot', 'enable'):
+            return
+        path = config.get('snapshot', 'path')
+        reload_interval = config.getint('snapshot', 'reload_interval')
+        try:
+            cls.link_snapshot = YuLinkSnapshot(path, reload_interval)
+        except (IOError, ValueError), e:
+            get_logger().warn(u'Link snapshot could not be loaded: %s' % e)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_link_snapshot(cls):
+        return cls.link_snapshot
+
+    #----------------------------------------------------------------------
+    def _invalidate_link_cache(self, shorthash):
+        key = normalize_shorthash(shorthash)
+        if self.link_cache:
+            self.link_cache.invalidate(key)
+        if self.link_snapshot:
+            self.link_snapshot.mark_stale(shorthash)
+
+    #----------------------------------------------------------------------
+    def _may_shorthash_exist(self, key):
+        """
+        Return False if the shorthash is known to be not in the database,
+        either by the link filter or by the negative cache.
+
+        | **param** key (str) - shorthash as returned by normalize_shorthash()
+        """
+        if self.link_filter and key not in self.link_filter:
+            # the link might have been added by another worker process
+            if not self._refresh_link_filter() or key not in self.link_filter:
+                return False
+        if self.negative_cache and self.negative_cache.get(key):
+            return False
+        return True
+
+    #----------------------------------------------------------------------
+    def _refresh_link_filter(self):
+        """
+        Add the links stored since the last update to the link filter, at
+        most once per link_filter_refresh interval.
+
+        | **return** updated (bool)
+        """
+        with self.link_filter_lock:
+            if time() - self.link_filter.last_update < self.link_filter_refresh:
+                return False
+            self.update_link_filter(self.link_filter)
+            return True
+
+    #----------------------------------------------------------------------
+    def _remember_unknown_shorthash(self, key):
+        if self.link_filter:
+            self.link_filter.count_false_positive()
+        if self.negative_cache:
+            self.negative_cache.set(key, True)
+
+    #----------------------------------------------------------------------
+    def _register_new_shorthash(self, shorthash):
+        key = normalize_shorthash(shorthash)
+        if self.link_filter:
+            self.link_filter.add(key)
+        if self.negative_cache:
+            self.negative_cache.invalidate(key)
+
     #-------------------------------------------------------------------------
     def close(self):
         """
@@ -117,18 +350,11 @@ class YuDatabase(object):
         | **param** url_hash (str)
         | **return** short_hash (str)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_shorthash`
-                         FROM `link`
-                         WHERE `link`.`link_hash` = %s LIMIT 1''', (url_hash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('get_short_for_hash_from_db', '''SELECT `link`.`link_shorthash`
+                     FROM `link`
+                     WHERE `link`.`link_hash` = %s LIMIT 1''', (url_hash))
+        if result:
+            return result[0]
 
     #----------------------------------------------------------------------
     def get_link_from_db_by_complete_hash(self, url_hash):
@@ -138,41 +364,33 @@ class YuDatabase(object):
         | **param** url_hash (str)
         | **return** url (str)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_link`
-                         FROM `link`
-                         WHERE `link`.`link_hash` = %s LIMIT 1''', (url_hash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('get_link_from_db_by_complete_hash', '''SELECT `link`.`link_link`
+                     FROM `link`
+                     WHERE `link`.`link_hash` = %s LIMIT 1''', (url_hash))
+        if result:
+            return result[0]
 
     #-------------------------------------------------------------------
     def get_link_details(self, shorthash):
         """
-        Returns a list with complete details of given link.
-        """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_id`,
-                                     `link`.`link_shorthash`,
-                                     `link`.`link_hash`,
-                                     `link`.`link_link`,
-                                     `link`.`link_comment`,
-                                     `link`.`entry_date`
-                         FROM `link`
-                         WHERE `link`.`link_shorthash` = %s  LIMIT 1 ''', (shorthash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        Returns a list with complete details of given link including the
+        number of redirects and the time of the first and last redirect.
+        The redirect columns are None if there is no counter for the link.
+        """
+        result = self._select('get_link_details', '''SELECT `link`.`link_id`,
+                                 `link`.`link_shorthash`,
+                                 `link`.`link_hash`,
+                                 `link`.`link_link`,
+                                 `link`.`link_comment`,
+                                 `link`.`entry_date`,
+                                 `link_counter`.`clicks`,
+                                 `link_counter`.`first_access`,
+                                 `link_counter`.`last_access`
+                     FROM `link`
+                     LEFT JOIN `link_counter` ON (`link_counter`.`link_id` = `link`.`link_id`)
+                     WHERE `link`.`link_shorthash` = %s  LIMIT 1 ''', (shorthash))
+        if result:
+            return result
 
     #----------------------------------------------------------------------
     def get_link_from_db(self, url_hash):
@@ -182,18 +400,139 @@ class YuDatabase(object):
         | **param** url_hash (str)
         | **return** url (str)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_link`
-                         FROM `link`
-                         WHERE `link`.`link_shorthash` = %s  LIMIT 1 ''', (url_hash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('get_link_from_db', '''SELECT `link`.`link_link`
+                     FROM `link`
+                     WHERE `link`.`link_shorthash` = %s  LIMIT 1 ''', (url_hash))
+        if result:
+            return result[0]
+
+    #-------------------------------------------------------------------
+    def resolve_shorthash(self, shorthash):
+        """
+        Returns everything needed to answer a request for the given
+        shorthash: the link, whether and why it is blocked and whether it
+        has been deleted. Lookups are answered from the link cache if
+        possible, only on a cache miss the database is queried, using a
+        single query.
+
+        | **param** shorthash (str)
+        | **return** resolved_link (ResolvedLink) or None if unknown
+        """
+        key = normalize_shorthash(shorthash)
+        if self.link_cache:
+            cached = self.link_cache.get(key)
+            if cached is not None:
+                return cached
+        if self.link_snapshot:
+            # only links added after the snapshot has been built need a query
+            snapshot_result = self.link_snapshot.lookup(shorthash)
+            if snapshot_result:
+                return ResolvedLink(*snapshot_result)
+        if not self._may_shorthash_exist(key):
+            return None
+        result = self._select('resolve_shorthash', '''SELECT `link`.`link_id`,
+                                 `link`.`link_link`,
+                                 `block`.`block_id` IS NOT NULL,
+                                 `block`.`comment`,
+                                 `link`.`deleted`
+                          FROM `link`
+                          LEFT JOIN `block` ON (`block`.`link_id` = `link`.`link_id`)
+                          WHERE `link`.`link_shorthash` = %s LIMIT 1''', (shorthash,))
+        if not result:
+            self._remember_unknown_shorthash(key)
+            return None
+        link_id, link, blocked, block_reason, deleted = result
+        resolved_link = ResolvedLink(link_id, link, bool(blocked), block_reason, bool(deleted))
+        if self.link_cache:
+            self.link_cache.set(key, resolved_link)
+        return resolved_link
+
+    #-------------------------------------------------------------------
+    def resolve_shorthash_with_clicks(self, shorthash):
+        """
+        Like resolve_shorthash() but also returns the number of redirects
+        of the link, read in the same query. The link cache and snapshot
+        are not used as the number changes with every redirect.
+
+        | **param** shorthash (str)
+        | **return** resolved_link, clicks (tuple(ResolvedLink, int)) or None if unknown
+        """
+        key = normalize_shorthash(shorthash)
+        if not self._may_shorthash_exist(key):
+            return None
+        result = self._select('resolve_shorthash_with_clicks', '''SELECT `link`.`link_id`,
+                                 `link`.`link_link`,
+                                 `block`.`block_id` IS NOT NULL,
+                                 `block`.`comment`,
+                                 `link`.`deleted`,
+                                 `link_counter`.`clicks`
+                          FROM `link`
+                          LEFT JOIN `block` ON (`block`.`link_id` = `link`.`link_id`)
+                          LEFT JOIN `link_counter` ON (`link_counter`.`link_id` = `link`.`link_id`)
+                          WHERE `link`.`link_shorthash` = %s LIMIT 1''', (shorthash,))
+        if not result:
+            self._remember_unknown_shorthash(key)
+            return None
+        link_id, link, blocked, block_reason, deleted, clicks = result
+        resolved_link = ResolvedLink(link_id, link, bool(blocked), block_reason, bool(deleted))
+        if self.link_cache:
+            self.link_cache.set(key, resolved_link)
+        return resolved_link, clicks or 0
+
+    #-------------------------------------------------------------------
+    def get_shorthashes_since(self, link_id, limit):
+        """
+        Returns link ID and shorthash of the links added after the given
+        link ID, ordered by link ID.
+
+        | **param** link_id (int)
+        | **param** limit (int)
+        | **return** links (seq of tuple(int link_id, str shorthash))
+        """
+        return self._select('get_shorthashes_since', '''SELECT `link`.`link_id`, `link`.`link_shorthash`
+                     FROM `link`
+                     WHERE `link`.`link_id` > %s
+                     ORDER BY `link`.`link_id` LIMIT %s''', (link_id, limit), fetch_all=True)
+
+    #-------------------------------------------------------------------
+    def get_links_for_snapshot(self, link_id, limit):
+        """
+        Returns the links added after the given link ID with everything
+        needed to resolve them, ordered by link ID.
+
+        | **param** link_id (int)
+        | **param** limit (int)
+        | **return** links (seq of tuple(link_id, shorthash, link, blocked, block_reason, deleted))
+        """
+        result = self._select('get_links_for_snapshot', '''SELECT `link`.`link_id`,
+                                 `link`.`link_shorthash`,
+                                 `link`.`link_link`,
+                                 `block`.`block_id` IS NOT NULL,
+                                 `block`.`comment`,
+                                 `link`.`deleted`
+                          FROM `link`
+                          LEFT JOIN `block` ON (`block`.`link_id` = `link`.`link_id`)
+                          WHERE `link`.`link_id` > %s
+                          ORDER BY `link`.`link_id` LIMIT %s''', (link_id, limit), fetch_all=True)
+        return result
+
+    #-------------------------------------------------------------------
+    def update_link_filter(self, link_filter, batch_size=10000):
+        """
+        Add all shorthashes added to the database since the filter has
+        been updated the last time to the given link filter.
+
+        | **param** link_filter (YuBloomFilter)
+        | **param** batch_size (int)
+        """
+        while True:
+            links = self.get_shorthashes_since(link_filter.last_link_id, batch_size)
+            for link_id, shorthash in links:
+                link_filter.add(normalize_shorthash(shorthash))
+                link_filter.last_link_id = link_id
+            if len(links) < batch_size:
+                break
+        link_filter.last_update = time()
 
     #-------------------------------------------------------------------
     def is_hash_in_db(self, url_hash):
@@ -204,18 +543,11 @@ class YuDatabase(object):
         | **param** url_hash (str)
         | **return** link_id (int)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_id`
-                         FROM `link`
-                         WHERE `link`.`link_hash` = %s''', (url_hash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('is_hash_in_db', '''SELECT `link`.`link_id`
+                     FROM `link`
+                     WHERE `link`.`link_hash` = %s''', (url_hash))
+        if result:
+            return result[0]
 
     #-------------------------------------------------------------------
     def get_link_creation_timestamp(self, shorthash):
@@ -225,17 +557,9 @@ class YuDatabase(object):
         | **param** shorthash (str)
         | **return** timestamp (datetime)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`entry_date`
-                         FROM `link`
-                         WHERE `link`.`link_shorthash` = %s''', (shorthash))
-            result = cursor.fetchone()
-            cursor.close()
-            return result
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        return self._select('get_link_creation_timestamp', '''SELECT `link`.`entry_date`
+                     FROM `link`
+                     WHERE `link`.`link_shorthash` = %s''', (shorthash))
 
     #-------------------------------------------------------------------
     def is_shorthash_in_db(self, shorthash):
@@ -246,18 +570,11 @@ class YuDatabase(object):
         | **param** shorthash (str)
         | **return** link_id (int)
         """
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `link`.`link_id`
-                         FROM `link`
-                         WHERE `link`.`link_shorthash` = %s''', (shorthash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('is_shorthash_in_db', '''SELECT `link`.`link_id`
+                     FROM `link`
+                     WHERE `link`.`link_shorthash` = %s''', (shorthash))
+        if result:
+            return result[0]
 
     #-------------------------------------------------------------------
     def is_hash_blocked(self, shorthash):
@@ -270,23 +587,16 @@ class YuDatabase(object):
         """
         if not shorthash:
             return None
-        try:
-            cursor = self._get_cursor()
-            cursor.execute('''SELECT `block`.`link_id`,
-                                     `link`.`link_shorthash`,
-                                     `block`.`entry_date`, `comment`
-                              FROM `link`, `block`
-                              WHERE `link`.`link_shorthash` = %s
-                              AND `link`.`link_id` = `block`.`link_id`; ''', (shorthash))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result
-            else:
-                return None
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('is_hash_blocked', '''SELECT `block`.`link_id`,
+                                 `link`.`link_shorthash`,
+                                 `block`.`entry_date`, `comment`
+                          FROM `link`, `block`
+                          WHERE `link`.`link_shorthash` = %s
+                          AND `link`.`link_id` = `block`.`link_id`; ''', (shorthash))
+        if result:
+            return result
+        else:
+            return None
 
     #-------------------------------------------------------------------
     def add_link_to_db(self, url_hash, link):
@@ -301,12 +611,13 @@ class YuDatabase(object):
             short = url_hash[:i]
             try:
                 cursor = self._get_cursor()
-                cursor.execute("""INSERT INTO `link`
+                self._execute(cursor, 'add_link_to_db', """INSERT INTO `link`
                          (`link_shorthash`,`link_hash`,`link_link`)
                          VALUES (%s, %s, %s)""",
                          (short, url_hash, link))
                 self.commit()
                 cursor.close()
+                self._register_new_shorthash(short)
                 return short
             except DatabaseError, e:
                 if e.args and e.args[0] == DUP_ENTRY:
@@ -319,18 +630,23 @@ class YuDatabase(object):
                     raise YuDatabaseError(str(e))
 
     #-------------------------------------------------------------------
-    def add_logentry_to_database(self, shorthash):
+    def add_logentry_to_database(self, link_id):
         """
-        Creates a log entry inside DB for a given hash.
+        Creates a log entry inside DB for a given link.
 
-        | **param** hash (str)
+        | **param** link_id (int)
         """
         try:
             cursor = self._get_cursor()
-            cursor.execute("""INSERT into `access_log` (link_id)
-                SELECT link_id
-                FROM link
-                WHERE link_shorthash = (%s)""", (shorthash,))
+            self._execute(cursor, 'add_logentry_to_database.access_log', """INSERT into `access_log` (link_id)
+                VALUES (%s)""", (link_id,))
+            self._execute(cursor, 'add_logentry_to_database.link_counter', """INSERT INTO `link_counter`
+                                  (`link_id`, `clicks`, `first_access`, `last_access`)
+                              VALUES (%s, 1, NOW(), NOW())
+                              ON DUPLICATE KEY UPDATE
+                                  `clicks` = `clicks` + 1,
+                                  `first_access` = IFNULL(`first_access`, VALUES(`first_access`)),
+                                  `last_access` = VALUES(`last_access`)""", (link_id,))
             self.commit()
             cursor.close()
         except DatabaseError, e:
@@ -338,28 +654,58 @@ class YuDatabase(object):
             raise YuDatabaseError(str(e))
 
     #-------------------------------------------------------------------
-    def add_blockentry(self, shorthash, comment):
+    def add_logentries_to_database(self, clicks):
         """
-        Mark a link as blocked.
+        Creates log entries for a batch of redirects using one multi-row
+        INSERT and updates the per link counters accordingly.
 
-        | **param** shorthash (str) -- short hash of link
-        | **comment** comment (str) -- Reason why link has been blocked
+        | **param** clicks (seq of tuple(int link_id, datetime access_time))
         """
+        counters = dict()
+        for link_id, access_time in clicks:
+            count, first_access, last_access = counters.get(link_id, (0, access_time, access_time))
+            counters[link_id] = (
+                count + 1, min(first_access, access_time), max(last_access, access_time))
+        counter_rows = sorted((link_id,) + counter for link_id, counter in counters.iteritems())
         try:
             cursor = self._get_cursor()
-            cursor.execute("""INSERT INTO block( `link_id` , `comment` )
-                              VALUES (
-                                (
-                                    SELECT `link`.`link_id`
-                                    FROM `link`
-                                    WHERE `link`.`link_shorthash` = %s
-                                ),%s);""" % (shorthash, comment))
+            self._execute(cursor, 'add_logentries_to_database.access_log',
+                          """INSERT INTO `access_log` (`link_id`, `access_time`)
+                             VALUES (%s, %s)""", clicks, many=True)
+            self._execute(cursor, 'add_logentries_to_database.link_counter', """INSERT INTO `link_counter`
+                                      (`link_id`, `clicks`, `first_access`, `last_access`)
+                                  VALUES (%s, %s, %s, %s)
+                                  ON DUPLICATE KEY UPDATE
+                                      `clicks` = `clicks` + VALUES(`clicks`),
+                                      `first_access` = LEAST(
+                                          IFNULL(`first_access`, VALUES(`first_access`)),
+                                          VALUES(`first_access`)),
+                                      `last_access` = GREATEST(
+                                          IFNULL(`last_access`, VALUES(`last_access`)),
+                                          VALUES(`last_access`))""", counter_rows, many=True)
             self.commit()
             cursor.close()
         except DatabaseError, e:
             self.logger.error('Database error: %s' % e, exc_info=True)
             raise YuDatabaseError(str(e))
 
+    #-------------------------------------------------------------------
+    def add_blockentry(self, shorthash, comment):
+        """
+        Mark a link as blocked.
+
+        | **param** shorthash (str) -- short hash of link
+        | **comment** comment (str) -- Reason why link has been blocked
+        """
+        self._modify('add_blockentry', """INSERT INTO block( `link_id` , `comment` )
+                          VALUES (
+                            (
+                                SELECT `link`.`link_id`
+                                FROM `link`
+                                WHERE `link`.`link_shorthash` = %s
+                            ),%s);""", (shorthash, comment))
+        self._invalidate_link_cache(shorthash)
+
     #-------------------------------------------------------------------
     def mark_link_as_deleted(self, shorthash):
         """
@@ -367,165 +713,207 @@ class YuDatabase(object):
 
         | **param** shothash (str)
         """
+        self._modify('mark_link_as_deleted', """UPDATE `link`
+                          SET `link`.`deleted` = 1, `link`.`del_time` = now()
+                          WHERE `link`.`link_shorthash` = %s """, (shorthash,))
+        self._invalidate_link_cache(shorthash)
+
+    #-------------------------------------------------------------------
+    def update_statistics_rollup(self, source, batch_size, delay):
+        """
+        Add the next batch of rows of the given source table ('access_log'
+        or 'link') to the hourly and daily statistics rollups.
+
+        Only rows whose ids have been assigned at least delay seconds ago
+        are processed, so rows of transactions which are not yet committed
+        are not skipped. Neither the time column nor the id sequence tell
+        this: access_log.access_time is the time of the click, which the
+        click writer may insert much later, and ids have gaps. Instead the
+        highest id is noted with the time of the database, once this is
+        older than delay seconds it becomes the limit of the rollup. Rows
+        are only skipped for good if their insert transaction takes longer
+        than delay seconds.
+
+        | **param** source (str)
+        | **param** batch_size (int)
+        | **param** delay (int)
+        | **return** True if rows have been processed (bool)
+        """
+        id_column, time_column, counter_column = ROLLUP_SOURCES[source]
+        names = dict(table=source, id=id_column, time=time_column, counter=counter_column)
         try:
             cursor = self._get_cursor()
-            cursor.execute("""UPDATE `link`
-                              SET `link`.`deleted` ='Y', `link`.`del_time` = now()
-                              WHERE `link`.`link_shorthash` = %s """ % (shorthash,))
+            self._execute(cursor, 'update_statistics_rollup.watermark', '''INSERT IGNORE INTO `stats_watermark` (`source`, `last_id`)
+                              VALUES (%s, 0)''', (source,))
+            # lock the watermark so only one process updates the rollups
+            self._execute(cursor, 'update_statistics_rollup.lock', '''SELECT `last_id`, `safe_id`, `pending_id`,
+                                     `pending_time` IS NULL OR `pending_time` <= NOW() - INTERVAL %s SECOND
+                              FROM `stats_watermark`
+                              WHERE `source` = %s FOR UPDATE''', (delay, source))
+            last_id, safe_id, pending_id, pending_expired = cursor.fetchone()
+            if pending_expired:
+                # all ids up to the highest id noted delay seconds ago are
+                # committed, note the current highest id for the next time
+                safe_id = pending_id
+                self._execute(cursor, 'update_statistics_rollup.max_id', '''SELECT COALESCE(MAX(`%(id)s`), 0)
+                                  FROM `%(table)s`''' % names)
+                pending_id = cursor.fetchone()[0]
+                self._execute(cursor, 'update_statistics_rollup.pending_id', '''UPDATE `stats_watermark`
+                                  SET `safe_id` = %s, `pending_id` = %s, `pending_time` = NOW()
+                                  WHERE `source` = %s''', (safe_id, pending_id, source))
+            # the batch ends at the highest of the next batch_size ids, so
+            # gaps in the id sequence don't stop the watermark
+            self._execute(cursor, 'update_statistics_rollup.upper_id', '''SELECT MAX(`%(id)s`) FROM (
+                                  SELECT `%(id)s` FROM `%(table)s`
+                                  WHERE `%(id)s` > %%s AND `%(id)s` <= %%s
+                                  ORDER BY `%(id)s` LIMIT %%s) AS `batch`''' % names,
+                          (last_id, safe_id, batch_size))
+            upper_id = cursor.fetchone()[0]
+            if upper_id is not None:
+                self._execute(cursor, 'update_statistics_rollup.hourly', '''INSERT INTO `stats_hourly` (`stats_hour`, `%(counter)s`)
+                                  SELECT TIMESTAMP(DATE(`%(time)s`), MAKETIME(HOUR(`%(time)s`), 0, 0)),
+                                         COUNT(`%(id)s`)
+                                  FROM `%(table)s`
+                                  WHERE `%(id)s` > %%s AND `%(id)s` <= %%s
+                                  AND `%(time)s` > '0000-00-00 00:00:00'
+                                  GROUP BY 1
+                                  ON DUPLICATE KEY UPDATE
+                                      `%(counter)s` = `%(counter)s` + VALUES(`%(counter)s`)''' % names,
+                               (last_id, upper_id))
+                self._execute(cursor, 'update_statistics_rollup.daily', '''INSERT INTO `stats_daily` (`stats_day`, `%(counter)s`)
+                                  SELECT DATE(`%(time)s`), COUNT(`%(id)s`)
+                                  FROM `%(table)s`
+                                  WHERE `%(id)s` > %%s AND `%(id)s` <= %%s
+                                  AND `%(time)s` > '0000-00-00 00:00:00'
+                                  GROUP BY 1
+                                  ON DUPLICATE KEY UPDATE
+                                      `%(counter)s` = `%(counter)s` + VALUES(`%(counter)s`)''' % names,
+                               (last_id, upper_id))
+                self._execute(cursor, 'update_statistics_rollup.update_watermark', '''UPDATE `stats_watermark` SET `last_id` = %s
+                                  WHERE `source` = %s''', (upper_id, source))
             self.commit()
             cursor.close()
+            return upper_id is not None
         except DatabaseError, e:
             self.logger.error('Database error: %s' % e, exc_info=True)
             raise YuDatabaseError(str(e))
 
     #-------------------------------------------------------------------
-    def get_statistics_for_hash(self, shorthash):
+    def get_redirect_statistics_for_link(self, link_id):
         """
-        Returns the number of calls for a particular hash
+        Returns number, first and last time of the redirects of a link,
+        aggregated from the access_log table using the index on
+        (link_id, access_time).
 
-        | **param** hash (str)
-        | **return** number of usages (int)
+        | **param** link_id (int)
+        | **return** number of redirects (int), first redirect (datetime),
+        |            last redirect (datetime)
         """
-        try:
-            cursor = self._get_cursor()
-            # Is this real a nice way in terms of memory usage at DB?
-            cursor.execute("""SELECT count(access_time)
-                              FROM access_log left join link on (access_log.link_id = link.link_id)
-                              WHERE link.link_shorthash = (%s);""", (shorthash,))
-            # Is SELECT count(access_time)
-            #    FROM access_log, link
-            #    WHERE access_log.link_id = link.link_id
-            #    AND link.link_shorthash = (%s);
-            # maybe better?
-            result = cursor.fetchone()
-            cursor.close()
-            return result[0]
-        except DatabaseError, e:
-            self.logger.error('Database error: %s' % e, exc_info=True)
-            raise YuDatabaseError(str(e))
+        result = self._select('get_redirect_statistics_for_link',
+                              """SELECT COUNT(`access_time`), MIN(`access_time`), MAX(`access_time`)
+                          FROM `access_log`
+                          WHERE `link_id` = %s;""", (link_id,))
+        return result
 
     #-------------------------------------------------------------------
-    def get_statistics_for_general_redirects(self, time_range):
-        """
-        Returns the number of redirects inside a give time range.
-
-        | **param** time_range (str)
-        | **return** number of redirects (int)
-        """
-        queries = ({
-            'today':        """SELECT CURDATE( ) , count(`access_log_id`)
-                            FROM `access_log`
-                            WHERE date(`access_time`) = CURDATE( );""",
-            'this_year':    """SELECT COUNT(`access_log_id`)
-                            FROM `access_log`
-                            WHERE YEAR(`access_time`) = YEAR(CURDATE());""",
-            'this_week':    """SELECT COUNT(`access_log_id`)
-                            FROM `access_log`
-                            WHERE
-                                WEEK(`access_time`) = WEEK(CURDATE())
-                            AND YEAR(`access_time`) = YEAR(CURDATE());""",
-            'this_month':   """SELECT COUNT(`access_log_id`)
-                            FROM `access_log`
-                            WHERE
-                                MONTH(`access_time`) = MONTH(CURDATE())
-                            AND YEAR(`access_time`) = YEAR(CURDATE());""",
-            'per_week':     """SELECT YEAR(`access_time`), WEEK(`access_time`),
-                            COUNT(`access_log_id`)
-                            FROM `access_log`
-                            GROUP BY YEAR(`access_time`), WEEK(`access_time`);""",
-            'per_hour':     """SELECT HOUR( `access_time` ) , COUNT( `access_log_id` )
-                            FROM `access_log`
-                            WHERE `access_time` > '0000-00-00 00:00:00'
-                            GROUP BY HOUR( `access_time`);""",
-            'per_dow':      """SELECT DAYOFWEEK(`access_time`), COUNT(`access_log_id`)
-                            FROM `access_log`
-                            WHERE `access_time` > '0000-00-00 00:00:00'
-                            GROUP BY DAYOFWEEK(`access_time`);""",
-            'per_dom':      """SELECT DAYOFMONTH(`access_time`), COUNT(`access_log_id`)
-                            FROM `access_log`
-                            WHERE `access_time` > '0000-00-00 00:00:00'
-                            GROUP BY DAYOFMONTH(`access_time`);""",
-            'all':          """SELECT COUNT(`access_log_id`)
-                            FROM `access_log` WHERE 1;"""})
-        try:
-            cursor = self._get_cursor()
-            cursor.execute(queries[time_range])
-            result = cursor.fetchall()
-            cursor.close()
-            if time_range in ('per_week', 'per_hour', 'per_dom', 'per_dow'):
-                return result
+    def get_statistics_for_ranges(self, counter, ranges):
+        """
+        Returns the number of redirects or added links (counter is
+        'redirects' or 'links') for each of the given [start, end) time
+        ranges, computed in a single pass. Ranges on whole days or hours
+        are read from the statistics rollups, any other ranges from the
+        source table using the index on its time column.
+
+        | **param** counter (str)
+        | **param** ranges (dict{str name: tuple(datetime start, datetime end)})
+        | **return** numbers (dict{str name: int number})
+        """
+        if not ranges:
+            return dict()
+        names = list(ranges)
+        bounds = [bound for name in names for bound in ranges[name] if bound is not None]
+        if all(is_whole_day(bound) for bound in bounds):
+            table, column, value = 'stats_daily', 'stats_day', '`%s`' % counter
+        elif all(is_whole_hour(bound) for bound in bounds):
+            table, column, value = 'stats_hourly', 'stats_hour', '`%s`' % counter
+        else:
+            table, column = STATISTICS_SOURCES[counter]
+            value = '1'
+
+        columns = list()
+        params = list()
+        for name in names:
+            conditions = self._get_range_conditions(column, ranges[name], params)
+            if conditions:
+                columns.append('SUM(CASE WHEN %s THEN %s ELSE 0 END)' % (conditions, value))
             else:
-                return result[0]
-        except DatabaseError:
-            return None
-        except KeyError:
-            return None
+                columns.append('SUM(%s)' % value)
+        # restrict the scanned rows to the union of all ranges
+        starts = [ranges[name][0] for name in names]
+        ends = [ranges[name][1] for name in names]
+        where = self._get_range_conditions(
+            column,
+            (None if None in starts else min(starts), None if None in ends else max(ends)),
+            params)
+        query = 'SELECT %s FROM `%s`' % (', '.join(columns), table)
+        if where:
+            query = '%s WHERE %s' % (query, where)
+        result = self._select('get_statistics_for_ranges', query, params)
+        return dict(zip(names, [int(number or 0) for number in result]))
 
     #-------------------------------------------------------------------
-    def get_statistics_for_general_links(self, time_range):
+    def get_statistics_per_period(self, counter, period, start=None, end=None):
         """
-        Returns the number of added links inside a give time range.
+        Returns the number of redirects or added links (counter is
+        'redirects' or 'links') grouped by the given period ('per_week',
+        'per_hour', 'per_dow' or 'per_dom'), optionally only inside the
+        [start, end) time range.
 
-        | **param** time_range (str)
-        | **return** number of new links (int)
+        | **param** counter (str)
+        | **param** period (str)
+        | **param** start (datetime)
+        | **param** end (datetime)
+        | **return** numbers per period (seq of tuple)
         """
-        queries = ({
-            'today':        """SELECT CURDATE() , count(`link_id`)
-                            FROM `link`
-                            WHERE date(`entry_date`) = CURDATE();""",
-            'this_year':    """SELECT count(`link_id`)
-                            FROM `link`
-                            WHERE YEAR(`entry_date`) = YEAR(CURDATE());""",
-            'this_week':    """SELECT COUNT(`link_id`)
-                            FROM `link`
-                            WHERE
-                                YEAR(CURDATE()) = YEAR(`entry_date`)
-                            AND WEEK(CURDATE()) = WEEK(`entry_date`);""",
-            'this_month':   """SELECT COUNT(`link_id`)
-                            FROM `link`
-                            WHERE
-                                YEAR(CURDATE()) = YEAR(`entry_date`)
-                            AND MONTH(CURDATE()) = MONTH(`entry_date`);""",
-            'per_week':     """SELECT YEAR(`entry_date`), WEEK(`entry_date`),
-                            COUNT(`link_id`)
-                            FROM `link`
-                            GROUP BY YEAR(`entry_date`), WEEK(`entry_date`);""",
-            'per_hour':     """SELECT HOUR(`entry_date`) , COUNT(`link_id`)
-                            FROM `link`
-                            WHERE `entry_date` > '0000-00-00 00:00:00'
-                            GROUP BY HOUR(`entry_date`);""",
-            'per_dow':      """SELECT DAYOFWEEK(`entry_date`), COUNT(`link_id`)
-                            FROM `link`
-                            WHERE `entry_date` > '0000-00-00 00:00:00'
-                            GROUP BY DAYOFWEEK(`entry_date`);""",
-            'per_dom':      """SELECT DAYOFMONTH(`entry_date`), COUNT(`link_id`)
-                            FROM `link`
-                            WHERE `entry_date` > '0000-00-00 00:00:00'
-                            GROUP BY DAYOFMONTH(`entry_date`);""",
-            'all':          """SELECT COUNT(`link_id`)
-                            FROM `link` WHERE 1;"""})
         try:
-            cursor = self._get_cursor()
-            cursor.execute(queries[time_range])
-            result = cursor.fetchall()
-            cursor.close()
-            if time_range in ('per_week', 'per_hour', 'per_dom', 'per_dow'):
-                return result
-            else:
-                return result[0]
-        except DatabaseError:
-            return None
+            table, column, grouping = STATISTICS_PERIODS[period]
         except KeyError:
             return None
+        params = list()
+        conditions = self._get_range_conditions(column, (start, end), params)
+        query = 'SELECT %s, CAST(SUM(`%s`) AS UNSIGNED) FROM `%s`' % (grouping, counter, table)
+        if conditions:
+            query = '%s WHERE %s' % (query, conditions)
+        query = '%s GROUP BY %s' % (query, grouping)
+        return self._select('get_statistics_per_period', query, params, fetch_all=True)
+
+    #-------------------------------------------------------------------
+    def _get_range_conditions(self, column, time_range, params):
+        """
+        Build the SQL condition for the [start, end) time range on the
+        given column and append the needed query parameters to params.
+
+        | **param** column (str)
+        | **param** time_range (tuple(datetime start, datetime end))
+        | **param** params (list)
+        | **return** conditions (str)
+        """
+        start, end = time_range
+        conditions = list()
+        if start is not None:
+            conditions.append('`%s` >= %%s' % column)
+            params.append(start)
+        if end is not None:
+            conditions.append('`%s` < %%s' % column)
+            params.append(end)
+        return ' AND '.join(conditions)
 
     #-------------------------------------------------------------------
-    def get_date_of_first_entry(self, stats_type, shorthash=None):
+    def get_date_of_first_entry(self, stats_type):
         """
         Returns the timestampe of first logged link or redirect
 
         | **param** stats_type (str)
-        | **param** shorthash (str) (only needed in combination with
-        |           stats_type == hashredirect
         | **return** timestamp (datetime)
         """
         queries = ({
@@ -534,17 +922,10 @@ class YuDatabase(object):
                                  WHERE `entry_date` > '0000-00-00 00:00:00';""",
             'redirect':       """SELECT MIN(`access_time`)
                                  FROM `access_log`
-                                 WHERE `access_time` > '0000-00-00 00:00:00';""",
-            'hashredirect':   """SELECT MIN(`access_time`)
-                                 FROM `access_log`, `link`
-                                 WHERE `access_log`.`link_id` = `link`.`link_id`
-                                 AND `link`.`link_shorthash` = '%s';"""})
+                                 WHERE `access_time` > '0000-00-00 00:00:00';"""})
         try:
             cursor = self._get_cursor()
-            if stats_type == 'hashredirect':
-                cursor.execute(queries[stats_type] % shorthash)
-            else:
-                cursor.execute(queries[stats_type])
+            self._execute(cursor, 'get_date_of_first_entry.%s' % stats_type, queries[stats_type])
             result = cursor.fetchone()
             cursor.close()
             return result
@@ -554,13 +935,11 @@ class YuDatabase(object):
             return None
 
 #----------------------------------------------------------------------
-    def get_date_of_last_entry(self, stats_type, shorthash=None):
+    def get_date_of_last_entry(self, stats_type):
         """
         Returns the timestampe of last logged link or redirect
 
         | **param** stats_type (str)
-        | **param** shorthash (str) (only needed in combination with
-        |           stats_type == hashredirect
         | **return** timestamp (datetime)
         """
         queries = ({
@@ -569,17 +948,10 @@ class YuDatabase(object):
                                  WHERE `entry_date` > '0000-00-00 00:00:00';""",
             'redirect':       """SELECT MAX(`access_time`)
                                  FROM `access_log`
-                                 WHERE `access_time` > '0000-00-00 00:00:00';""",
-            'hashredirect':   """SELECT MAX(`access_time`)
-                                 FROM `access_log`, `link`
-                                 WHERE `access_log`.`link_id` = `link`.`link_id`
-                                 AND `link`.`link_shorthash` = '%s';"""})
+                                 WHERE `access_time` > '0000-00-00 00:00:00';"""})
         try:
             cursor = self._get_cursor()
-            if stats_type == 'hashredirect':
-                cursor.execute(queries[stats_type] % shorthash)
-            else:
-                cursor.execute(queries[stats_type])
+            self._execute(cursor, 'get_date_of_last_entry.%s' % stats_type, queries[stats_type])
             result = cursor.fetchone()
             cursor.close()
             return result
@@ -22,8 +22,29 @@
 
 from MySQLdb import OperationalError, connect
 from MySQLdb.constants.CR import SERVER_GONE_ERROR, SERVER_LOST
+from sqlalchemy.exc import TimeoutError
 from sqlalchemy.pool import QueuePool
+from threading import Lock, local
+from time import time
 from yaturl import config
+from yaturl.helpers.histogram import LATENCY_BUCKETS, YuHistogram, format_prometheus_histogram
+
+
+# SQLAlchemy 0.7 renamed do_get() and create_connection() of the pool
+# to _do_get() and _create_connection()
+if hasattr(QueuePool, '_do_get'):
+    QUEUE_POOL_DO_GET = QueuePool._do_get
+    QUEUE_POOL_CREATE_CONNECTION = QueuePool._create_connection
+else:
+    QUEUE_POOL_DO_GET = QueuePool.do_get
+    QUEUE_POOL_CREATE_CONNECTION = QueuePool.create_connection
+# SQLAlchemy 1.0 and newer count a new connection in _overflow before
+# creating it, older versions after creating it, holding _overflow_lock
+OVERFLOW_COUNTED_BEFORE_CREATE = hasattr(QueuePool, '_inc_overflow')
+
+# waiting for an idle connection and ping() usually take far less than
+# a millisecond, so the buckets start lower than for request latencies
+POOL_LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025) + LATENCY_BUCKETS
 
 
 ########################################################################
@@ -57,11 +78,54 @@ class FreshConnectionQueuePool(QueuePool):
     """
     Before returning any connection from the pool, execute a ping()
     on the connection to verify it's still working and not timed out or whatever.
+
+    The time threads wait for a connection and the time of the ping()
+    are recorded in histograms, reconnects and created connections are
+    counted to size pool_size and max_overflow.
     """
 
+    #----------------------------------------------------------------------
+    def __init__(self, creator, **kwargs):
+        QueuePool.__init__(self, creator, **kwargs)
+        self._wait_histogram = YuHistogram(POOL_LATENCY_BUCKETS)
+        self._ping_histogram = YuHistogram(POOL_LATENCY_BUCKETS)
+        self._statistics_lock = Lock()
+        # per thread: inside do_get(), connection created by this checkout
+        # and whether it exceeds pool_size
+        self._checkout_state = local()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._connections = 0
+        self._overflow_connections = 0
+        self._reconnects = 0
+
     #----------------------------------------------------------------------
     def do_get(self):
-        connection = QueuePool.do_get(self)
+        checkout_state = self._checkout_state
+        if getattr(checkout_state, 'active', False):
+            # QueuePool.do_get() retries by calling do_get() again, the
+            # outer call pings the connection and counts the checkout
+            return QUEUE_POOL_DO_GET(self)
+        checkout_state.active = True
+        checkout_state.created = False
+        checkout_state.overflow = False
+        start = time()
+        try:
+            connection = QUEUE_POOL_DO_GET(self)
+        except TimeoutError:
+            with self._statistics_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            checkout_state.active = False
+        ping_start = time()
+        self._wait_histogram.observe(ping_start - start)
+        with self._statistics_lock:
+            self._checkouts += 1
+            if checkout_state.created:
+                self._connections += 1
+                if checkout_state.overflow:
+                    self._overflow_connections += 1
         try:
             self._ping_connection(connection)
         except OperationalError, e:
@@ -69,10 +133,40 @@ class FreshConnectionQueuePool(QueuePool):
                 self._establish_new_connection(connection, e)
             else:
                 raise
+        else:
+            self._ping_histogram.observe(time() - ping_start)
+        return connection
+
+    _do_get = do_get
+
+    #----------------------------------------------------------------------
+    def create_connection(self):
+        if not OVERFLOW_COUNTED_BEFORE_CREATE:
+            # called by QueuePool.do_get() with _overflow_lock held, the
+            # connection is added to _overflow afterwards
+            self._checkout_state.overflow = self._overflow >= 0
+        connection = QUEUE_POOL_CREATE_CONNECTION(self)
+        # counted by do_get() once the checkout succeeded
+        self._checkout_state.created = True
         return connection
 
+    _create_connection = create_connection
+
+    #----------------------------------------------------------------------
+    def _inc_overflow(self):
+        # QueuePool._inc_overflow() of SQLAlchemy 1.0 and newer, noting under
+        # _overflow_lock whether the connection to be created exceeds pool_size
+        with self._overflow_lock:
+            if self._max_overflow > -1 and self._overflow >= self._max_overflow:
+                return False
+            self._overflow += 1
+            self._checkout_state.overflow = self._overflow > 0
+            return True
+
     #----------------------------------------------------------------------
     def _establish_new_connection(self, connection, e=None):
+        with self._statistics_lock:
+            self._reconnects += 1
         connection.invalidate(e)
         connection.get_connection()
 
@@ -83,6 +177,80 @@ class FreshConnectionQueuePool(QueuePool):
         else:
             raise OperationalError((SERVER_GONE_ERROR, 'Connection lost'))
 
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the counters and the current usage of the pool
+
+        | **return** statistics (dict{str name: int value})
+        """
+        with self._statistics_lock:
+            statistics = dict(
+                checkouts=self._checkouts,
+                timeouts=self._timeouts,
+                connections=self._connections,
+                overflow_connections=self._overflow_connections,
+                reconnects=self._reconnects)
+        statistics.update(
+            size=self.size(),
+            checked_in=self.checkedin(),
+            checked_out=self.checkedout(),
+            overflow=max(0, self.overflow()))
+        return statistics
+
+    #----------------------------------------------------------------------
+    def get_wait_snapshot(self):
+        """
+        | **return** snapshot (HistogramSnapshot) - time waited for a connection
+        """
+        return self._wait_histogram.get_snapshot()
+
+    #----------------------------------------------------------------------
+    def get_ping_snapshot(self):
+        """
+        | **return** snapshot (HistogramSnapshot) - time of ping() on checkout
+        """
+        return self._ping_histogram.get_snapshot()
+
+    #----------------------------------------------------------------------
+    def format_prometheus(self):
+        """
+        Return the statistics in the Prometheus text format
+
+        | **return** lines (list of str)
+        """
+        statistics = self.get_statistics()
+        lines = list()
+        for metric, key, metric_type, description in (
+                ('yaturl_db_pool_checkouts_total', 'checkouts', 'counter',
+                 'Connections taken from the pool.'),
+                ('yaturl_db_pool_timeouts_total', 'timeouts', 'counter',
+                 'Checkouts failed because no connection became available in time.'),
+                ('yaturl_db_pool_connections_total', 'connections', 'counter',
+                 'Connections created by the pool.'),
+                ('yaturl_db_pool_overflow_connections_total', 'overflow_connections', 'counter',
+                 'Connections created beyond pool_size.'),
+                ('yaturl_db_pool_reconnects_total', 'reconnects', 'counter',
+                 'Connections re-established because ping() failed.'),
+                ('yaturl_db_pool_checked_out', 'checked_out', 'gauge',
+                 'Connections currently in use.'),
+                ('yaturl_db_pool_overflow', 'overflow', 'gauge',
+                 'Open connections beyond pool_size.')):
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s %s' % (metric, metric_type))
+            lines.append('%s %d' % (metric, statistics[key]))
+        lines.extend([
+            '# HELP yaturl_db_pool_wait_seconds Time spent waiting for a connection from the pool.',
+            '# TYPE yaturl_db_pool_wait_seconds histogram'])
+        lines.extend(format_prometheus_histogram(
+            'yaturl_db_pool_wait_seconds', '', self.get_wait_snapshot()))
+        lines.extend([
+            '# HELP yaturl_db_pool_ping_seconds Time of ping() on connections taken from the pool.',
+            '# TYPE yaturl_db_pool_ping_seconds histogram'])
+        lines.extend(format_prometheus_histogram(
+            'yaturl_db_pool_ping_seconds', '', self.get_ping_snapshot()))
+        return lines
+
 
 #----------------------------------------------------------------------
 def factor_database_connection_pool():
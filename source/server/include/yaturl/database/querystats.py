@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from threading import Lock
+from yaturl import config
+from yaturl.helpers.histogram import YuHistogram, format_prometheus_histogram
+from yaturl.helpers.logger import get_slow_query_logger
+
+
+# maximum length of the parameters in the slow query log
+MAX_PARAMS_LENGTH = 1000
+
+
+########################################################################
+class YuQueryCounters(object):
+    """
+    Counters of the queries with the same name
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.lock = Lock()
+        self.histogram = YuHistogram()
+        self.queries = 0
+        self.errors = 0
+        self.rows = 0
+        self.slow = 0
+        self.max_time = 0.0
+
+
+########################################################################
+class YuQueryStatistics(object):
+    """
+    Latency and number of rows of the database queries by name, queries
+    taking longer than slow_query_threshold are written to the slow query
+    log with their parameters.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, slow_query_threshold):
+        self._slow_query_threshold = slow_query_threshold
+        self._slow_query_logger = get_slow_query_logger()
+        # name => YuQueryCounters
+        self._counters = dict()
+        # only held to add counters
+        self._lock = Lock()
+
+    #----------------------------------------------------------------------
+    def record(self, name, query, params, duration, rows, failed=False):
+        """
+        Count an executed query
+
+        | **param** name (str) - name of the query, e.g. the method executing it
+        | **param** query (str)
+        | **param** params (seq of mixed)
+        | **param** duration (float) - in seconds
+        | **param** rows (int) - number of rows returned or affected
+        | **param** failed (bool)
+        """
+        counters = self._counters.get(name)
+        if counters is None:
+            with self._lock:
+                counters = self._counters.setdefault(name, YuQueryCounters())
+        counters.histogram.observe(duration)
+        slow = duration >= self._slow_query_threshold
+        with counters.lock:
+            counters.queries += 1
+            if failed:
+                counters.errors += 1
+            elif rows > 0:
+                counters.rows += rows
+            if slow:
+                counters.slow += 1
+            counters.max_time = max(counters.max_time, duration)
+        if slow:
+            self._log_slow_query(name, query, params, duration, rows, failed)
+
+    #----------------------------------------------------------------------
+    def _log_slow_query(self, name, query, params, duration, rows, failed):
+        formatted_params = repr(params)
+        if len(formatted_params) > MAX_PARAMS_LENGTH:
+            formatted_params = '%s...' % formatted_params[:MAX_PARAMS_LENGTH]
+        self._slow_query_logger.warn(
+            u'%s: %0.3fs, %s, query: %s, parameters: %s' % (
+                name, duration, 'failed' if failed else '%d rows' % rows,
+                ' '.join(query.split()), formatted_params))
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the aggregated counters of each query name
+
+        | **return** statistics (list of tuple(str name, dict{str name: mixed value}, HistogramSnapshot))
+        """
+        with self._lock:
+            counters_by_name = sorted(self._counters.items())
+        statistics = list()
+        for name, counters in counters_by_name:
+            with counters.lock:
+                values = dict(
+                    queries=counters.queries,
+                    errors=counters.errors,
+                    rows=counters.rows,
+                    slow=counters.slow,
+                    max_time=counters.max_time)
+            statistics.append((name, values, counters.histogram.get_snapshot()))
+        return statistics
+
+    #----------------------------------------------------------------------
+    def format_prometheus(self):
+        """
+        Return the statistics in the Prometheus text format
+
+        | **return** lines (list of str)
+        """
+        statistics = self.get_statistics()
+        lines = list()
+        for metric, key, description in (
+                ('yaturl_db_query_rows_total', 'rows', 'Rows returned or affected by database queries.'),
+                ('yaturl_db_query_errors_total', 'errors', 'Failed database queries.'),
+                ('yaturl_db_slow_queries_total', 'slow', 'Database queries slower than the threshold.')):
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s counter' % metric)
+            for name, values, _ in statistics:
+                lines.append('%s{query="%s"} %d' % (metric, name, values[key]))
+        lines.extend([
+            '# HELP yaturl_db_query_duration_seconds Time spent executing database queries.',
+            '# TYPE yaturl_db_query_duration_seconds histogram'])
+        for name, _, snapshot in statistics:
+            lines.extend(format_prometheus_histogram(
+                'yaturl_db_query_duration_seconds', 'query="%s"' % name, snapshot))
+        return lines
+
+
+#----------------------------------------------------------------------
+def factor_query_statistics():
+    # configured in milliseconds
+    slow_query_threshold = config.getint('database', 'slow_query_threshold') / 1000.0
+
+    return YuQueryStatistics(slow_query_threshold)
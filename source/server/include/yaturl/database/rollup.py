@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from threading import Event
+from yaturl import config
+from yaturl.database.database import YuDatabase, ROLLUP_SOURCES
+from yaturl.database.error import YuDatabaseError
+from yaturl.helpers.logger import get_logger
+
+
+########################################################################
+class YuStatsRollup(object):
+    """
+    Background job which regularly adds new rows of access_log and link
+    to the hourly and daily statistics rollup tables, starting from the
+    watermark of its last run.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self._interval = config.getint('stats', 'rollup_interval')
+        self._batch_size = config.getint('stats', 'rollup_batch_size')
+        self._delay = config.getint('stats', 'rollup_delay')
+        self._stopped = Event()
+        self._db = YuDatabase()
+        self._logger = get_logger()
+
+    #----------------------------------------------------------------------
+    def _update_rollups(self):
+        for source in ROLLUP_SOURCES:
+            try:
+                # process batches until we caught up
+                while not self._stopped.isSet():
+                    if not self._db.update_statistics_rollup(source, self._batch_size, self._delay):
+                        break
+            except YuDatabaseError:
+                # already logged, just try again next time
+                pass
+            finally:
+                self._db.close()
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'Statistics Rollup started')
+        while not self._stopped.isSet():
+            self._update_rollups()
+            self._stopped.wait(self._interval)
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        self._logger.debug(u'Statistics Rollup stopping')
+        self._stopped.set()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from mmap import mmap, ACCESS_READ
+from shutil import copyfileobj
+from struct import Struct
+from tempfile import TemporaryFile
+from threading import Lock
+from time import time
+from yaturl.helpers.shorthash import normalize_shorthash
+import os
+
+
+# file layout: header, records sorted by the normalized shorthash, data
+# area with the UTF-8 encoded link and block reason of each record
+SNAPSHOT_MAGIC = 'YUSNAP02'
+# magic, creation time, number of records, highest link ID
+HEADER = Struct('<8sdQQ')
+# shorthash, flags, link ID, data offset, link length, block reason length
+RECORD = Struct('<25sBQQII')
+SHORTHASH_LENGTH = 25
+FLAG_BLOCKED = 1
+FLAG_DELETED = 2
+
+
+########################################################################
+class YuLinkSnapshot(object):
+    """
+    Read-only view on a link snapshot file created by build_snapshot().
+    The file is memory-mapped, so all processes share the same pages, and
+    shorthashes are looked up by binary search.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, path, reload_interval):
+        self._path = path
+        self._reload_interval = reload_interval
+        self._lock = Lock()
+        # (mmap, created, number of records, highest link ID, file stat key)
+        self._state = None
+        self._next_reload_check = 0
+        # shorthash => time it has been blocked or deleted
+        self._stale = dict()
+        self._hits = 0
+        self._misses = 0
+        self._load()
+
+    #----------------------------------------------------------------------
+    def _load(self):
+        file_h = open(self._path, 'rb')
+        try:
+            stat = os.fstat(file_h.fileno())
+            data = mmap(file_h.fileno(), 0, access=ACCESS_READ)
+        finally:
+            file_h.close()
+        magic, created, count, max_link_id = HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(u'"%s" is not a link snapshot' % self._path)
+        # the previous mapping is closed once no lookup uses it anymore
+        self._state = (data, created, count, max_link_id, (stat.st_ino, stat.st_mtime))
+
+    #----------------------------------------------------------------------
+    def reload_if_changed(self):
+        """
+        Map the snapshot file again if it has been replaced by a newer one.
+        The file is checked at most every reload_interval seconds.
+        """
+        now = time()
+        if now < self._next_reload_check:
+            return
+        with self._lock:
+            if now < self._next_reload_check:
+                return
+            self._next_reload_check = now + self._reload_interval
+            try:
+                stat = os.stat(self._path)
+            except OSError:
+                return
+            if (stat.st_ino, stat.st_mtime) != self._state[4]:
+                self._load()
+
+    #----------------------------------------------------------------------
+    def mark_stale(self, shorthash):
+        """
+        Ignore the snapshot record of the given shorthash until a snapshot
+        created after now has been loaded, e.g. because the link has been
+        blocked or deleted.
+
+        | **param** shorthash (str)
+        """
+        with self._lock:
+            self._stale[normalize_shorthash(shorthash)] = time()
+
+    #----------------------------------------------------------------------
+    def lookup(self, shorthash):
+        """
+        Find the given shorthash in the snapshot, ignoring its case like
+        the link table does.
+
+        | **param** shorthash (str)
+        | **return** link_id, link, blocked, block_reason, deleted (tuple) or None
+        """
+        self.reload_if_changed()
+        data, created, count, _, _ = self._state
+        shorthash = normalize_shorthash(shorthash)
+        stale_since = self._stale.get(shorthash)
+        if stale_since is not None and stale_since >= created:
+            return None
+        key = shorthash.encode('utf-8')[:SHORTHASH_LENGTH].ljust(SHORTHASH_LENGTH, '\0')
+        low = 0
+        high = count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            record_key = data[offset:offset + SHORTHASH_LENGTH]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                self._hits += 1
+                return self._read_record(data, offset)
+        self._misses += 1
+        return None
+
+    #----------------------------------------------------------------------
+    def _read_record(self, data, offset):
+        _, flags, link_id, data_offset, link_length, reason_length = \
+            RECORD.unpack_from(data, offset)
+        link = data[data_offset:data_offset + link_length].decode('utf-8')
+        if flags & FLAG_BLOCKED:
+            reason_start = data_offset + link_length
+            block_reason = data[reason_start:reason_start + reason_length].decode('utf-8')
+        else:
+            block_reason = None
+        return (link_id, link, bool(flags & FLAG_BLOCKED), block_reason,
+                bool(flags & FLAG_DELETED))
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return age, size and usage counters of the snapshot
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        _, created, count, max_link_id, _ = self._state
+        lookups = self._hits + self._misses
+        return dict(
+            entries=count,
+            max_link_id=max_link_id,
+            age=time() - created,
+            hits=self._hits,
+            misses=self._misses,
+            hit_ratio=float(self._hits) / lookups if lookups else 0.0)
+
+
+#----------------------------------------------------------------------
+def build_snapshot(database, path, batch_size=10000):
+    """
+    Dump all links from the database into a snapshot file. The file is
+    written next to the target and then renamed, so running services
+    never see a partially written snapshot.
+
+    | **param** database (YuDatabase)
+    | **param** path (str)
+    | **param** batch_size (int)
+    | **return** number of links (int)
+    """
+    created = time()
+    records = list()
+    max_link_id = 0
+    data_file = TemporaryFile()
+    data_size = 0
+    try:
+        while True:
+            links = database.get_links_for_snapshot(max_link_id, batch_size)
+            for link_id, shorthash, link, blocked, block_reason, deleted in links:
+                link = link.encode('utf-8')
+                block_reason = (block_reason or u'').encode('utf-8') if blocked else ''
+                flags = (FLAG_BLOCKED if blocked else 0) | (FLAG_DELETED if deleted else 0)
+                records.append((
+                    normalize_shorthash(shorthash).encode('utf-8')[:SHORTHASH_LENGTH],
+                    flags, link_id, data_size,
+                    len(link), len(block_reason)))
+                data_file.write(link)
+                data_file.write(block_reason)
+                data_size += len(link) + len(block_reason)
+                max_link_id = link_id
+            if len(links) < batch_size:
+                break
+        records.sort()
+
+        data_start = HEADER.size + len(records) * RECORD.size
+        temp_path = '%s.tmp' % path
+        snapshot_file = open(temp_path, 'wb')
+        try:
+            snapshot_file.write(HEADER.pack(SNAPSHOT_MAGIC, created, len(records), max_link_id))
+            for shorthash, flags, link_id, data_offset, link_length, reason_length in records:
+                snapshot_file.write(RECORD.pack(
+                    shorthash, flags, link_id, data_start + data_offset, link_length,
+                    reason_length))
+            data_file.seek(0)
+            copyfileobj(data_file, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        finally:
+            snapshot_file.close()
+        os.rename(temp_path, path)
+    finally:
+        data_file.close()
+    return len(records)
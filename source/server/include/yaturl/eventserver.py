@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from collections import deque
+from cStringIO import StringIO
+from time import time
+from yaturl.database.clickwriter import YuClickWriter
+from yaturl.database.database import YuDatabase
+from yaturl.helpers.accesslog import YuAccessLogWriter
+from yaturl.helpers.path import sanitize_path
+from yaturl.helpers.shorthash import normalize_shorthash
+from yaturl.helpers.template import YuTemplateCache
+from yaturl.requesthandler import YuRequestHandler
+from yaturl.router import YuRouter
+from yaturl.server import YuServer, RESPONSE_503
+from yaturl.staticfiles import YuStaticFileCache
+import errno
+import re
+import select
+import socket
+
+
+# size limits of the request head and body, larger requests are rejected
+MAX_HEAD_SIZE = 65536
+MAX_BODY_SIZE = 1024 * 1024
+RECEIVE_SIZE = 16384
+HEAD_END = '\r\n\r\n'
+CONTENT_LENGTH = re.compile(r'^content-length:[ \t]*(\d+)[ \t]*\r?$', re.IGNORECASE | re.MULTILINE)
+RESPONSE_413 = 'HTTP/1.0 413 Request Entity Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+RETRY_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+########################################################################
+class YuEventConnection(object):
+    """
+    State of a client connection handled by the event loop
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, sock, client_address):
+        self.socket = sock
+        self.fd = sock.fileno()
+        self.client_address = client_address
+        self.input = ''
+        self.output = ''
+        self.output_offset = 0
+        self.close_after_output = False
+        # a request is being processed, by the loop or a worker
+        self.processing = False
+        self.closed = False
+        self.handled_requests = 0
+        # large static file to be sent after the output buffer
+        self.file_sender = None
+        self.last_activity = time()
+
+    #----------------------------------------------------------------------
+    def pop_request(self):
+        """
+        Remove the first complete request from the input buffer
+
+        | **return** request (str) or None if no request is complete yet
+        """
+        head_end = self.input.find(HEAD_END)
+        if head_end < 0:
+            return None
+        request_end = head_end + len(HEAD_END)
+        match = CONTENT_LENGTH.search(self.input, 0, head_end + 2)
+        if match:
+            request_end += int(match.group(1))
+        if len(self.input) < request_end:
+            return None
+        request = self.input[:request_end]
+        self.input = self.input[request_end:]
+        return request
+
+    #----------------------------------------------------------------------
+    def is_request_too_large(self):
+        """
+        Check whether the incomplete request in the input buffer already
+        exceeds the size limits
+
+        | **return** too_large (bool)
+        """
+        head_end = self.input.find(HEAD_END)
+        if head_end < 0:
+            return len(self.input) > MAX_HEAD_SIZE
+        match = CONTENT_LENGTH.search(self.input, 0, head_end + 2)
+        return match is not None and int(match.group(1)) > MAX_BODY_SIZE
+
+
+########################################################################
+class YuBufferedRequestHandler(YuRequestHandler):
+    """
+    Request handler processing exactly one request which has been read
+    completely by the event loop, the response is collected in memory
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, request_data, connection, server, resolved_link=None):
+        self._request_data = request_data
+        self._connection = connection
+        # link of a redirect taken from the link cache by the event loop
+        self._resolved_link = resolved_link
+        self.file_sender = None
+        YuRequestHandler.__init__(self, connection.socket, connection.client_address, server)
+
+    #----------------------------------------------------------------------
+    def setup(self):
+        self.connection = self.request
+        self.rfile = StringIO(self._request_data)
+        self.wfile = StringIO()
+
+    #----------------------------------------------------------------------
+    def handle(self):
+        # count the requests of the connection for keep_alive_max_requests
+        self.handled_requests = self._connection.handled_requests
+        self.handle_one_request()
+
+    #----------------------------------------------------------------------
+    def finish(self):
+        # the response is read from wfile by the event loop
+        pass
+
+    #----------------------------------------------------------------------
+    def _send_file_content(self, file_sender):
+        # the file is sent by the event loop when the socket is writable
+        self.file_sender = file_sender
+
+    #----------------------------------------------------------------------
+    def _lookup_shorthash(self, shorthash):
+        # the cache entry might have expired meanwhile, don't query the
+        # database in the event loop
+        if self._resolved_link is not None:
+            return self._resolved_link
+        return YuRequestHandler._lookup_shorthash(self, shorthash)
+
+
+########################################################################
+class YuEventServer(YuServer):
+    """
+    HTTP server multiplexing all client connections in one event loop
+    using epoll. Complete requests are handed over to the worker pool,
+    only redirects of cached links are answered by the loop itself, so
+    idle and slow connections don't occupy a worker.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, shutdown_event):
+        YuServer.__init__(self, shutdown_event)
+        # fd => YuEventConnection
+        self._connections = dict()
+        # responses of the workers to be sent by the loop
+        self._completed = deque()
+        self._loop_requests = 0
+        self._worker_requests = 0
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'HTTP Server started (event loop)')
+        self._worker_pool.start()
+        self._setup_poller()
+        next_idle_check = 0
+        while not self._shutdown.isSet():
+            # without open connections there are no timeouts to check
+            timeout = 1 if self._connections else None
+            for fd, event in self._poller.poll(timeout):
+                if fd == self.socket.fileno():
+                    self._accept_requests()
+                elif fd == self._wakeup_read:
+                    self._clear_wakeup_pipe()
+                    self._send_completed_responses()
+                else:
+                    connection = self._connections.get(fd)
+                    if connection:
+                        self._handle_event(connection, event)
+            now = time()
+            if now >= next_idle_check:
+                self._close_idle_connections(now)
+                next_idle_check = now + 1
+        self._shutdown_event_loop()
+
+    #----------------------------------------------------------------------
+    def _shutdown_event_loop(self):
+        self._poller.unregister(self.socket.fileno())
+        # finish requests already handed over to the workers
+        self._worker_pool.shutdown()
+        self._send_completed_responses()
+        for connection in self._connections.values():
+            if connection.output:
+                # last try to deliver pending responses
+                try:
+                    connection.socket.settimeout(1)
+                    connection.socket.sendall(buffer(connection.output, connection.output_offset))
+                except socket.error:
+                    pass
+            self._close(connection)
+        self._close_wakeup_pipe()
+
+    #----------------------------------------------------------------------
+    def process_request(self, request, client_address):
+        """
+        Add the accepted connection to the event loop
+        """
+        request.setblocking(0)
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = YuEventConnection(request, client_address)
+        self._connections[connection.fd] = connection
+        self._poller.register(connection.fd, select.POLLIN)
+
+    #----------------------------------------------------------------------
+    def _handle_event(self, connection, event):
+        if event & select.POLLIN:
+            self._read(connection)
+        elif event & (select.POLLERR | select.POLLHUP):
+            self._close(connection)
+            return
+        if event & select.POLLOUT and not connection.closed:
+            self._write(connection)
+
+    #----------------------------------------------------------------------
+    def _read(self, connection):
+        try:
+            data = connection.socket.recv(RECEIVE_SIZE)
+        except socket.error, e:
+            if e.args[0] not in RETRY_ERRORS:
+                self._close(connection)
+            return
+        if not data:
+            self._close(connection)
+            return
+        connection.input += data
+        connection.last_activity = time()
+        self._process_input(connection)
+
+    #----------------------------------------------------------------------
+    def _process_input(self, connection):
+        if connection.processing or connection.output:
+            # one request at a time, pipelined requests wait in the buffer
+            return
+        request_data = connection.pop_request()
+        if request_data is None:
+            if connection.is_request_too_large():
+                self._send(connection, RESPONSE_413, True)
+            return
+        connection.processing = True
+        # stop reading until the response has been sent
+        self._poller.modify(connection.fd, 0)
+        non_blocking, resolved_link = self._can_process_in_loop(request_data)
+        if non_blocking:
+            self._loop_requests += 1
+            response, close, file_sender = self._process_request(
+                connection, request_data, resolved_link)
+            self._send(connection, response, close, file_sender)
+        elif not self._worker_pool.submit(self._process_buffered_request, connection, request_data):
+            self._send(connection, RESPONSE_503, True)
+
+    #----------------------------------------------------------------------
+    def _can_process_in_loop(self, request_data):
+        """
+        Check whether the request can be answered without blocking: a
+        static file, the homepage or a redirect of a cached link whose
+        click is queued, and the access log doesn't block. The cached link
+        is returned to be used by the request handler, so it can't expire
+        in between.
+
+        | **param** request_data (str)
+        | **return** non_blocking, resolved_link (tuple(bool, ResolvedLink))
+        """
+        access_log_writer = YuAccessLogWriter.get_access_log_writer()
+        if access_log_writer and access_log_writer.may_block():
+            return False, None
+        request_line = request_data[:request_data.find('\r\n')].split()
+        if len(request_line) != 3 or request_line[0] not in ('GET', 'HEAD'):
+            return False, None
+        path = request_line[1]
+        static_file_cache = YuStaticFileCache.get_static_file_cache()
+        if static_file_cache and static_file_cache.get(sanitize_path(path)) is not None:
+            return True, None
+        route, argument = YuRouter.get_router().match('GET', path)
+        if route.name == 'homepage':
+            # the pre-rendered homepage
+            return YuTemplateCache.get_template_cache() is not None, None
+        if route.name != 'redirect':
+            return False, None
+        link_cache = YuDatabase.get_link_cache()
+        if not link_cache or not YuClickWriter.get_click_writer() or not argument.isalnum():
+            return False, None
+        # a miss is counted by the worker looking the link up again
+        resolved_link = link_cache.get(normalize_shorthash(argument), count_miss=False)
+        return resolved_link is not None, resolved_link
+
+    #----------------------------------------------------------------------
+    def _process_request(self, connection, request_data, resolved_link=None):
+        """
+        Let the request handler process the given request
+
+        | **param** connection (YuEventConnection)
+        | **param** request_data (str)
+        | **param** resolved_link (ResolvedLink) - cached link of a redirect
+        | **return** response, close_connection, file_sender (tuple(str, bool, YuFileSender))
+        """
+        try:
+            handler = YuBufferedRequestHandler(request_data, connection, self, resolved_link)
+            return handler.wfile.getvalue(), bool(handler.close_connection), handler.file_sender
+        except Exception:
+            self.handle_error(connection.socket, connection.client_address)
+            return '', True, None
+
+    #----------------------------------------------------------------------
+    def _process_buffered_request(self, connection, request_data):
+        response = self._process_request(connection, request_data)
+        self._completed.append((connection, response))
+        self._wakeup()
+
+    #----------------------------------------------------------------------
+    def _send_completed_responses(self):
+        while self._completed:
+            connection, (response, close, file_sender) = self._completed.popleft()
+            self._worker_requests += 1
+            if not connection.closed:
+                self._send(connection, response, close, file_sender)
+            elif file_sender:
+                file_sender.close()
+
+    #----------------------------------------------------------------------
+    def _send(self, connection, response, close, file_sender=None):
+        connection.processing = False
+        connection.handled_requests += 1
+        connection.output = response
+        connection.output_offset = 0
+        connection.close_after_output = close
+        connection.file_sender = file_sender
+        self._write(connection)
+
+    #----------------------------------------------------------------------
+    def _write(self, connection):
+        if connection.output_offset < len(connection.output):
+            try:
+                sent = connection.socket.send(buffer(connection.output, connection.output_offset))
+            except socket.error, e:
+                if e.args[0] not in RETRY_ERRORS:
+                    self._close(connection)
+                    return
+                sent = 0
+            connection.output_offset += sent
+            connection.last_activity = time()
+            if connection.output_offset < len(connection.output):
+                self._poller.modify(connection.fd, select.POLLOUT)
+                return
+        if connection.file_sender and not self._write_file(connection):
+            return
+        connection.output = ''
+        connection.output_offset = 0
+        if connection.close_after_output:
+            self._close(connection)
+            return
+        self._poller.modify(connection.fd, select.POLLIN)
+        # the client might have sent the next request already
+        self._process_input(connection)
+
+    #----------------------------------------------------------------------
+    def _write_file(self, connection):
+        """
+        Send the large static file of the response as far as the socket
+        accepts it
+
+        | **param** connection (YuEventConnection)
+        | **return** done (bool) - False if the file is not sent completely yet
+        """
+        file_sender = connection.file_sender
+        try:
+            while not file_sender.is_done():
+                if not file_sender.send(connection.socket):
+                    self._poller.modify(connection.fd, select.POLLOUT)
+                    return False
+                connection.last_activity = time()
+        except (socket.error, IOError, OSError), e:
+            self._logger.warn(u'Sending static file failed: %s' % e)
+            self._close(connection)
+            return False
+        file_sender.close()
+        connection.file_sender = None
+        return True
+
+    #----------------------------------------------------------------------
+    def _close_idle_connections(self, now):
+        timeout = self.keep_alive_timeout
+        for connection in self._connections.values():
+            if not connection.processing and now - connection.last_activity > timeout:
+                self._close(connection)
+
+    #----------------------------------------------------------------------
+    def _close(self, connection):
+        if connection.closed:
+            return
+        connection.closed = True
+        del self._connections[connection.fd]
+        if connection.file_sender:
+            connection.file_sender.close()
+            connection.file_sender = None
+        try:
+            self._poller.unregister(connection.fd)
+        except (IOError, KeyError):
+            pass
+        try:
+            connection.socket.close()
+        except socket.error:
+            pass
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number of open connections and processed requests
+
+        | **return** statistics (dict{str name: int value})
+        """
+        connections = self._connections.values()
+        return dict(
+            connections=len(connections),
+            processing=len([c for c in connections if c.processing]),
+            loop_requests=self._loop_requests,
+            worker_requests=self._worker_requests)
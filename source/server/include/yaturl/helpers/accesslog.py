@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from Queue import Queue, Empty, Full
+from threading import Event, Lock
+from time import time
+from yaturl import config
+from yaturl.helpers.logger import get_access_logger, get_logger
+import logging
+import os
+
+
+OVERFLOW_POLICIES = ('drop', 'block')
+
+
+########################################################################
+class YuAccessLogWriter(object):
+    """
+    Queue the formatted lines of the access log and write them in batches
+    from a background thread to the handlers of the accesslog logger, so
+    request threads neither contend on the handler lock nor wait for the
+    disk. If the queue is full, lines are dropped or the request thread
+    waits, according to the overflow policy.
+    """
+
+    access_log_writer = None
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self._queue_size = config.getint('accesslog', 'queue_size')
+        self._flush_size = config.getint('accesslog', 'flush_size')
+        # configured in milliseconds
+        self._flush_interval = config.getint('accesslog', 'flush_interval') / 1000.0
+        self._overflow = config.get('accesslog', 'overflow')
+        if self._overflow not in OVERFLOW_POLICIES:
+            raise RuntimeError(u'Unknown access log overflow policy "%s"' % self._overflow)
+        self._queue = Queue(self._queue_size)
+        self._stopped = Event()
+        # serializes writing between the writer thread and flush()
+        self._write_lock = Lock()
+        self._lock = Lock()
+        self._access_logger = get_access_logger()
+        self._logger = get_logger()
+        self._written = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._flushes = 0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_access_log_writer(cls):
+        cls.access_log_writer = cls()
+        return cls.access_log_writer
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_access_log_writer(cls):
+        return cls.access_log_writer
+
+    #----------------------------------------------------------------------
+    def log(self, line):
+        """
+        Queue a formatted line for the access log
+
+        | **param** line (str)
+        | **return** queued (bool) - False if the line has been dropped
+        """
+        try:
+            self._queue.put_nowait(line)
+            return True
+        except Full:
+            if self._overflow == 'drop':
+                with self._lock:
+                    self._dropped += 1
+                return False
+        with self._lock:
+            self._blocked += 1
+        self._queue.put(line)
+        return True
+
+    #----------------------------------------------------------------------
+    def may_block(self):
+        """Returns whether log() waits if the queue is full"""
+        return self._overflow == 'block'
+
+    #----------------------------------------------------------------------
+    def _collect_lines(self):
+        """
+        Wait for queued lines and return them once either flush_size lines
+        have been collected or flush_interval passed since the first one.
+
+        | **return** lines (list of str)
+        """
+        lines = list()
+        deadline = None
+        while len(lines) < self._flush_size:
+            # wake up regularly to notice a shutdown request, also while
+            # waiting for further lines
+            timeout = 0.5
+            if deadline is not None:
+                timeout = min(timeout, deadline - time())
+                if timeout <= 0:
+                    break
+            try:
+                lines.append(self._queue.get(timeout=timeout))
+            except Empty:
+                if self._stopped.isSet():
+                    break
+                continue
+            if deadline is None:
+                deadline = time() + self._flush_interval
+        return lines
+
+    #----------------------------------------------------------------------
+    def _write(self, lines):
+        records = [
+            self._access_logger.makeRecord(
+                self._access_logger.name, logging.INFO, '(accesslog)', 0, line, None, None)
+            for line in lines]
+        with self._write_lock:
+            for handler in self._access_logger.handlers:
+                try:
+                    if isinstance(handler, logging.FileHandler) and handler.stream is not None:
+                        self._write_file(handler, records)
+                    else:
+                        for record in records:
+                            if record.levelno >= handler.level:
+                                handler.handle(record)
+                except Exception:
+                    self._logger.error(u'Writing the access log failed', exc_info=True)
+        with self._lock:
+            self._written += len(lines)
+            self._flushes += 1
+
+    #----------------------------------------------------------------------
+    def _write_file(self, handler, records):
+        """
+        Write the records at once to the file of the handler, with a single
+        write() on the file opened for appending the lines of other worker
+        processes don't get mixed up with them
+
+        | **param** handler (logging.FileHandler)
+        | **param** records (list of logging.LogRecord)
+        """
+        data = ''.join(
+            '%s\n' % handler.format(record)
+            for record in records if record.levelno >= handler.level)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        handler.acquire()
+        try:
+            handler.stream.flush()
+            fd = handler.stream.fileno()
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+        finally:
+            handler.release()
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """Write all queued lines, called when shutting down"""
+        lines = list()
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except Empty:
+                break
+        for start in xrange(0, len(lines), self._flush_size):
+            self._write(lines[start:start + self._flush_size])
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'Access Log Writer started')
+        while not self._stopped.isSet():
+            lines = self._collect_lines()
+            if lines:
+                self._write(lines)
+        self.flush()
+        self._logger.debug(u'Access Log Writer stopped')
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        """Stop the writer after all queued lines have been written"""
+        self._logger.debug(u'Access Log Writer stopping')
+        self._stopped.set()
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the counters of the access log writer
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        with self._lock:
+            return dict(
+                queue_depth=self._queue.qsize(),
+                queue_size=self._queue_size,
+                overflow=self._overflow,
+                flushes=self._flushes,
+                written=self._written,
+                dropped=self._dropped,
+                blocked=self._blocked)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from cStringIO import StringIO
+from gzip import GzipFile
+from threading import Lock
+from time import time
+from yaturl import config
+import zlib
+
+
+# supported content codings in order of preference
+ENCODINGS = ('gzip', 'deflate')
+# content types worth compressing
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'image/vnd.microsoft.icon')
+
+
+########################################################################
+class PrecompressedText(str):
+    """
+    Byte string carrying its compressed variants, see YuCompressor.precompress()
+    """
+
+    # encoding => compressed text
+    variants = None
+
+
+########################################################################
+class YuCompressor(object):
+    """
+    Negotiates the content coding with clients, compresses responses and
+    counts how much it saved and how long it took
+    """
+
+    compressor = None
+
+    #----------------------------------------------------------------------
+    def __init__(self, level, min_size):
+        self.min_size = min_size
+        self._level = level
+        self._lock = Lock()
+        self._responses = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._compress_time = 0.0
+        self._precompress_time = 0.0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_compressor(cls):
+        if config.getboolean('compression', 'enable'):
+            cls.compressor = cls(
+                config.getint('compression', 'level'),
+                config.getint('compression', 'min_size'))
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_compressor(cls):
+        return cls.compressor
+
+    #----------------------------------------------------------------------
+    def negotiate(self, accept_encoding):
+        """
+        Choose the content coding according to the Accept-Encoding header
+
+        | **param** accept_encoding (str)
+        | **return** encoding (str) or None to send the content uncompressed
+        """
+        if not accept_encoding:
+            return None
+        accepted = dict()
+        for coding in accept_encoding.lower().split(','):
+            name, _, parameters = coding.partition(';')
+            quality = 1.0
+            parameters = parameters.strip()
+            if parameters.startswith('q='):
+                try:
+                    quality = float(parameters[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip()] = quality
+        for encoding in ENCODINGS:
+            if accepted.get(encoding, accepted.get('*', 0.0)) > 0.0:
+                return encoding
+        return None
+
+    #----------------------------------------------------------------------
+    def _compress(self, data, encoding):
+        if encoding == 'gzip':
+            buf = StringIO()
+            # fixed mtime to get the same output for the same input
+            gzip_file = GzipFile(fileobj=buf, mode='wb', compresslevel=self._level, mtime=0)
+            gzip_file.write(data)
+            gzip_file.close()
+            return buf.getvalue()
+        else:
+            return zlib.compress(data, self._level)
+
+    #----------------------------------------------------------------------
+    def compress(self, data, encoding):
+        """
+        Compress a response on the fly
+
+        | **param** data (str)
+        | **param** encoding (str) - result of negotiate()
+        | **return** compressed_data (str)
+        """
+        start = time()
+        compressed = self._compress(data, encoding)
+        self.count_response(len(data), len(compressed), time() - start)
+        return compressed
+
+    #----------------------------------------------------------------------
+    def precompress(self, data):
+        """
+        Compress the given data with all supported encodings, variants
+        which are not smaller than the data itself are left out
+
+        | **param** data (str)
+        | **return** data (PrecompressedText)
+        """
+        start = time()
+        text = PrecompressedText(data)
+        text.variants = dict()
+        for encoding in ENCODINGS:
+            compressed = self._compress(data, encoding)
+            if len(compressed) < len(data):
+                text.variants[encoding] = compressed
+        with self._lock:
+            self._precompress_time += time() - start
+        return text
+
+    #----------------------------------------------------------------------
+    def count_response(self, size, compressed_size, compress_time=0.0):
+        """
+        Count a compressed response
+
+        | **param** size (int)
+        | **param** compressed_size (int)
+        | **param** compress_time (float) - 0 for precompressed responses
+        """
+        with self._lock:
+            self._responses += 1
+            self._bytes_in += size
+            self._bytes_out += compressed_size
+            self._compress_time += compress_time
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number of compressed responses, the compression ratio
+        and the time spent compressing
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        with self._lock:
+            return dict(
+                responses=self._responses,
+                bytes_in=self._bytes_in,
+                bytes_out=self._bytes_out,
+                ratio=float(self._bytes_out) / self._bytes_in if self._bytes_in else 0.0,
+                compress_time=self._compress_time,
+                precompress_time=self._precompress_time)
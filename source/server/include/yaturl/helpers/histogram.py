@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import count
+from threading import Lock, local
+
+
+# upper bounds in seconds, suitable for request and query latencies
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# number of independently locked parts of each histogram
+STRIPES = 8
+
+# merged state of a histogram, counts has one more entry than buckets
+# for the values larger than the last bucket
+HistogramSnapshot = namedtuple('HistogramSnapshot', 'buckets counts sum count')
+
+# each thread always uses the same stripe, assigned round robin on its
+# first observation
+_thread_stripe = local()
+_next_stripe = count()
+
+
+#----------------------------------------------------------------------
+def _get_stripe_index():
+    try:
+        return _thread_stripe.index
+    except AttributeError:
+        # next() of itertools.count is atomic
+        _thread_stripe.index = _next_stripe.next()
+        return _thread_stripe.index
+
+
+########################################################################
+class YuHistogramStripe(object):
+
+    #----------------------------------------------------------------------
+    def __init__(self, size):
+        self.lock = Lock()
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+########################################################################
+class YuHistogram(object):
+    """
+    Histogram with fixed buckets, as used by Prometheus. The counts are
+    split into stripes with their own lock, so threads observing values
+    at the same time rarely wait for each other.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, buckets=LATENCY_BUCKETS, stripes=STRIPES):
+        self._buckets = tuple(buckets)
+        self._stripes = [YuHistogramStripe(len(self._buckets) + 1) for _ in xrange(stripes)]
+
+    #----------------------------------------------------------------------
+    def observe(self, value):
+        """
+        Count the given value
+
+        | **param** value (float) - e.g. a duration in seconds
+        """
+        stripe = self._stripes[_get_stripe_index() % len(self._stripes)]
+        index = bisect_left(self._buckets, value)
+        with stripe.lock:
+            stripe.counts[index] += 1
+            stripe.sum += value
+
+    #----------------------------------------------------------------------
+    def get_snapshot(self):
+        """
+        Return the merged counts of all stripes
+
+        | **return** snapshot (HistogramSnapshot)
+        """
+        counts = [0] * (len(self._buckets) + 1)
+        total = 0.0
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe_counts = list(stripe.counts)
+                total += stripe.sum
+            for index, value in enumerate(stripe_counts):
+                counts[index] += value
+        return HistogramSnapshot(self._buckets, counts, total, sum(counts))
+
+
+#----------------------------------------------------------------------
+def get_percentile(snapshot, percentile):
+    """
+    Estimate a percentile of the observed values, the upper bound of
+    the bucket containing it
+
+    | **param** snapshot (HistogramSnapshot)
+    | **param** percentile (float) - between 0 and 1
+    | **return** value (float) - None if there are no values or the
+                 percentile is above the last bucket
+    """
+    if not snapshot.count:
+        return None
+    rank = percentile * snapshot.count
+    cumulative = 0
+    for bucket, bucket_count in zip(snapshot.buckets, snapshot.counts):
+        cumulative += bucket_count
+        if cumulative >= rank:
+            return bucket
+    return None
+
+
+#----------------------------------------------------------------------
+def format_prometheus_histogram(name, labels, snapshot):
+    """
+    Format the histogram in the Prometheus text format, without HELP
+    and TYPE lines
+
+    | **param** name (str) - metric name
+    | **param** labels (str) - formatted labels like 'route="redirect"' or ''
+    | **return** lines (list of str)
+    """
+    separator = ',' if labels else ''
+    lines = list()
+    cumulative = 0
+    for bucket, bucket_count in zip(snapshot.buckets, snapshot.counts):
+        cumulative += bucket_count
+        lines.append('%s_bucket{%s%sle="%s"} %d' % (name, labels, separator, bucket, cumulative))
+    lines.append('%s_bucket{%s%sle="+Inf"} %d' % (name, labels, separator, snapshot.count))
+    braces = '{%s}' % labels if labels else ''
+    lines.append('%s_sum%s %r' % (name, braces, snapshot.sum))
+    lines.append('%s_count%s %d' % (name, braces, snapshot.count))
+    return lines
@@ -31,3 +31,8 @@ def get_logger():
 #----------------------------------------------------------------------
 def get_access_logger():
     return logging.getLogger('accesslog')
+
+
+#----------------------------------------------------------------------
+def get_slow_query_logger():
+    return logging.getLogger('slowquery')
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+import errno
+import select
+
+
+########################################################################
+class YuPoller(object):
+    """
+    Thin wrapper around epoll, falling back to poll if epoll is not
+    available. Timeouts are in seconds for both.
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._timeout_factor = 1
+        else:
+            self._poller = select.poll()
+            self._timeout_factor = 1000
+
+    #----------------------------------------------------------------------
+    def register(self, fd, events):
+        self._poller.register(fd, events)
+
+    #----------------------------------------------------------------------
+    def modify(self, fd, events):
+        self._poller.modify(fd, events)
+
+    #----------------------------------------------------------------------
+    def unregister(self, fd):
+        self._poller.unregister(fd)
+
+    #----------------------------------------------------------------------
+    def poll(self, timeout=None):
+        """
+        Wait for events, without timeout if timeout is None
+
+        | **param** timeout (float)
+        | **return** events (list of tuple(int fd, int event mask))
+        """
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout *= self._timeout_factor
+        try:
+            return self._poller.poll(timeout)
+        except (IOError, select.error), e:
+            if e.args[0] == errno.EINTR:
+                return list()
+            raise
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from Queue import Queue, Empty, Full
+from threading import Event, Lock
+from time import time
+from yaturl import config
+from yaturl.database.cache import YuLinkCache
+from yaturl.helpers.logger import get_logger
+import socket
+
+
+########################################################################
+class YuHostnameResolver(object):
+    """
+    Resolve the hostnames of clients for the access log in a background
+    thread. Request threads only look up the cache: an address which is
+    not cached yet is logged as is and queued for resolving, so a slow
+    DNS server never delays a response.
+    """
+
+    resolver = None
+
+    #----------------------------------------------------------------------
+    def __init__(self, cache_size, ttl, queue_size):
+        # resolved and unresolvable addresses are cached alike
+        self._cache = YuLinkCache(cache_size, ttl)
+        self._queue = Queue(queue_size)
+        # addresses queued or being resolved, not to queue them twice
+        self._pending = set()
+        self._stopped = Event()
+        self._lock = Lock()
+        self._logger = get_logger()
+        self._resolved = 0
+        self._dropped = 0
+        self._resolve_time = 0.0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_resolver(cls):
+        cls.resolver = cls(
+            config.getint('resolver', 'cache_size'),
+            config.getint('resolver', 'ttl'),
+            config.getint('resolver', 'queue_size'))
+        return cls.resolver
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_resolver(cls):
+        return cls.resolver
+
+    #----------------------------------------------------------------------
+    def get_hostname(self, address):
+        """
+        Return the cached hostname of the given address or, if it is not
+        cached, the address itself and queue it for resolving
+
+        | **param** address (str)
+        | **return** hostname (str)
+        """
+        hostname = self._cache.get(address)
+        if hostname is not None:
+            return hostname
+        with self._lock:
+            if address in self._pending:
+                return address
+            try:
+                self._queue.put_nowait(address)
+            except Full:
+                self._dropped += 1
+            else:
+                self._pending.add(address)
+        return address
+
+    #----------------------------------------------------------------------
+    def _resolve(self, address):
+        start = time()
+        hostname = socket.getfqdn(address)
+        self._cache.set(address, hostname)
+        with self._lock:
+            self._pending.discard(address)
+            self._resolved += 1
+            self._resolve_time += time() - start
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'Hostname Resolver started')
+        while not self._stopped.isSet():
+            try:
+                # wake up regularly while idle to notice a shutdown request
+                address = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+            self._resolve(address)
+        self._logger.debug(u'Hostname Resolver stopped')
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        """Stop the resolver, queued addresses are discarded"""
+        self._logger.debug(u'Hostname Resolver stopping')
+        self._stopped.set()
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the counters of the resolver and its cache
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        cache_statistics = self._cache.get_statistics()
+        with self._lock:
+            return dict(
+                size=cache_statistics['size'],
+                max_size=cache_statistics['max_size'],
+                hits=cache_statistics['hits'],
+                misses=cache_statistics['misses'],
+                queue_depth=self._queue.qsize(),
+                resolved=self._resolved,
+                dropped=self._dropped,
+                resolve_time=self._resolve_time)
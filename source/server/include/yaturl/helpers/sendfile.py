@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from threading import Lock
+import ctypes
+import ctypes.util
+import errno
+import os
+
+
+# errors of sendfile() meaning the socket or file type is not supported
+UNSUPPORTED_ERRORS = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+RETRY_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+# bytes per call of sendfile() and per read of the fallback
+CHUNK_SIZE = 65536
+
+
+#----------------------------------------------------------------------
+def _load_sendfile():
+    """
+    Return os.sendfile() or, for Python versions without it, a wrapper
+    of the C library function with the same interface
+
+    | **return** sendfile (callable) or None if not available
+    """
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    libc_sendfile = getattr(libc, 'sendfile64', None) or getattr(libc, 'sendfile', None)
+    if libc_sendfile is None:
+        return None
+    libc_sendfile.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t)
+    libc_sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        # the offset is passed explicitly, the file position is not changed
+        # so the same file can be sent to several clients at once
+        c_offset = ctypes.c_int64(offset)
+        sent = libc_sendfile(out_fd, in_fd, ctypes.byref(c_offset), count)
+        if sent < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return sent
+
+    return sendfile
+
+
+_sendfile = _load_sendfile()
+
+
+########################################################################
+class YuFileSender(object):
+    """
+    Sends an open file to a socket using sendfile(), so the content is
+    copied by the kernel and not read into Python strings. Falls back to
+    reading and sending the file in chunks if sendfile() is not
+    available or doesn't support the socket type.
+    """
+
+    _lock = Lock()
+    _files = 0
+    _bytes = 0
+    _fallbacks = 0
+
+    #----------------------------------------------------------------------
+    def __init__(self, file_obj, size):
+        self._file = file_obj
+        self._fallback_file = None
+        self._size = size
+        self.offset = 0
+        with self._lock:
+            YuFileSender._files += 1
+
+    #----------------------------------------------------------------------
+    def is_done(self):
+        return self.offset >= self._size
+
+    #----------------------------------------------------------------------
+    def send(self, sock):
+        """
+        Send the next part of the file, works with blocking and
+        non-blocking sockets
+
+        | **param** sock (socket.socket)
+        | **return** sent (int) - 0 if the socket is not ready for writing
+        """
+        count = min(CHUNK_SIZE, self._size - self.offset)
+        try:
+            if self._fallback_file is None and _sendfile is not None:
+                try:
+                    sent = _sendfile(sock.fileno(), self._file.fileno(), self.offset, count)
+                except OSError, e:
+                    if e.errno not in UNSUPPORTED_ERRORS:
+                        raise
+                    self._start_fallback()
+                    sent = self._send_chunk(sock, count)
+            else:
+                sent = self._send_chunk(sock, count)
+        except (OSError, IOError), e:
+            if e.errno in RETRY_ERRORS:
+                return 0
+            raise
+        if sent == 0 and count > 0:
+            raise IOError(u'File "%s" has been truncated while sending it' % self._file.name)
+        self.offset += sent
+        with self._lock:
+            YuFileSender._bytes += sent
+        return sent
+
+    #----------------------------------------------------------------------
+    def _start_fallback(self):
+        # a private file object, the shared one might be used concurrently
+        self._fallback_file = open(self._file.name, 'rb')
+        with self._lock:
+            YuFileSender._fallbacks += 1
+
+    #----------------------------------------------------------------------
+    def _send_chunk(self, sock, count):
+        if self._fallback_file is None:
+            self._start_fallback()
+        self._fallback_file.seek(self.offset)
+        data = self._fallback_file.read(count)
+        if not data:
+            return 0
+        return sock.send(data)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """
+        Release the private file object of the fallback, the file passed
+        to the constructor is left open for other senders
+        """
+        if self._fallback_file is not None:
+            self._fallback_file.close()
+            self._fallback_file = None
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_statistics(cls):
+        """
+        Return the number of files and bytes sent and how often the
+        fallback was used
+
+        | **return** statistics (dict{str name: int value})
+        """
+        with cls._lock:
+            return dict(
+                available=_sendfile is not None,
+                files=cls._files,
+                bytes=cls._bytes,
+                fallbacks=cls._fallbacks)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+#----------------------------------------------------------------------
+def normalize_shorthash(shorthash):
+    """
+    Return the key of the shorthash in the link cache, negative cache,
+    link filter and snapshot. The link table compares shorthashes with
+    its case insensitive collation, so all of them must treat
+    differently cased shorthashes as the same.
+
+    | **param** shorthash (str)
+    | **return** key (str)
+    """
+    return shorthash.lower()
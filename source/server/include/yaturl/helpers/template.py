@@ -20,7 +20,208 @@
 # MA 02110-1301, USA.
 
 
-from yaturl.constants import FOOTER, HEADER
+from operator import itemgetter
+from threading import Lock
+from time import time
+from yaturl import config
+from yaturl.constants import FOOTER, HEADER, TEMPLATENAMES
+from yaturl.helpers.compression import YuCompressor
+import os
+import re
+
+
+# template wildcards, %(name)s and the escaped %%
+TEMPLATE_WILDCARD_PATTERN = re.compile(r'%(?:\((\w+)\)s|%)')
+
+
+########################################################################
+class YuCompiledTemplate(object):
+    """
+    Page text split once into its static parts around the %(name)s
+    wildcards, rendering only joins the parts with the values
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, text):
+        parts = list()
+        names = list()
+        part = list()
+        position = 0
+        for match in TEMPLATE_WILDCARD_PATTERN.finditer(text):
+            part.append(text[position:match.start()])
+            position = match.end()
+            name = match.group(1)
+            if name is None:
+                part.append('%')
+            else:
+                parts.append(''.join(part))
+                names.append(name)
+                part = list()
+        part.append(text[position:])
+        parts.append(''.join(part))
+        # static parts at the even indexes, the odd ones get the values
+        self._template = [None] * (len(parts) + len(names))
+        self._template[::2] = parts
+        if len(names) > 1:
+            self._get_values = itemgetter(*names)
+        else:
+            # itemgetter() doesn't return a tuple for less than two names
+            self._get_values = lambda values: [values[name] for name in names]
+
+    #----------------------------------------------------------------------
+    def render(self, values):
+        """
+        Return the page with the wildcards replaced by the given values
+
+        | **param** values (dict)
+        | **return** text (str)
+        """
+        text = self._template[:]
+        text[1::2] = self._get_values(values)
+        try:
+            return ''.join(text)
+        except TypeError:
+            # values which are no strings, e.g. numbers
+            text[1::2] = [value if isinstance(value, basestring) else str(value)
+                          for value in text[1::2]]
+            return ''.join(text)
+
+
+########################################################################
+class YuTemplateCache(object):
+    """
+    Template files held in memory compiled into YuCompiledTemplate objects,
+    they are checked for changes at most every check_interval seconds.
+    Pages which always look the same are kept rendered.
+    """
+
+    template_cache = None
+
+    #----------------------------------------------------------------------
+    def __init__(self, check_interval):
+        self._check_interval = check_interval
+        self._lock = Lock()
+        # filename => tuple(float mtime, YuCompiledTemplate template)
+        self._templates = dict()
+        # tuple(filename, title, header, values) => str rendered page
+        self._rendered = dict()
+        self._next_check = time() + check_interval
+        self._loads = 0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_template_cache(cls):
+        template_cache = cls(config.getint('templates', 'check_interval'))
+        path = config.get('templates', 'path')
+        for template in TEMPLATENAMES:
+            template_cache.get(path + template)
+        cls.template_cache = template_cache
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_template_cache(cls):
+        return cls.template_cache
+
+    #----------------------------------------------------------------------
+    def get(self, filename):
+        """
+        Return the compiled page of the given template file, including
+        the common header and footer
+
+        | **param** filename (str)
+        | **return** template (YuCompiledTemplate)
+        """
+        self._check_for_changes()
+        template = self._templates.get(filename)
+        if template is None:
+            template = self._load(filename)
+        return template[1]
+
+    #----------------------------------------------------------------------
+    def _load(self, filename):
+        filep = open(filename, 'r')
+        try:
+            mtime = os.fstat(filep.fileno()).st_mtime
+            template = (mtime, _compile_page(filep.read()))
+        finally:
+            filep.close()
+        with self._lock:
+            self._templates[filename] = template
+            self._loads += 1
+        return template
+
+    #----------------------------------------------------------------------
+    def _check_for_changes(self):
+        now = time()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self._check_interval
+            for filename, (mtime, _) in self._templates.items():
+                try:
+                    changed = os.stat(filename).st_mtime != mtime
+                except OSError:
+                    changed = True
+                if changed:
+                    # reloaded on next use
+                    del self._templates[filename]
+                    self._rendered.clear()
+
+    #----------------------------------------------------------------------
+    def render_constant(self, filename, title, header, values):
+        """
+        Return the rendered page, rendering it only on first use
+
+        | **param** filename (str)
+        | **param** title (str)
+        | **param** header (str)
+        | **param** values (dict)
+        | **return** page (str) - UTF-8 encoded
+        """
+        key = (filename, title, header, tuple(sorted(values.items())))
+        self._check_for_changes()
+        text = self._rendered.get(key)
+        if text is None:
+            text = self.get(filename).render(dict(values, title=title, header=header))
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            compressor = YuCompressor.get_compressor()
+            if compressor:
+                text = compressor.precompress(text)
+            with self._lock:
+                self._rendered[key] = text
+        return text
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number of cached templates and rendered pages
+
+        | **return** statistics (dict{str name: int value})
+        """
+        return dict(
+            templates=len(self._templates),
+            rendered=len(self._rendered),
+            loads=self._loads)
+
+
+#----------------------------------------------------------------------
+def _compile_page(text):
+    return YuCompiledTemplate(HEADER + text + FOOTER)
+
+
+#----------------------------------------------------------------------
+def _read_template_file(filename):
+    template_cache = YuTemplateCache.get_template_cache()
+    if template_cache:
+        return template_cache.get(filename)
+    filep = open(filename, 'r')
+    try:
+        return _compile_page(filep.read())
+    finally:
+        filep.close()
 
 
 #----------------------------------------------------------------------
@@ -35,11 +236,30 @@ def read_template(filename, title, header, **values):
     | **param** values (dict)
     | **return** template_text (str)
     """
-    head = HEADER % (title, header)
+    values['title'] = title
+    values['header'] = header
     try:
-        filep = open(filename, 'r')
-        result = head + filep.read() % values
-        filep.close()
-        return result + FOOTER
+        return _read_template_file(filename).render(values)
+    except IOError:
+        return ''
+
+
+#----------------------------------------------------------------------
+def read_constant_template(filename, title, header, **values):
+    """
+    Like read_template() but for pages which are always the same for the
+    given arguments, they are rendered only once.
+
+    | **param** filename (str)
+    | **param** title (str)
+    | **param** header (str)
+    | **param** values (dict)
+    | **return** template_text (str)
+    """
+    template_cache = YuTemplateCache.get_template_cache()
+    if not template_cache:
+        return read_template(filename, title, header, **values)
+    try:
+        return template_cache.render_constant(filename, title, header, values)
     except IOError:
         return ''
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+#----------------------------------------------------------------------
+def get_standard_time_ranges(now=None):
+    """
+    Return the [start, end) ranges used on the statistics page. All times
+    are in UTC like the timestamps in the database, weeks start on Sunday.
+    A start or end of None means the range is open on that side.
+
+    | **param** now (datetime)
+    | **return** ranges (OrderedDict{str name: tuple(datetime start, datetime end)})
+    """
+    if now is None:
+        now = datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    tomorrow = today + timedelta(days=1)
+    week_start = today - timedelta(days=(today.weekday() + 1) % 7)
+    month_start = datetime(now.year, now.month, 1)
+    year_start = datetime(now.year, 1, 1)
+
+    return OrderedDict((
+        ('today', (today, tomorrow)),
+        ('this_week', (week_start, tomorrow)),
+        ('this_month', (month_start, tomorrow)),
+        ('this_year', (year_start, tomorrow)),
+        ('all', (None, None))))
+
+
+#----------------------------------------------------------------------
+def is_whole_day(timestamp):
+    """
+    Check whether the given timestamp is exactly at midnight
+
+    | **param** timestamp (datetime)
+    | **return** whole_day (bool)
+    """
+    return is_whole_hour(timestamp) and timestamp.hour == 0
+
+
+#----------------------------------------------------------------------
+def is_whole_hour(timestamp):
+    """
+    Check whether the given timestamp is exactly at the start of an hour
+
+    | **param** timestamp (datetime)
+    | **return** whole_hour (bool)
+    """
+    return timestamp.minute == 0 and timestamp.second == 0 and timestamp.microsecond == 0
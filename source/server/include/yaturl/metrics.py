@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from threading import Lock
+from yaturl import config
+from yaturl.helpers.histogram import YuHistogram, format_prometheus_histogram
+from yaturl.helpers.logger import get_logger
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+########################################################################
+class YuRequestMetrics(object):
+    """
+    Latency histograms of the requests by route and status code
+    """
+
+    request_metrics = None
+    # further collectors to be included in the /metrics output, callables
+    # returning a list of lines in the Prometheus text format
+    collectors = list()
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        # (route, status code) => YuHistogram
+        self._histograms = dict()
+        # only held to add a histogram
+        self._lock = Lock()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_request_metrics(cls):
+        cls.request_metrics = cls()
+        return cls.request_metrics
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_request_metrics(cls):
+        return cls.request_metrics
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def add_collector(cls, collector):
+        """
+        Include further metrics in the /metrics output
+
+        | **param** collector (callable) - returns a list of lines in the Prometheus text format
+        """
+        cls.collectors.append(collector)
+
+    #----------------------------------------------------------------------
+    def observe(self, route, code, duration):
+        """
+        Count a processed request
+
+        | **param** route (str) - name of the route
+        | **param** code (int) - status code of the response
+        | **param** duration (float) - processing time in seconds
+        """
+        key = (route, code)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, YuHistogram())
+        histogram.observe(duration)
+
+    #----------------------------------------------------------------------
+    def get_snapshots(self):
+        """
+        Return the merged histograms
+
+        | **return** snapshots (list of tuple(str route, int code, HistogramSnapshot))
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        return [(route, code, histogram.get_snapshot()) for (route, code), histogram in histograms]
+
+    #----------------------------------------------------------------------
+    def format_prometheus(self):
+        """
+        Return the metrics in the Prometheus text format
+
+        | **return** text (str)
+        """
+        snapshots = self.get_snapshots()
+        lines = [
+            '# HELP yaturl_requests_total Processed HTTP requests.',
+            '# TYPE yaturl_requests_total counter']
+        for route, code, snapshot in snapshots:
+            lines.append('yaturl_requests_total{route="%s",code="%d"} %d' % (route, code, snapshot.count))
+        lines.extend([
+            '# HELP yaturl_request_duration_seconds Time spent processing HTTP requests.',
+            '# TYPE yaturl_request_duration_seconds histogram'])
+        for route, code, snapshot in snapshots:
+            labels = 'route="%s",code="%d"' % (route, code)
+            lines.extend(format_prometheus_histogram('yaturl_request_duration_seconds', labels, snapshot))
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+########################################################################
+class YuMetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics on the configured path, nothing else
+    """
+
+    #----------------------------------------------------------------------
+    def do_GET(self):
+        if self.path.partition('?')[0] != self.server.path:
+            self.send_error(404)
+            return
+        text = YuRequestMetrics.get_request_metrics().format_prometheus()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', len(text))
+        self.end_headers()
+        self.wfile.write(text)
+
+    #----------------------------------------------------------------------
+    def log_message(self, msg_format, *args):
+        # scrapes are not worth an access log line
+        pass
+
+
+########################################################################
+class YuMetricsServer(HTTPServer):
+    """
+    Admin HTTP server for Prometheus, separated from the public server
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, port_offset=0):
+        self.path = config.get('metrics', 'path')
+        # each worker process listens on its own port
+        address = (config.get('metrics', 'host'), config.getint('metrics', 'port') + port_offset)
+        HTTPServer.__init__(self, address, YuMetricsRequestHandler)
+        self._logger = get_logger()
+
+    #----------------------------------------------------------------------
+    def serve_forever(self):
+        self._logger.info(u'Metrics Server started')
+        HTTPServer.serve_forever(self, poll_interval=0.5)
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        HTTPServer.shutdown(self)
+        self.server_close()
@@ -21,21 +21,30 @@
 
 from BaseHTTPServer import BaseHTTPRequestHandler
 import errno
+import select
 import socket
 import cgi
 import hashlib
 import time
 from smtplib import SMTP, SMTPException
 from email.mime.text import MIMEText
-from urlparse import urlsplit, urlunsplit, urlparse
+from urlparse import urlsplit, urlunsplit
 from yaturl import config
+from yaturl.database.clickwriter import YuClickWriter
 from yaturl.database.database import YuDatabase
 from yaturl.database.error import YuDatabaseError
 from yaturl.constants import SERVER_NAME, SERVER_VERSION, TEMPLATE_500, CONTENT_TYPES
+from yaturl.helpers.accesslog import YuAccessLogWriter
+from yaturl.helpers.compression import YuCompressor
 from yaturl.helpers.path import sanitize_path
-from yaturl.helpers.template import read_template
+from yaturl.helpers.resolver import YuHostnameResolver
+from yaturl.helpers.sendfile import YuFileSender
+from yaturl.helpers.template import read_constant_template, read_template
 from yaturl.helpers.logger import get_access_logger, get_logger
 from yaturl.helpers.stringformater import format_none
+from yaturl.metrics import YuRequestMetrics
+from yaturl.router import YuRouter
+from yaturl.staticfiles import YuStaticFileCache
 from yaturl.stats import YuStats, YuLinkStats
 
 
@@ -46,12 +55,26 @@ class YuRequestHandler(BaseHTTPRequestHandler):
     """
 
     server_version = '%s/%s' % (SERVER_NAME, SERVER_VERSION)
+    # support persistent connections, every response must send a Content-Length
+    protocol_version = 'HTTP/1.1'
+    # buffer the response and send it at once after each request
+    wbufsize = -1
+    disable_nagle_algorithm = True
 
     #----------------------------------------------------------------------
-    def __init__(self, request, client_address, server):
+    def __init__(self, request, client_address, server, handled_requests=0):
         self._db = YuDatabase()
         self._logger = get_logger()
         self._header_only = False
+        # requests of the connection so far, for keep_alive_max_requests
+        self.handled_requests = handled_requests
+        self._connection_header_sent = False
+        # name of the route and status code for the request metrics
+        self._route_name = None
+        self._status_code = None
+        # time to wait for the rest of a request, applied in setup(); idle
+        # persistent connections wait in the accept loop of the server
+        self.timeout = server.request_timeout
         BaseHTTPRequestHandler.__init__(self, request, client_address, server)
 
     #----------------------------------------------------------------------
@@ -84,19 +107,44 @@ class YuRequestHandler(BaseHTTPRequestHandler):
     def address_string(self):
         """
         Return the client address formatted for logging.
-        Only lookup the hostname if really requested.
+        Only lookup the hostname if really requested, and then only in
+        the cache of the hostname resolver.
 
         | **return** hostname (str)
         """
 
-        if self.server.log_ip_activated:
-            host = self.client_address[0]
+        if not self.server.log_ip_activated:
+            return '127.0.0.1'
+        resolver = YuHostnameResolver.get_resolver()
+        if resolver:
+            return resolver.get_hostname(self.client_address[0])
         else:
-            host = '127.0.0.1'
-        if self.server.resolve_clients:
-            return socket.getfqdn(host)
-        else:
-            return host
+            return self.client_address[0]
+
+    #----------------------------------------------------------------------
+    def handle(self):
+        """
+        Process the requests already received on the connection. Once
+        the client is idle, the connection is handed back to the server
+        (close_connection is not set) instead of blocking the worker
+        thread until the next request.
+        """
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection and self._has_buffered_request():
+            self.handle_one_request()
+
+    #----------------------------------------------------------------------
+    def _has_buffered_request(self):
+        """
+        Check whether a pipelined request has already been read from the
+        socket into the buffer of rfile, the poller of the server would
+        not notice it
+
+        | **return** buffered (bool)
+        """
+        # the read buffer of socket._fileobject
+        return len(self.rfile._rbuf.getvalue()) > 0
 
     #----------------------------------------------------------------------
     def log_request(self, code='-', size='-'):
@@ -120,6 +168,37 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         """
         BaseHTTPRequestHandler.send_response(self, code, message)
         BaseHTTPRequestHandler.log_request(self, code, size)
+        self._status_code = code
+        self._connection_header_sent = False
+        self.handled_requests += 1
+        if self.handled_requests >= self.server.keep_alive_max_requests:
+            self.close_connection = 1
+
+    #----------------------------------------------------------------------
+    def send_header(self, keyword, value):
+        """
+        Send a MIME header and remember whether the Connection header
+        has been sent explicitly.
+
+        | **param** keyword (str)
+        | **param** value (str)
+        """
+        if keyword.lower() == 'connection':
+            self._connection_header_sent = True
+        BaseHTTPRequestHandler.send_header(self, keyword, value)
+
+    #----------------------------------------------------------------------
+    def end_headers(self):
+        """
+        Tell the client whether the connection is kept open and send the
+        blank line ending the headers.
+        """
+        if not self._connection_header_sent:
+            if self.close_connection:
+                self.send_header('Connection', 'close')
+            elif self.request_version == 'HTTP/1.0':
+                self.send_header('Connection', 'keep-alive')
+        BaseHTTPRequestHandler.end_headers(self)
 
     #----------------------------------------------------------------------
     def log_message(self, msg_format, *args):
@@ -131,13 +210,14 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         | **param** msg_format (str)
         | **return** args (seq of mixed)
         """
+        # there are no headers if reading the request timed out
         try:
             useragent = self.headers['User-Agent']
-        except KeyError:
+        except (AttributeError, KeyError):
             useragent = '-'
         try:
             referrer = self.headers['Referer']
-        except KeyError:
+        except (AttributeError, KeyError):
             referrer = '-'
 
         values = dict(
@@ -150,16 +230,21 @@ class YuRequestHandler(BaseHTTPRequestHandler):
             useragent='"%s"' % useragent
         )
         msg_format = '%(client)s %(identity)s %(user)s [%(timestr)s] %(request)s %(referrer)s %(useragent)s'
-        access_logger = get_access_logger()
-        access_logger.info(msg_format % values)
+        access_log_writer = YuAccessLogWriter.get_access_log_writer()
+        if access_log_writer:
+            access_log_writer.log(msg_format % values)
+        else:
+            access_logger = get_access_logger()
+            access_logger.info(msg_format % values)
 
     #----------------------------------------------------------------------
-    def _send_head(self, text, code):
+    def _send_head(self, text, code, encoding=None):
         """
         Send common headers
 
         | **param** text (str)
         | **param** code (int)
+        | **param** encoding (str) - content coding of text, if compressed
         """
         size = len(text)
         self.send_response(code, None, size)
@@ -172,6 +257,10 @@ class YuRequestHandler(BaseHTTPRequestHandler):
             self.send_header('Content-Type', CONTENT_TYPES[extension])
         except KeyError:
             self.send_header('Content-Type', 'text/html')
+        if YuCompressor.get_compressor():
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
         self.send_header("Content-Length", size)
         self.end_headers()
 
@@ -183,7 +272,9 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         |**param** message (str) Optional message that should appear on startpage
         """
         template_filename = self._get_config_template('homepage')
-        text = read_template(
+        # the homepage without message never changes
+        render = read_template if message else read_constant_template
+        text = render(
             template_filename,
             title=SERVER_NAME,
             header=SERVER_NAME,
@@ -239,7 +330,11 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         | **param** code - response code e.g. 404 (int)
         """
         if content:
-            self._send_head(content, code)
+            if isinstance(content, unicode):
+                # Content-Length has to be the number of bytes sent
+                content = content.encode('utf-8')
+            content, encoding = self._compress_content(content)
+            self._send_head(content, code, encoding)
             if not self._header_only:
                 try:
                     self.wfile.write(content)
@@ -249,6 +344,117 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         else:
             self._send_internal_server_error()
 
+    #-------------------------------------------------------------------
+    def _compress_content(self, content):
+        """
+        Compress the content if the client accepts it. Precompressed
+        content is used as is, other content only if it is large enough.
+
+        | **param** content (str)
+        | **return** content, encoding (tuple(str, str)) - encoding is None if not compressed
+        """
+        compressor = YuCompressor.get_compressor()
+        if not compressor:
+            return content, None
+        encoding = compressor.negotiate(self.headers.get('Accept-Encoding'))
+        if not encoding:
+            return content, None
+        variants = getattr(content, 'variants', None)
+        if variants is not None:
+            if encoding not in variants:
+                return content, None
+            compressor.count_response(len(content), len(variants[encoding]))
+            return variants[encoding], encoding
+        if len(content) < compressor.min_size:
+            return content, None
+        return compressor.compress(content, encoding), encoding
+
+    #-------------------------------------------------------------------
+    def _send_static_file(self, static_file):
+        """
+        Send a file of the static document root or, if the client's copy
+        is still current, a 304 without body
+
+        | **param** static_file (StaticFile)
+        """
+        content = static_file.content
+        etag = static_file.etag
+        compressor = YuCompressor.get_compressor()
+        encoding = None
+        if compressor and static_file.variants:
+            encoding = compressor.negotiate(self.headers.get('Accept-Encoding'))
+            if encoding in static_file.variants:
+                content, etag = static_file.variants[encoding]
+            else:
+                encoding = None
+
+        static_file_cache = YuStaticFileCache.get_static_file_cache()
+        if static_file_cache.is_not_modified(etag, static_file.mtime, self.headers):
+            self.send_response(304)
+            self._send_static_file_headers(static_file, etag)
+            self.end_headers()
+            return
+        if content is None:
+            self._send_large_static_file(static_file)
+            return
+        self.send_response(200, None, len(content))
+        self.send_header('Content-Type', static_file.content_type)
+        self.send_header('Content-Length', len(content))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+            compressor.count_response(static_file.size, len(content))
+        self._send_static_file_headers(static_file, etag)
+        self.end_headers()
+        if not self._header_only:
+            try:
+                self.wfile.write(content)
+            except socket.error:
+                # clients like to stop reading after they got a 404
+                pass
+
+    #-------------------------------------------------------------------
+    def _send_large_static_file(self, static_file):
+        """
+        Send a static file which is not held in memory from its open file
+
+        | **param** static_file (StaticFile)
+        """
+        self.send_response(200, None, static_file.size)
+        self.send_header('Content-Type', static_file.content_type)
+        self.send_header('Content-Length', static_file.size)
+        self._send_static_file_headers(static_file, static_file.etag)
+        self.end_headers()
+        if not self._header_only:
+            self._send_file_content(YuFileSender(static_file.file, static_file.size))
+
+    #-------------------------------------------------------------------
+    def _send_file_content(self, file_sender):
+        """
+        Send the file directly to the socket after the buffered headers
+
+        | **param** file_sender (YuFileSender)
+        """
+        try:
+            self.wfile.flush()
+            while not file_sender.is_done():
+                if not file_sender.send(self.connection):
+                    # the socket has a timeout and so is non-blocking internally
+                    _, writable, _ = select.select([], [self.connection], [], self.timeout)
+                    if not writable:
+                        raise socket.timeout(u'timed out')
+        except (socket.error, IOError, OSError), e:
+            self.log_error('Sending static file failed: %s', e)
+            self.close_connection = 1
+        finally:
+            file_sender.close()
+
+    #-------------------------------------------------------------------
+    def _send_static_file_headers(self, static_file, etag):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', static_file.last_modified)
+        if static_file.variants:
+            self.send_header('Vary', 'Accept-Encoding')
+
     #-------------------------------------------------------------------
     def _send_301(self, new_url):
         """
@@ -260,17 +466,32 @@ class YuRequestHandler(BaseHTTPRequestHandler):
             self.send_response(301)
             self.send_header('Location', new_url)
             self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Length', 0)
             self.end_headers()
         except UnicodeEncodeError:
             self._send_internal_server_error()
 
+    #----------------------------------------------------------------------
+    def _log_redirect(self, resolved_link):
+        """
+        Log the redirect of the given link to the access_log table, in the
+        background if the click writer is running
+
+        | **param** resolved_link (ResolvedLink)
+        """
+        click_writer = YuClickWriter.get_click_writer()
+        if click_writer:
+            click_writer.log_click(resolved_link.link_id)
+        else:
+            self._db.add_logentry_to_database(resolved_link.link_id)
+
     #----------------------------------------------------------------------
     def _send_404(self):
         """
         Send HTTP status code 404
         """
         template_filename = self._get_config_template('404')
-        text = read_template(
+        text = read_constant_template(
                 template_filename,
                 title='%s - 404' % SERVER_NAME,
                 header='404 &mdash; Page not found',
@@ -283,16 +504,14 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         Send HTTP status code 500
         """
         template_filename = self._get_config_template('500')
-        text = read_template(
+        text = read_constant_template(
             template_filename,
             title='%s - Internal Error' % SERVER_NAME,
             header='Internal error')
         if not text:
             # fallback to hard-coded template
             text = TEMPLATE_500
-        self._send_head(text, 500)
-        if not self._header_only:
-            self.wfile.write(text)
+        self._send_response(text, 500)
 
     #----------------------------------------------------------------------
     def _send_database_problem(self):
@@ -302,16 +521,14 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         | **param** header_only (bool)
         """
         template_filename = self._get_config_template('databaseerror')
-        text = read_template(
+        text = read_constant_template(
             template_filename,
             title='%s - Datebase error' % SERVER_NAME,
             header='Database error')
         if not text:
             self._send_internal_server_error()
             return
-        self._send_head(text, 500)
-        if not self._header_only:
-            self.wfile.write(text)
+        self._send_response(text, 500)
 
     #----------------------------------------------------------------------
     def _send_mail(self, subject, content, email):
@@ -460,7 +677,7 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         | **param** header_only (bool)
         """
 
-        stat = YuStats()
+        stat = YuStats.get_current_stats()
         template_filename = self._get_config_template('stats')
         text = read_template(
                     template_filename,
@@ -478,16 +695,7 @@ class YuRequestHandler(BaseHTTPRequestHandler):
                     number_of_url_this_year=format_none(stat.links_this_year),
                     date_of_first_redirect=format_none(stat.date_of_first_redirect),
                 )
-        if text:
-            self._send_head(text, 200)
-            if not self._header_only:
-                try:
-                    self.wfile.write(text)
-                except socket.error:
-                    # clients like to stop reading after they got a 404
-                    pass
-        else:
-            self._send_internal_server_error()
+        self._send_response(text, 200)
 
     #-------------------------------------------------------------------
     def _show_link_stats(self, shorthash=None):
@@ -503,9 +711,16 @@ class YuRequestHandler(BaseHTTPRequestHandler):
             self._send_404()
             return
         else:
-            blocked = self._db.is_hash_blocked(shorthash)
-            if blocked:
-                self._send_blocked_page(blocked[3])
+            try:
+                resolved_link = self._db.resolve_shorthash(shorthash)
+            except YuDatabaseError:
+                self._send_database_problem()
+                return
+            if resolved_link is None or resolved_link.deleted:
+                self._send_404()
+                return
+            elif resolved_link.blocked:
+                self._send_blocked_page(resolved_link.block_reason)
                 return
             link_stats = YuLinkStats(shorthash)
             # Only proceed if there is a address behind the link,
@@ -535,10 +750,14 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         """
         GET HTTP request entry point
         """
+        self._header_only = False
         self._try_to_process_request(self._handle_get_request)
 
     #----------------------------------------------------------------------
     def _try_to_process_request(self, method):
+        start = time.time()
+        self._route_name = 'unknown'
+        self._status_code = None
         try:
             method()
         except Exception, e:
@@ -546,8 +765,16 @@ class YuRequestHandler(BaseHTTPRequestHandler):
                 self._logger.error(u'An unhandled error occurred: %s' % e, exc_info=True)
             else:
                 self._logger.warn(u'An unhandled error occurred: %s' % e)
+            # parts of the response might have been sent already
+            self.close_connection = 1
             # send response
             self._send_internal_server_error()
+        finally:
+            # don't hold a pooled connection while waiting for the next request
+            self._db.close()
+            request_metrics = YuRequestMetrics.get_request_metrics()
+            if request_metrics and self._status_code is not None:
+                request_metrics.observe(self._route_name, self._status_code, time.time() - start)
 
     #----------------------------------------------------------------------
     def _exception_is_important(self, exception):
@@ -563,146 +790,150 @@ class YuRequestHandler(BaseHTTPRequestHandler):
         """
         GET HTTP request entry point
         """
-        docroot = self._get_config_value('main', 'staticdocumentroot')
-        local_path = sanitize_path(self.path)
-        path = docroot + local_path
+        # First we try to send every static content
+        static_file = YuStaticFileCache.get_static_file_cache().get(sanitize_path(self.path))
+        if static_file is not None:
+            self._route_name = 'static'
+            self._send_static_file(static_file)
+            return
+        route, argument = YuRouter.get_router().route('GET', self.path)
+        self._route_name = route.name
+        getattr(self, route.handler)(argument)
+
+    #----------------------------------------------------------------------
+    def _handle_addurl_request(self, url):
+        """
+        Add the URL given by the addurl query parameter
+
+        | **param** url (str)
+        """
+        if not url:
+            # There was a general issue with URL
+            self._send_homepage('''<p class="warning">Please check your input.</p>''')
+            return
         try:
-            # actually try deliver the requested file - First we try to send
-            # every static content
-            requested_file = open(path)
-            text = requested_file.read()
-            requested_file.close()
-        except IOError:
-            try:
-                parsed_path = urlparse(self.path)
-                params = dict([p.split('=') for p in parsed_path[4].split('&')])
-                if params['addurl']:
-                    tmp = self._insert_url_to_db(params['addurl'])
-                    if tmp and tmp < 0:
-                        self._send_database_problem()
-                        return
-                    blocked = self._db.is_hash_blocked(tmp)
-                    if blocked:
-                        self._send_blocked_page(blocked[3])
-                        return
-                    elif tmp:
-                        self._send_return_page(tmp)
-                        return
-                    else:
-                        # There was a general issue with URL
-                        self._send_homepage('''<p class="warning">Please check your input.</p>''')
-                        return
-                else:
-                    # There was a general issue with URL
-                    self._send_homepage('''<p class="warning">Please check your input.</p>''')
-                    return
-            except YuDatabaseError:
+            tmp = self._insert_url_to_db(url)
+            if tmp and tmp < 0:
                 self._send_database_problem()
                 return
-            except:
-                if self.path in ('/', '/URLRequest'):
-                    self._send_homepage()
-                    return
-                elif self.path.startswith('/stats') or self.path.endswith('+'):
-                    if self.path == '/stats':
-                        # Doing general statistics here
-                        # Let's hope this page is not getting to popular ....
-                        # Create a new stats objekt which is fetching data in background
-                        self._show_general_stats()
-                        return
-                    else:
-                        # Check whether we do have the + or the stats kind of URL
-                        if self.path.endswith('+'):
-                            # Well I guess this is the proof you can write
-                            # real ugly code in Python too.
-                            try:
-                                if self.path.startswith('/show/'):
-                                    request_path = self.path[6:]
-                                elif self.path.startswith('/s/'):
-                                    request_path = self.path[3:]
-                                elif self.path.startswith('/stats/'):
-                                    request_path = self.path[7:]
-                                else:
-                                    request_path = self.path[1:]
-                                self._show_link_stats(request_path[:request_path.rfind('+')])
-                                return
-                            except Exception, e:
-                                # Oopps. Something went wrong. Most likely
-                                # a malformed link
-                                # TODO raise a (yet to be written) FileNotFoundException
-                                self._logger.error(
-                                    u'An exception occurred: %s' % unicode(e), exc_info=True)
-                                self._send_404()
-                                return
-                        else:
-                            # Trying to understand for which link we shall print
-                            # out stats.
-                            splitted = self.path[1:].split('/')
-                            try:
-                                self._show_link_stats(splitted[1])
-                                return
-                            except IndexError:
-                                # Something went wrong. Most likely there was a
-                                # malformed URL for accessing the stats.
-                                self._send_404()
-                                return
-                # Any other page
-                else:
-                    # First check, whether we want to have a real redirect
-                    # or just an info
-                    request_path = self.path
-                    if self.path.startswith('/show/'):
-                        request_path = self.path[5:]
-                        show = True
-                    elif self.path.startswith('/s/'):
-                        request_path = self.path[2:]
-                        show = True
-                    else:
-                        show = False
-                    # Assuming, if there is anything else than an
-                    # alphanumeric character after the starting /, it's
-                    # not a valid hash at all
-                    if request_path[1:].isalnum():
-                        try:
-                            result = self._db.get_link_from_db(request_path[1:])
-                            blocked = self._db.is_hash_blocked(request_path[1:])
-                        except YuDatabaseError:
-                            self._send_database_problem()
-                            return
-                        if result and blocked == None:
-                            if show == True:
-                                template_filename = self._get_config_template('showpage')
-                                url = "/" + request_path[1:]
-                                new_url = '<p><a href="%(url)s">%(result)s</a></p>' % \
-                                          {'result': result, 'url': url}
-                                stats = self._db.get_statistics_for_hash(request_path[1:])
-                                text = read_template(
-                                            template_filename,
-                                            title=SERVER_NAME,
-                                            header=SERVER_NAME,
-                                            msg=new_url,
-                                            stat=stats,
-                                            statspage="/stats/" + request_path[1:])
-                            else:
-                                self._db.add_logentry_to_database(request_path[1:])
-                                self._send_301(result)
-                                return
-                        elif blocked:
-                            self._send_blocked_page(blocked[3])
-                            return
-                        else:
-                            self._send_404()
-                            return
-                    else:
-                        self._send_404()
-                        return
+            blocked = self._db.is_hash_blocked(tmp)
+            if blocked:
+                self._send_blocked_page(blocked[3])
+            elif tmp:
+                self._send_return_page(tmp)
+            else:
+                # There was a general issue with URL
+                self._send_homepage('''<p class="warning">Please check your input.</p>''')
+        except YuDatabaseError:
+            self._send_database_problem()
+
+    #----------------------------------------------------------------------
+    def _handle_homepage_request(self, argument):
+        self._send_homepage()
+
+    #----------------------------------------------------------------------
+    def _handle_general_stats_request(self, argument):
+        # Let's hope this page is not getting to popular ....
+        self._show_general_stats()
+
+    #----------------------------------------------------------------------
+    def _handle_link_stats_request(self, argument):
+        """
+        Show the statistics of a link, /stats/<hash> or /stats/<hash>+
+
+        | **param** argument (str) - path after /stats/
+        """
+        if argument.endswith('+'):
+            self._show_link_stats(argument[:-1])
+        else:
+            self._show_link_stats(argument.split('/')[0])
+
+    #----------------------------------------------------------------------
+    def _handle_show_request(self, shorthash):
+        """
+        Show the link behind a shorthash instead of redirecting to it,
+        /show/<hash> or /s/<hash>, or its statistics for <hash>+
+
+        | **param** shorthash (str) - path after /show/ or /s/
+        """
+        if shorthash.endswith('+'):
+            self._show_link_stats(shorthash[:-1])
+            return
+        resolved_link, stats = self._resolve_shorthash(shorthash, with_clicks=True)
+        if resolved_link is None:
+            return
+        template_filename = self._get_config_template('showpage')
+        url = "/" + shorthash
+        new_url = '<p><a href="%(url)s">%(result)s</a></p>' % \
+                  {'result': resolved_link.link, 'url': url}
+        text = read_template(
+                    template_filename,
+                    title=SERVER_NAME,
+                    header=SERVER_NAME,
+                    msg=new_url,
+                    stat=stats,
+                    statspage="/stats/" + shorthash)
         self._send_response(text, 200)
 
+    #----------------------------------------------------------------------
+    def _handle_redirect_request(self, shorthash):
+        """
+        Redirect to the link behind a shorthash or show its statistics
+        for <hash>+
+
+        | **param** shorthash (str) - path without the leading slash
+        """
+        if shorthash.endswith('+'):
+            self._show_link_stats(shorthash[:-1])
+            return
+        resolved_link, _ = self._resolve_shorthash(shorthash)
+        if resolved_link is not None:
+            self._log_redirect(resolved_link)
+            self._send_301(resolved_link.link)
+
+    #----------------------------------------------------------------------
+    def _resolve_shorthash(self, shorthash, with_clicks=False):
+        """
+        Resolve the shorthash or send the 404, blocked or database error
+        page if that's not possible
+
+        | **param** shorthash (str)
+        | **param** with_clicks (bool) - read also the number of redirects of the link
+        | **return** resolved_link, clicks (tuple(ResolvedLink, int)) - resolved_link is None
+                     if a response has been sent, clicks is None without with_clicks
+        """
+        # Assuming, if there is anything else than an alphanumeric
+        # character, it's not a valid hash at all
+        if not shorthash.isalnum():
+            self._send_404()
+            return None, None
+        clicks = None
+        try:
+            if with_clicks:
+                resolved_link, clicks = self._db.resolve_shorthash_with_clicks(shorthash) or (None, None)
+            else:
+                resolved_link = self._lookup_shorthash(shorthash)
+        except YuDatabaseError:
+            self._send_database_problem()
+            return None, None
+        if resolved_link is None or resolved_link.deleted:
+            self._send_404()
+            return None, None
+        elif resolved_link.blocked:
+            self._send_blocked_page(resolved_link.block_reason)
+            return None, None
+        return resolved_link, clicks
+
+    #----------------------------------------------------------------------
+    def _lookup_shorthash(self, shorthash):
+        return self._db.resolve_shorthash(shorthash)
+
     #----------------------------------------------------------------------
     def do_POST(self):
         """
         POST HTTP request entry point
         """
+        self._header_only = False
         self._try_to_process_request(self._handle_post_request)
 
     #----------------------------------------------------------------------
@@ -714,110 +945,123 @@ class YuRequestHandler(BaseHTTPRequestHandler):
                 fp=self.rfile,
                 headers=self.headers,
                 environ={'REQUEST_METHOD': 'POST'})
+        route, _ = YuRouter.get_router().route('POST', self.path)
+        self._route_name = route.name
+        getattr(self, route.handler)(form)
 
-        if self.path == '/URLRequest':
-            # First we check, whether the formular has been filled by
-            # something behaving like a bot
-            if form.has_key('URL'):
-                self._send_homepage('<p class="warning">Please check your input</p>')
-                return
-            else:
-                url = form['real_URL'].value if form.has_key('real_URL') else None
-                tmp = self._insert_url_to_db(url)
-                if tmp:
-                    try:
-                        blocked = self._db.is_hash_blocked(tmp)
-                        if tmp < 0:
-                            self._send_database_problem()
-                            return
-                        elif blocked:
-                            self._send_blocked_page(blocked[3])
-                            return
-                        else:
-                            self._send_return_page(tmp)
-                            return
-                    except YuDatabaseError:
-                        self._send_database_problem()
-                        return
+    #----------------------------------------------------------------------
+    def _handle_add_link_request(self, form):
+        """
+        Add the URL submitted with the form of the homepage
+
+        | **param** form (cgi.FieldStorage)
+        """
+        # First we check, whether the formular has been filled by
+        # something behaving like a bot
+        if form.has_key('URL'):
+            self._send_homepage('<p class="warning">Please check your input</p>')
+            return
+        url = form['real_URL'].value if form.has_key('real_URL') else None
+        tmp = self._insert_url_to_db(url)
+        if tmp:
+            try:
+                blocked = self._db.is_hash_blocked(tmp)
+                if tmp < 0:
+                    self._send_database_problem()
+                elif blocked:
+                    self._send_blocked_page(blocked[3])
                 else:
-                    # There was a general issue with URL
-                    self._send_homepage('''<p class="warning">Please check your input.</p>''')
-                    return
-        elif self.path == '/ContactUs':
-            if form.has_key('URL'):
-                # Here we might have a bot who likes to send the webmaster some spam
-                # who most likely will be not amused about.
-                template_filename = self._get_config_template('contactUsResult')
-                text = read_template(
-                    template_filename,
-                    title='',
-                    header='Mail NOT sent',
-                    msg='There was an issue with your request. Are you a bot? '
-                    '<a href="/ContactUs">Please try again</a>.')
-            else:
-                try:
-                    email = form['email'].value
-                    subj = form['subject'].value
-                    descr = form['request'].value
-                    if self._send_mail(subj, descr, email):
-                        template_filename = self._get_config_template('contactUsResult')
-                        text = read_template(
-                            template_filename,
-                            title='',
-                            header='Mail sent',
-                            msg="Your request has been sent. You will receive an answer soon.")
-                    else:
-                        self._send_internal_server_error()
-                        return
-                except KeyError:
-                    template_filename = self._get_config_template('contactUsResult')
+                    self._send_return_page(tmp)
+            except YuDatabaseError:
+                self._send_database_problem()
+        else:
+            # There was a general issue with URL
+            self._send_homepage('''<p class="warning">Please check your input.</p>''')
+
+    #----------------------------------------------------------------------
+    def _handle_contact_request(self, form):
+        """
+        Send the message of the contact form to the webmaster
+
+        | **param** form (cgi.FieldStorage)
+        """
+        template_filename = self._get_config_template('contactUsResult')
+        if form.has_key('URL'):
+            # Here we might have a bot who likes to send the webmaster some spam
+            # who most likely will be not amused about.
+            text = read_template(
+                template_filename,
+                title='',
+                header='Mail NOT sent',
+                msg='There was an issue with your request. Are you a bot? '
+                '<a href="/ContactUs">Please try again</a>.')
+        else:
+            try:
+                email = form['email'].value
+                subj = form['subject'].value
+                descr = form['request'].value
+                if self._send_mail(subj, descr, email):
                     text = read_template(
                         template_filename,
                         title='',
-                        header='Mail NOT sent',
-                        msg='It appers you did not fill out all needed fields.\
-                            <a href="/ContactUs">Please try again</a>.')
-
-        elif self.path == '/Show':
-            short_url = form['ShortURL'].value if form.has_key('ShortURL') else None
-            if short_url != None and short_url.find("yaturl.net") > -1:
-                tmp = short_url.rfind("/")
-                if tmp > -1 and short_url != "":
-                    tmp = tmp + 1
-                    short_url = short_url[tmp:]
-            if short_url != None and short_url.isalnum():
-                try:
-                    result = self._db.get_link_from_db(short_url)
-                except YuDatabaseError:
-                    self._send_database_problem()
-                    return
-                template_filename = self._get_config_template('showpage')
-                if result:
-                    new_url = '<p><a href="%(result)s">%(result)s</a></p>' % \
-                              {'result': result}
+                        header='Mail sent',
+                        msg="Your request has been sent. You will receive an answer soon.")
                 else:
-                    new_url = '<p class="warning">No URL found for this string. Please double check your\
-                                <a href="/ShowURL">input and try again</a></p>'
-
-                stats = self._db.get_statistics_for_hash(short_url)
-
+                    self._send_internal_server_error()
+                    return
+            except KeyError:
                 text = read_template(
                     template_filename,
-                    title=SERVER_NAME,
-                    header=SERVER_NAME,
-                    msg=new_url,
-                    stat=stats,
-                    statspage="/stats/" + short_url)
-            else:
-                self._send_404()
-                return
+                    title='',
+                    header='Mail NOT sent',
+                    msg='It appers you did not fill out all needed fields.\
+                        <a href="/ContactUs">Please try again</a>.')
+        self._send_response(text, 200)
 
-        else:
+    #----------------------------------------------------------------------
+    def _handle_show_form_request(self, form):
+        """
+        Show the link behind the short URL submitted with the form of
+        the ShowURL page
+
+        | **param** form (cgi.FieldStorage)
+        """
+        short_url = form['ShortURL'].value if form.has_key('ShortURL') else None
+        if short_url != None and short_url.find("yaturl.net") > -1:
+            tmp = short_url.rfind("/")
+            if tmp > -1 and short_url != "":
+                tmp = tmp + 1
+                short_url = short_url[tmp:]
+        if short_url == None or not short_url.isalnum():
             self._send_404()
             return
+        try:
+            resolved_link, stats = self._db.resolve_shorthash_with_clicks(short_url) or (None, 0)
+        except YuDatabaseError:
+            self._send_database_problem()
+            return
+        template_filename = self._get_config_template('showpage')
+        if resolved_link and not resolved_link.deleted:
+            result = resolved_link.link
+            new_url = '<p><a href="%(result)s">%(result)s</a></p>' % \
+                      {'result': result}
+        else:
+            new_url = '<p class="warning">No URL found for this string. Please double check your\
+                        <a href="/ShowURL">input and try again</a></p>'
 
+        text = read_template(
+            template_filename,
+            title=SERVER_NAME,
+            header=SERVER_NAME,
+            msg=new_url,
+            stat=stats,
+            statspage="/stats/" + short_url)
         self._send_response(text, 200)
 
+    #----------------------------------------------------------------------
+    def _handle_not_found_request(self, argument):
+        self._send_404()
+
     #----------------------------------------------------------------------
     def do_HEAD(self):
         """
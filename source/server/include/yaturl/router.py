@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+
+from threading import Lock
+
+
+########################################################################
+class YuRoute(object):
+    """
+    A route of the request handler, handler is the name of the request
+    handler method which is called with the remaining part of the path
+    (GET) or the parsed form (POST)
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        self.requests = 0
+
+
+########################################################################
+class YuRouter(object):
+    """
+    Route table built at startup, requests are dispatched by method and
+    path with dictionary lookups: first by the complete path, then by
+    the first path segment and then by query parameters, all other
+    paths go to the default route of the method (i.e. shorthashes).
+    """
+
+    router = None
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        # (method, path) => YuRoute
+        self._paths = dict()
+        # (method, first path segment incl. slashes) => YuRoute
+        self._prefixes = dict()
+        # method => list of (parameter, YuRoute)
+        self._parameters = dict()
+        # method => YuRoute
+        self._defaults = dict()
+        self._routes = list()
+        self._lock = Lock()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_router(cls):
+        router = cls()
+        router.add_parameter_route('GET', 'addurl', 'addurl', '_handle_addurl_request')
+        homepage = router.add_path_route('GET', '/', 'homepage', '_handle_homepage_request')
+        router.add_path_route('GET', '/URLRequest', homepage)
+        router.add_path_route('GET', '/stats', 'stats', '_handle_general_stats_request')
+        router.add_prefix_route('GET', '/stats/', 'link_stats', '_handle_link_stats_request')
+        show = router.add_prefix_route('GET', '/show/', 'show', '_handle_show_request')
+        router.add_prefix_route('GET', '/s/', show)
+        router.set_default_route('GET', 'redirect', '_handle_redirect_request')
+        router.add_path_route('POST', '/URLRequest', 'add_link', '_handle_add_link_request')
+        router.add_path_route('POST', '/ContactUs', 'contact', '_handle_contact_request')
+        router.add_path_route('POST', '/Show', 'show_form', '_handle_show_form_request')
+        router.set_default_route('POST', 'not_found', '_handle_not_found_request')
+        cls.router = router
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_router(cls):
+        return cls.router
+
+    #----------------------------------------------------------------------
+    def _get_route(self, name, handler):
+        if isinstance(name, YuRoute):
+            # another path for an existing route, counted together
+            return name
+        route = YuRoute(name, handler)
+        self._routes.append(route)
+        return route
+
+    #----------------------------------------------------------------------
+    def add_path_route(self, method, path, name, handler=None):
+        """
+        Add a route for exactly the given path, the query is ignored
+
+        | **param** method (str)
+        | **param** path (str)
+        | **param** name (str) - or an existing YuRoute to add another path for it
+        | **param** handler (str) - name of the request handler method
+        | **return** route (YuRoute)
+        """
+        route = self._get_route(name, handler)
+        self._paths[(method, path)] = route
+        return route
+
+    #----------------------------------------------------------------------
+    def add_prefix_route(self, method, prefix, name, handler=None):
+        """
+        Add a route for all paths starting with the given first path
+        segment, e.g. '/show/'
+
+        | **param** method (str)
+        | **param** prefix (str)
+        | **param** name (str) - or an existing YuRoute to add another prefix for it
+        | **param** handler (str) - name of the request handler method
+        | **return** route (YuRoute)
+        """
+        route = self._get_route(name, handler)
+        self._prefixes[(method, prefix)] = route
+        return route
+
+    #----------------------------------------------------------------------
+    def add_parameter_route(self, method, parameter, name, handler):
+        """
+        Add a route for all requests with the given query parameter,
+        regardless of the path. The parameter's value is passed to the
+        handler.
+
+        | **param** method (str)
+        | **param** parameter (str)
+        | **param** name (str)
+        | **param** handler (str) - name of the request handler method
+        | **return** route (YuRoute)
+        """
+        route = self._get_route(name, handler)
+        self._parameters.setdefault(method, list()).append((parameter, route))
+        return route
+
+    #----------------------------------------------------------------------
+    def set_default_route(self, method, name, handler):
+        """
+        Set the route for all paths not matched by another route, the
+        path without the leading slash is passed to the handler
+
+        | **param** method (str)
+        | **param** name (str)
+        | **param** handler (str) - name of the request handler method
+        | **return** route (YuRoute)
+        """
+        route = self._get_route(name, handler)
+        self._defaults[method] = route
+        return route
+
+    #----------------------------------------------------------------------
+    def match(self, method, path):
+        """
+        Find the route for the given request, without counting it
+
+        | **param** method (str)
+        | **param** path (str) - path including the query
+        | **return** route, argument (tuple(YuRoute, str))
+        """
+        path, _, query = path.partition('?')
+        if query and method in self._parameters:
+            parameters = dict(item.partition('=')[::2] for item in query.split('&'))
+            for parameter, route in self._parameters[method]:
+                if parameter in parameters:
+                    return route, parameters[parameter]
+        route = self._paths.get((method, path))
+        if route is not None:
+            return route, ''
+        prefix_end = path.find('/', 1) + 1
+        if prefix_end:
+            route = self._prefixes.get((method, path[:prefix_end]))
+            if route is not None:
+                return route, path[prefix_end:]
+        return self._defaults[method], path[1:]
+
+    #----------------------------------------------------------------------
+    def route(self, method, path):
+        """
+        Find and count the route for the given request
+
+        | **param** method (str)
+        | **param** path (str) - path including the query
+        | **return** route, argument (tuple(YuRoute, str))
+        """
+        route, argument = self.match(method, path)
+        with self._lock:
+            route.requests += 1
+        return route, argument
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number of requests of each route
+
+        | **return** statistics (seq of tuple(str name, int requests))
+        """
+        with self._lock:
+            return [(route.name, route.requests) for route in self._routes]
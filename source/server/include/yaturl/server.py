@@ -21,25 +21,93 @@
 
 
 from BaseHTTPServer import HTTPServer
-from SocketServer import ThreadingMixIn
-from socket import AF_INET, AF_INET6
+from collections import deque
+from fcntl import fcntl, F_GETFL, F_SETFL
+from socket import AF_INET, AF_INET6, IPPROTO_TCP, error as SocketError
+from struct import Struct, error as StructError
+from time import time
 from yaturl import config
 from yaturl.requesthandler import YuRequestHandler
 from yaturl.helpers.logger import get_logger
+from yaturl.helpers.poller import YuPoller
+from yaturl.workerpool import YuWorkerPool
+import errno
+import os
+import select
+import socket
+
+
+# sent to clients if all workers are busy and the queue is full
+RESPONSE_503 = 'HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+# maximum number of connections accepted per wake up
+ACCEPT_BATCH_SIZE = 64
+# errors of accept() which just mean there is nothing to accept
+ACCEPT_RETRY_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR, errno.ECONNABORTED)
+# struct tcp_info up to tcpi_sacked, for a listening socket Linux reports the
+# length of the accept queue in tcpi_unacked and the backlog in tcpi_sacked
+TCP_INFO_LISTEN_QUEUE = Struct('=24xII')
+
+
+#----------------------------------------------------------------------
+def _read_listen_overflows():
+    """
+    Return the kernel's ListenOverflows and ListenDrops counters, they are
+    system-wide since boot
+
+    | **return** counters (dict{str name: int value})
+    """
+    try:
+        file_h = open('/proc/net/netstat')
+        lines = file_h.read().strip().split('\n')
+        file_h.close()
+    except IOError:
+        return None
+    # pairs of lines with the counter names and their values
+    for names, values in zip(lines[::2], lines[1::2]):
+        if names.startswith('TcpExt:') and values.startswith('TcpExt:'):
+            counters = dict(zip(names.split()[1:], values.split()[1:]))
+            try:
+                return dict(
+                    overflows=int(counters['ListenOverflows']),
+                    drops=int(counters['ListenDrops']))
+            except (KeyError, ValueError):
+                return None
+    return None
 
 
 ########################################################################
-class YuServer(ThreadingMixIn, HTTPServer):
+class YuIdleConnection(object):
     """
-    Simple, threaded HTTP server
+    Client connection waiting in the accept loop for its next request
     """
 
+    #----------------------------------------------------------------------
+    def __init__(self, request, client_address, handled_requests):
+        self.request = request
+        self.client_address = client_address
+        self.handled_requests = handled_requests
+        self.since = time()
+
+
+########################################################################
+class YuServer(HTTPServer):
+    """
+    Simple HTTP server, requests are processed by a fixed pool of worker threads.
+    A worker only gets a connection once the client has sent data, idle
+    persistent connections wait in the accept loop for their next
+    request, so they don't occupy a worker.
+    """
+
+    http_server = None
+
     #----------------------------------------------------------------------
     def __init__(self, shutdown_event):
         host = config.get('http', 'host')
         port = config.getint('http', 'port')
 
         self._set_address_family(host)
+        # listen backlog, used by HTTPServer.__init__()
+        self.request_queue_size = config.getint('http', 'listen_backlog')
         HTTPServer.__init__(self, (host, port), YuRequestHandler)
 
         if config.has_option('http', 'hostname'):
@@ -53,10 +121,33 @@ class YuServer(ThreadingMixIn, HTTPServer):
 
         # store important information here to be able to access it in the request handler
         self.hostname = hostname
-        self.resolve_clients = config.getboolean('http', 'resolve_clients')
+        self.keep_alive_timeout = config.getint('http', 'keep_alive_timeout')
+        self.keep_alive_max_requests = config.getint('http', 'keep_alive_max_requests')
+        self.request_timeout = config.getint('http', 'request_timeout')
         self.log_ip_activated = config.getboolean('main', 'log_ip_activated')
         self._shutdown = shutdown_event
         self._logger = get_logger()
+        # created in serve_forever() to not share them between forked processes
+        self._poller = None
+        self._wakeup_read = None
+        self._wakeup_write = None
+        # fd => YuIdleConnection
+        self._idle_connections = dict()
+        # connections handed back by the workers, added to the poller by the loop
+        self._returned_connections = deque()
+        self._worker_pool = YuWorkerPool(
+            u'HTTP Worker',
+            config.getint('http', 'worker_threads'),
+            config.getint('http', 'worker_queue_size'),
+            config.getint('http', 'worker_stack_size') * 1024)
+        # to report only the overflows since the server has been started
+        self._listen_overflows_at_start = _read_listen_overflows()
+        YuServer.http_server = self
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_http_server(cls):
+        return cls.http_server
 
     #----------------------------------------------------------------------
     def _set_address_family(self, host):
@@ -66,14 +157,179 @@ class YuServer(ThreadingMixIn, HTTPServer):
         else:
             self.address_family = AF_INET
 
+    #----------------------------------------------------------------------
+    def process_request(self, request, client_address):
+        """
+        Wait in the accept loop until the client sends its request
+        """
+        self._add_idle_connection(YuIdleConnection(request, client_address, 0))
+
+    #----------------------------------------------------------------------
+    def _add_idle_connection(self, idle_connection):
+        fd = idle_connection.request.fileno()
+        self._idle_connections[fd] = idle_connection
+        self._poller.register(fd, select.POLLIN)
+
+    #----------------------------------------------------------------------
+    def _resume_connection(self, fd, event):
+        """
+        Hand the connection over to the worker pool as the client has sent
+        data or, if the pool is overloaded, answer with a 503 right away
+        """
+        idle_connection = self._idle_connections.pop(fd)
+        self._poller.unregister(fd)
+        request = idle_connection.request
+        if not event & select.POLLIN:
+            # POLLHUP or POLLERR
+            self.shutdown_request(request)
+        elif not self._worker_pool.submit(
+                self._process_request_in_worker,
+                request,
+                idle_connection.client_address,
+                idle_connection.handled_requests):
+            try:
+                request.sendall(RESPONSE_503)
+            except SocketError:
+                pass
+            self.shutdown_request(request)
+
+    #----------------------------------------------------------------------
+    def finish_request(self, request, client_address, handled_requests=0):
+        return self.RequestHandlerClass(request, client_address, self, handled_requests)
+
+    #----------------------------------------------------------------------
+    def _process_request_in_worker(self, request, client_address, handled_requests=0):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address, handled_requests)
+        except Exception:
+            self.handle_error(request, client_address)
+        if handler is not None and not handler.close_connection:
+            # wait in the accept loop for the next request
+            self._returned_connections.append(
+                YuIdleConnection(request, client_address, handler.handled_requests))
+            self._wakeup()
+        else:
+            self.shutdown_request(request)
+
     #----------------------------------------------------------------------
     def serve_forever(self):
         self._logger.info(u'HTTP Server started')
-        self.socket.settimeout(0.5)
+        self._worker_pool.start()
+        self._setup_poller()
+        next_idle_check = 0
         while not self._shutdown.isSet():
-            self.handle_request()
+            # sleep until a client connects or sends a request or shutdown()
+            # wakes us up, with idle connections check their timeout
+            timeout = 1 if self._idle_connections else None
+            for fd, event in self._poller.poll(timeout):
+                if fd == self.socket.fileno():
+                    self._accept_requests()
+                elif fd == self._wakeup_read:
+                    self._clear_wakeup_pipe()
+                    self._add_returned_connections()
+                elif fd in self._idle_connections:
+                    self._resume_connection(fd, event)
+            now = time()
+            if now >= next_idle_check:
+                self._close_idle_connections(now - self.keep_alive_timeout)
+                next_idle_check = now + 1
+        self._poller.unregister(self.socket.fileno())
+        # finish requests already accepted
+        self._worker_pool.shutdown()
+        self._add_returned_connections()
+        self._close_idle_connections(None)
+        self._close_wakeup_pipe()
+
+    #----------------------------------------------------------------------
+    def _add_returned_connections(self):
+        while self._returned_connections:
+            self._add_idle_connection(self._returned_connections.popleft())
+
+    #----------------------------------------------------------------------
+    def _close_idle_connections(self, idle_since):
+        """
+        Close the connections idle since before idle_since, all if it is None
+        """
+        for fd, idle_connection in self._idle_connections.items():
+            if idle_since is None or idle_connection.since < idle_since:
+                del self._idle_connections[fd]
+                self._poller.unregister(fd)
+                self.shutdown_request(idle_connection.request)
+
+    #----------------------------------------------------------------------
+    def _setup_poller(self):
+        self._poller = YuPoller()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        for fd in (self._wakeup_read, self._wakeup_write):
+            fcntl(fd, F_SETFL, fcntl(fd, F_GETFL) | os.O_NONBLOCK)
+        self.socket.setblocking(0)
+        self._poller.register(self.socket.fileno(), select.POLLIN)
+        self._poller.register(self._wakeup_read, select.POLLIN)
+
+    #----------------------------------------------------------------------
+    def _accept_requests(self):
+        for _ in xrange(ACCEPT_BATCH_SIZE):
+            try:
+                request, client_address = self.get_request()
+            except SocketError, e:
+                if e.args[0] not in ACCEPT_RETRY_ERRORS:
+                    self._logger.warn(u'Accepting a connection failed: %s' % e)
+                    # e.g. out of file descriptors, don't spin on it
+                    self._shutdown.wait(0.1)
+                return
+            if self.verify_request(request, client_address):
+                self.process_request(request, client_address)
+            else:
+                self.shutdown_request(request)
+
+    #----------------------------------------------------------------------
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_write, '.')
+        except (OSError, TypeError):
+            # the pipe is full or not yet created, the loop wakes up anyway
+            pass
+
+    #----------------------------------------------------------------------
+    def _clear_wakeup_pipe(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except OSError:
+            pass
+
+    #----------------------------------------------------------------------
+    def _close_wakeup_pipe(self):
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+        self._wakeup_read = self._wakeup_write = None
+
+    #----------------------------------------------------------------------
+    def get_listen_queue(self):
+        """
+        Return the current length of the accept queue of the listening socket
+        and its backlog, if the platform reports them, and the system-wide
+        listen overflows and drops since the server has been started
+
+        | **return** statistics (dict{str name: int value})
+        """
+        statistics = dict(queued=None, backlog=None, overflows=None, drops=None)
+        tcp_info = getattr(socket, 'TCP_INFO', None)
+        if tcp_info is not None:
+            try:
+                info = self.socket.getsockopt(IPPROTO_TCP, tcp_info, TCP_INFO_LISTEN_QUEUE.size)
+                statistics['queued'], statistics['backlog'] = TCP_INFO_LISTEN_QUEUE.unpack(info)
+            except (SocketError, StructError):
+                pass
+        overflows = _read_listen_overflows()
+        if overflows and self._listen_overflows_at_start:
+            for name in ('overflows', 'drops'):
+                statistics[name] = overflows[name] - self._listen_overflows_at_start[name]
+        return statistics
 
     #----------------------------------------------------------------------
     def shutdown(self):
         self._logger.debug(u'HTTP Server stopping')
         self._shutdown.set()
+        self._wakeup()
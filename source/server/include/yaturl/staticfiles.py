@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from collections import namedtuple
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from hashlib import md5
+from threading import Lock
+from time import time
+from yaturl import config
+from yaturl.constants import CONTENT_TYPES
+from yaturl.helpers.compression import COMPRESSIBLE_TYPES, YuCompressor
+from yaturl.helpers.logger import get_logger
+import os
+
+
+# a file of the static document root, held in memory, variants maps
+# content codings to the compressed content and its ETag; files larger
+# than max_cached_size have no content but an open file to be sent with
+# sendfile()
+StaticFile = namedtuple(
+    'StaticFile', 'content content_type etag last_modified mtime size variants file')
+# bytes read at once to compute the ETag of large files
+DIGEST_CHUNK_SIZE = 65536
+
+
+########################################################################
+class YuStaticFileCache(object):
+    """
+    All files below the static document root, loaded into memory. Files
+    larger than max_cached_size are kept open instead. The document root
+    is checked for added, changed and removed files at most every
+    check_interval seconds.
+    """
+
+    static_file_cache = None
+
+    #----------------------------------------------------------------------
+    def __init__(self, docroot, check_interval, max_cached_size):
+        self._docroot = docroot
+        self._check_interval = check_interval
+        self._max_cached_size = max_cached_size
+        self._lock = Lock()
+        self._logger = get_logger()
+        # relative path => StaticFile
+        self._files = dict()
+        self._next_check = time() + check_interval
+        self._loads = 0
+        self._not_modified = 0
+        self.refresh()
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def init_static_file_cache(cls):
+        docroot = config.get('main', 'staticdocumentroot')
+        check_interval = config.getint('static', 'check_interval')
+        max_cached_size = config.getint('static', 'max_cached_size')
+        cls.static_file_cache = cls(docroot, check_interval, max_cached_size)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_static_file_cache(cls):
+        return cls.static_file_cache
+
+    #----------------------------------------------------------------------
+    def refresh(self):
+        """
+        Load new and changed files of the document root and forget
+        removed ones
+        """
+        files = dict()
+        for dirpath, _, filenames in os.walk(self._docroot):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                relative_path = os.path.relpath(path, self._docroot)
+                static_file = self._files.get(relative_path)
+                if static_file is None or \
+                   (static_file.mtime, static_file.size) != (stat.st_mtime, stat.st_size):
+                    static_file = self._load(path, stat)
+                if static_file is not None:
+                    files[relative_path] = static_file
+        self._files = files
+
+    #----------------------------------------------------------------------
+    def _load(self, path, stat):
+        if stat.st_size > self._max_cached_size:
+            return self._open(path, stat)
+        try:
+            file_h = open(path, 'rb')
+            try:
+                content = file_h.read()
+            finally:
+                file_h.close()
+        except IOError, e:
+            self._logger.warn(u'Static file "%s" could not be read: %s' % (path, e))
+            return None
+        self._loads += 1
+        extension = os.path.splitext(path)[1]
+        content_type = CONTENT_TYPES.get(extension, 'text/html')
+        digest = md5(content).hexdigest()
+        variants = dict()
+        compressor = YuCompressor.get_compressor()
+        if compressor and content_type in COMPRESSIBLE_TYPES:
+            for encoding, compressed in compressor.precompress(content).variants.iteritems():
+                # each representation needs its own strong ETag
+                variants[encoding] = (compressed, '"%s-%s"' % (digest, encoding))
+        return StaticFile(
+            content=content,
+            content_type=content_type,
+            etag='"%s"' % digest,
+            last_modified=formatdate(stat.st_mtime, usegmt=True),
+            mtime=stat.st_mtime,
+            size=len(content),
+            variants=variants,
+            file=None)
+
+    #----------------------------------------------------------------------
+    def _open(self, path, stat):
+        """
+        Open a large file to be sent with sendfile(), the file is closed
+        when the last reference to the returned StaticFile is gone, so
+        responses still being sent are not affected by a reload
+        """
+        file_h = None
+        try:
+            file_h = open(path, 'rb')
+            digest = md5()
+            data = file_h.read(DIGEST_CHUNK_SIZE)
+            while data:
+                digest.update(data)
+                data = file_h.read(DIGEST_CHUNK_SIZE)
+        except IOError, e:
+            if file_h is not None:
+                file_h.close()
+            self._logger.warn(u'Static file "%s" could not be read: %s' % (path, e))
+            return None
+        self._loads += 1
+        extension = os.path.splitext(path)[1]
+        return StaticFile(
+            content=None,
+            content_type=CONTENT_TYPES.get(extension, 'text/html'),
+            etag='"%s"' % digest.hexdigest(),
+            last_modified=formatdate(stat.st_mtime, usegmt=True),
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            variants=dict(),
+            file=file_h)
+
+    #----------------------------------------------------------------------
+    def get(self, path):
+        """
+        Return the file for the given path, relative to the document root
+
+        | **param** path (str) - sanitized path, see sanitize_path()
+        | **return** static_file (StaticFile) or None if there is no such file
+        """
+        now = time()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self.refresh()
+                    self._next_check = now + self._check_interval
+        return self._files.get(path)
+
+    #----------------------------------------------------------------------
+    def is_not_modified(self, etag, mtime, headers):
+        """
+        Check whether the client already has the current version of the
+        file according to the If-None-Match or If-Modified-Since header
+
+        | **param** etag (str) - ETag of the representation to be sent
+        | **param** mtime (float) - modification time of the file
+        | **param** headers (mimetools.Message) - request headers
+        | **return** not_modified (bool)
+        """
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = [candidate.strip() for candidate in if_none_match.split(',')]
+            not_modified = etag in etags or '*' in etags
+        else:
+            if_modified_since = headers.get('If-Modified-Since')
+            parsed = parsedate_tz(if_modified_since) if if_modified_since else None
+            not_modified = parsed is not None and int(mtime) <= mktime_tz(parsed)
+        if not_modified:
+            self._not_modified += 1
+        return not_modified
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number and size of the cached files, the size only
+        includes the files held in memory
+
+        | **return** statistics (dict{str name: int value})
+        """
+        files = self._files.values()
+        return dict(
+            files=len(files),
+            open_files=len([static_file for static_file in files if static_file.file]),
+            size=sum(static_file.size for static_file in files if not static_file.file),
+            loads=self._loads,
+            not_modified=self._not_modified)
@@ -19,7 +19,12 @@
 #       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #       MA 02110-1301, USA.
 
+from yaturl import config
 from yaturl.database.database import YuDatabase
+from yaturl.database.error import YuDatabaseError
+from yaturl.helpers.logger import get_logger
+from yaturl.helpers.timerange import get_standard_time_ranges
+from threading import Lock, Thread
 from time import time
 
 
@@ -27,7 +32,15 @@ from time import time
 class YuStats(object):
     """
     A class to represent some statistic data for yaturl
+
+    One instance is shared by all requests, see get_current_stats().
     """
+
+    _current_stats = None
+    _refreshing = False
+    _state_lock = Lock()
+    _initial_lock = Lock()
+
     def __init__(self):
         self.create_time_stamp = None
         self.links_today = None
@@ -52,109 +65,80 @@ class YuStats(object):
         Updates the values of the stats object.
         """
         self.create_time_stamp = time()
-        self.links_today = self._get_links_from_db_today()
-        self.links_this_week = self._get_links_from_db_this_week()
-        self.links_this_month = self._get_links_from_db_this_month()
-        self.links_this_year = self._get_links_from_db_this_year()
-        self.links_all = self._get_links_from_db_all()
-        self.redirect_today = self._get_redirects_today()
-        self.redirect_this_week = self._get_redirects_this_week()
-        self.redirect_this_month = self._get_redirects_this_month()
-        self.redirect_this_year = self._get_redirects_this_year()
+        time_ranges = get_standard_time_ranges()
+        links = self._get_statistics_for_ranges('links', time_ranges)
+        self.links_today = links.get('today')
+        self.links_this_week = links.get('this_week')
+        self.links_this_month = links.get('this_month')
+        self.links_this_year = links.get('this_year')
+        self.links_all = links.get('all')
+        redirects = self._get_statistics_for_ranges('redirects', time_ranges)
+        self.redirect_today = redirects.get('today')
+        self.redirect_this_week = redirects.get('this_week')
+        self.redirect_this_month = redirects.get('this_month')
+        self.redirect_this_year = redirects.get('this_year')
         # self.redirect_per_week = self._get_redirects_per_week()
-        self.redirect_all = self._get_redirects_all()
+        self.redirect_all = redirects.get('all')
         self.date_of_first_redirect = self._get_date_of_first_redirect()
         self.date_of_first_link = self._get_date_of_first_link_entry()
+        # don't keep the connection while the stats are just being read
+        self._db.close()
 
     #-------------------------------------------------------------------
-    def _get_links_from_db_today(self):
-        """
-        Collecting statistics about links added today from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_links('today')[1]
-        except TypeError:
-            return None
-
-    #-------------------------------------------------------------------
-    def _get_links_from_db_this_week(self):
-        """
-        Collecting statistics about links added this week from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_links('this_week')[0]
-        except TypeError:
-            return None
-
-    #-------------------------------------------------------------------
-    def _get_links_from_db_this_month(self):
+    @classmethod
+    def get_current_stats(cls):
         """
-        Collecting statistics about links added this month from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_links('this_month')[0]
-        except TypeError:
-            return None
+        Return the last computed stats shared by all requests. If they are
+        older than the configured refresh interval, a refresh is started
+        in the background, the caller still gets the old stats right away.
+        Only the very first call waits for the stats to be computed.
 
-    #-------------------------------------------------------------------
-    def _get_links_from_db_this_year(self):
-        """
-        Collecting statistics about links added this year from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_links('this_year')[0]
-        except TypeError:
-            return None
-
-    #-------------------------------------------------------------------
-    def _get_links_from_db_all(self):
-        """
-        Collecting statistics about links added all time from database.
+        | **return** stats (YuStats)
         """
-        try:
-            return self._db.get_statistics_for_general_links('all')[0]
-        except TypeError:
-            return None
+        stats = cls._current_stats
+        if stats is None:
+            with cls._initial_lock:
+                if cls._current_stats is None:
+                    cls._current_stats = cls()
+                return cls._current_stats
 
-    #-------------------------------------------------------------------
-    def _get_redirects_today(self):
-        """
-        Collecting statistics about done redirects of today from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_redirects('today')[1]
-        except TypeError:
-            return None
+        refresh_interval = config.getint('stats', 'refresh_interval')
+        if time() - stats.create_time_stamp > refresh_interval:
+            cls._start_background_refresh()
+        return stats
 
     #-------------------------------------------------------------------
-    def _get_redirects_this_week(self):
-        """
-        Collecting statistics about done redirects of this week from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_redirects('this_week')[0]
-        except TypeError:
-            return None
+    @classmethod
+    def _start_background_refresh(cls):
+        with cls._state_lock:
+            if cls._refreshing:
+                return
+            cls._refreshing = True
+        thread = Thread(target=cls._refresh, name=u'Statistics Refresh')
+        thread.setDaemon(True)
+        thread.start()
 
     #-------------------------------------------------------------------
-    def _get_redirects_this_month(self):
-        """
-        Collecting statistics about done redirects of this month from database.
-        """
+    @classmethod
+    def _refresh(cls):
         try:
-            return self._db.get_statistics_for_general_redirects('this_month')[0]
-        except TypeError:
-            return None
+            cls._current_stats = cls()
+        except Exception, e:
+            get_logger().error(u'Statistics could not be refreshed: %s' % e, exc_info=True)
+        finally:
+            with cls._state_lock:
+                cls._refreshing = False
 
     #-------------------------------------------------------------------
-    def _get_redirects_this_year(self):
+    def _get_statistics_for_ranges(self, counter, time_ranges):
         """
-        Collecting statistics about done redirects of this year from database.
+        Collecting statistics about added links or done redirects inside
+        the given time ranges from database.
         """
         try:
-            return self._db.get_statistics_for_general_redirects('this_year')[0]
-        except TypeError:
-            return None
+            return self._db.get_statistics_for_ranges(counter, time_ranges)
+        except YuDatabaseError:
+            return dict()
 
     #-------------------------------------------------------------------
     def _get_redirects_per_week(self):
@@ -163,18 +147,8 @@ class YuStats(object):
         from database.
         """
         try:
-            return self._db.get_statistics_for_general_redirects('per_week')
-        except TypeError:
-            return None
-
-    #-------------------------------------------------------------------
-    def _get_redirects_all(self):
-        """
-        Collecting statistics about done redirects ever from database.
-        """
-        try:
-            return self._db.get_statistics_for_general_redirects('all')[0]
-        except TypeError:
+            return self._db.get_statistics_per_period('redirects', 'per_week')
+        except YuDatabaseError:
             return None
 
     #-------------------------------------------------------------------
@@ -219,9 +193,12 @@ class YuLinkStats(object):
                 else:
                     self.creation_time = 'Unknown'
                 self.link_address = link_details[3]
-                self.first_redirect = self._db.get_date_of_first_entry('hashredirect', shorthash)[0]
-                self.last_redirect = self._db.get_date_of_last_entry('hashredirect', shorthash)[0]
-                self.number_of_redirects = self._db.get_statistics_for_hash(shorthash)
+                if link_details[6] is not None:
+                    redirect_stats = link_details[6:9]
+                else:
+                    # no counter yet, e.g. link_counter has not been backfilled
+                    redirect_stats = self._db.get_redirect_statistics_for_link(link_details[0])
+                self.number_of_redirects, self.first_redirect, self.last_redirect = redirect_stats
                 return
         self.link_address = None
         self.creation_time = None
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Author:  Enrico Tröger
+#          Frank Lanitz <frank@frank.uvena.de>
+# License: GPL v2 or later
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+
+from Queue import Queue, Full
+from threading import Lock, Thread, stack_size
+from yaturl.helpers.logger import get_logger
+
+
+########################################################################
+class YuWorkerPool(object):
+    """
+    Fixed number of worker threads processing tasks from a bounded queue.
+    Tasks are rejected instead of queued if the queue is full.
+    """
+
+    worker_pools = list()
+
+    #----------------------------------------------------------------------
+    def __init__(self, name, num_workers, queue_size, thread_stack_size=0):
+        self._name = name
+        self._num_workers = num_workers
+        self._queue_size = queue_size
+        self._thread_stack_size = thread_stack_size
+        self._queue = Queue(queue_size)
+        self._workers = list()
+        self._lock = Lock()
+        self._logger = get_logger()
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def get_worker_pools(cls):
+        return list(cls.worker_pools)
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """
+        Start the worker threads
+        """
+        previous_stack_size = stack_size(self._thread_stack_size)
+        try:
+            for number in xrange(self._num_workers):
+                worker = Thread(target=self._work, name=u'%s %d' % (self._name, number + 1))
+                worker.setDaemon(True)
+                worker.start()
+                self._workers.append(worker)
+        finally:
+            stack_size(previous_stack_size)
+        self.worker_pools.append(self)
+
+    #----------------------------------------------------------------------
+    def submit(self, function, *args):
+        """
+        Queue the function to be called with the given arguments by one of
+        the workers.
+
+        | **param** function (callable)
+        | **param** args (seq of mixed)
+        | **return** queued (bool) - False if the queue is full
+        """
+        try:
+            self._queue.put_nowait((function, args))
+            return True
+        except Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+
+    #----------------------------------------------------------------------
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            function, args = task
+            with self._lock:
+                self._active += 1
+            try:
+                function(*args)
+            except Exception, e:
+                self._logger.error(u'An unhandled error occurred: %s' % e, exc_info=True)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+    #----------------------------------------------------------------------
+    def shutdown(self):
+        """
+        Stop the workers after they processed all queued tasks
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = list()
+        if self in self.worker_pools:
+            self.worker_pools.remove(self)
+
+    #----------------------------------------------------------------------
+    def get_statistics(self):
+        """
+        Return the number of active, idle and queued workers/tasks
+
+        | **return** statistics (dict{str name: mixed value})
+        """
+        with self._lock:
+            return dict(
+                name=self._name,
+                workers=self._num_workers,
+                active=self._active,
+                idle=self._num_workers - self._active,
+                queued=self._queue.qsize(),
+                queue_size=self._queue_size,
+                completed=self._completed,
+                rejected=self._rejected)